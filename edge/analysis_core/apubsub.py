@@ -0,0 +1,332 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import paho.mqtt.client as mqtt
+import settings
+import pipeline
+import pubsub
+import metrics
+import shedding
+from dbmodel import db  # Import Database instance
+
+# Configure Logging
+logging.basicConfig(
+    level=settings.LOG_LEVEL,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Load Settings
+BATCH_SIZE = max(1, settings.BATCH_SIZE)
+BATCH_FLUSH_INTERVAL = settings.BATCH_FLUSH_MS / 1000  # Convert ms to seconds
+BATCH_QUEUE_SIZE = settings.BATCH_QUEUE_SIZE
+ASYNC_MODEL_WORKERS = max(1, settings.ASYNC_MODEL_WORKERS)
+
+# CPU-bound model stages, the (possibly blocking) hand-over to the DB write buffer and the cloud sync run off the event loop.
+# A single model worker keeps the batches (and each sensor's windows) in arrival order.
+model_executor = ThreadPoolExecutor(max_workers=ASYNC_MODEL_WORKERS, thread_name_prefix="apubsub-model")
+sync_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="apubsub-sync")
+
+# Bounded per-device queues between ingest and the batch consumer (only used on the event loop)
+buffers = shedding.DeviceBuffers()
+BLOCKING = buffers.policy == "block"  # Pause reading instead of shedding when the queues are full
+
+# Event loop state, created by `serve` on the loop thread
+loop = None
+loop_thread = None
+windows_ready = None  # Set when windows are queued
+queue_space = None  # Set while the queues are below BATCH_QUEUE_SIZE (block policy)
+stop_event = None
+stopping = False  # The batch consumer drains the queues and exits
+
+class AsyncMQTT:
+    """
+    Drives a paho client from the asyncio event loop through its socket callbacks,
+    without a network thread. Connects and reconnects with backoff in a background task.
+    """
+
+    def __init__(self, client, broker, port):
+        self.client = client
+        self.broker = broker
+        self.port = port
+        self.name = client._client_id.decode()
+        self.fd = None
+        self.paused = False
+        self.connecting = False
+        self.stopping = False
+        self.misc_task = None
+
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+        client.on_disconnect = self.on_disconnect
+
+    def call_in_loop(self, callback, *args):
+        # Connects and publishes also run on executor threads
+        if threading.current_thread() is loop_thread:
+            callback(*args)
+        else:
+            loop.call_soon_threadsafe(callback, *args)
+
+    def on_socket_open(self, client, userdata, sock):
+        self.call_in_loop(self.watch, sock.fileno())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.call_in_loop(self.unwatch, self.fd)
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.call_in_loop(self.watch_write, self.fd)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.call_in_loop(self.unwatch_write, self.fd)
+
+    def watch(self, fd):
+        self.fd = fd
+        if not self.paused:
+            loop.add_reader(fd, self.client.loop_read)
+        if self.client.want_write():
+            loop.add_writer(fd, self.client.loop_write)
+        if self.misc_task is None or self.misc_task.done():
+            self.misc_task = loop.create_task(self.misc_loop())
+
+    def unwatch(self, fd):
+        if fd is None:
+            return
+        loop.remove_reader(fd)
+        loop.remove_writer(fd)
+        if self.fd == fd:
+            self.fd = None
+
+    def watch_write(self, fd):
+        if fd is not None:
+            loop.add_writer(fd, self.client.loop_write)
+
+    def unwatch_write(self, fd):
+        if fd is not None:
+            loop.remove_writer(fd)
+
+    async def misc_loop(self):
+        # Keepalive pings and timeouts
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    def pause_reading(self):
+        """Stop reading from the socket, so the broker and TCP hold the messages back."""
+        if not self.paused:
+            self.paused = True
+            if self.fd is not None:
+                loop.remove_reader(self.fd)
+
+    def resume_reading(self):
+        if self.paused:
+            self.paused = False
+            if self.fd is not None:
+                loop.add_reader(self.fd, self.client.loop_read)
+
+    # 🔄 Handles disconnection and reconnection attempts without blocking the loop
+    def on_disconnect(self, client, userdata, rc):
+        if rc != 0 and not self.stopping:
+            logging.warning(f"⚠️ [DISCONNECTED] {self.name} - Attempting to reconnect...")
+            self.call_in_loop(self.start)
+
+    def start(self):
+        if not self.connecting:
+            loop.create_task(self.connect())
+
+    async def connect(self):
+        """Connect with backoff. The blocking connect runs on an executor thread."""
+        self.connecting = True
+        attempt = 1
+        try:
+            while not self.stopping:
+                try:
+                    logging.info(f"🔌 [CONNECTING] {self.name} to {self.broker}:{self.port}...")
+                    await loop.run_in_executor(None, self.client.connect, self.broker, self.port, 60)
+                    logging.info(f"✅ [CONNECTED] {self.name} to {self.broker}:{self.port}")
+                    return
+                except Exception as e:
+                    wait_time = min(5 * attempt, 60)  # Increase wait time up to 60s
+                    logging.error(f"❌ [ERROR] Connection failed (Attempt {attempt}): {e}. Retrying in {wait_time}s...")
+                    await asyncio.sleep(wait_time)
+                    attempt += 1
+        finally:
+            self.connecting = False
+
+    def stop(self):
+        self.stopping = True
+        self.client.disconnect()
+        if self.misc_task is not None:
+            self.misc_task.cancel()
+
+# Initialize MQTT clients (same ids as the threaded module, which stays disconnected)
+client_subscriber = mqtt.Client(f"{settings.CLIENT_ID}_Subscriber{pubsub.CLIENT_SUFFIX}")
+client_publisher = mqtt.Client(f"{settings.CLIENT_ID}_Publisher{pubsub.CLIENT_SUFFIX}")
+client_subscriber.on_connect = pubsub.on_connect_subscriber
+client_publisher.on_connect = pubsub.on_connect_publisher
+subscriber = AsyncMQTT(client_subscriber, settings.SENSOR_MQTT_BROKER, settings.SENSOR_MQTT_PORT)
+publisher = AsyncMQTT(client_publisher, settings.CLOUD_MQTT_BROKER, settings.CLOUD_MQTT_PORT)
+
+# 📩 Subscriber: On Message (runs on the event loop)
+def ingest(topic, payload):
+    try:
+        window = pubsub.decode_message(topic, payload)
+    except Exception as e:
+        logging.error(f"❌ [ERROR] Failed to process incoming message: {e}", exc_info=True)
+        return
+    if window is None:
+        return
+
+    buffers.put(window)
+    windows_ready.set()
+    if BLOCKING and buffers.full():
+        # Backpressure: stop reading until the batch consumer catches up
+        queue_space.clear()
+        subscriber.pause_reading()
+
+def on_message(client, userdata, message):
+    ingest(message.topic, message.payload)
+
+client_subscriber.on_message = on_message
+
+async def ingest_from_inbox(topic, payload):
+    await queue_space.wait()
+    ingest(topic, payload)
+
+def consume(inbox):
+    """Feed messages dispatched by the supervisor (device sharding) into the loop."""
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        asyncio.run_coroutine_threadsafe(ingest_from_inbox(*item), loop).result()
+
+async def collect_batch():
+    """
+    Wait for the first window, then keep draining until BATCH_SIZE windows
+    are collected or BATCH_FLUSH_MS has passed. Devices are served in turn.
+    Returns (batch, stop_requested).
+    """
+    while not len(buffers):
+        if stopping:
+            return [], True
+        windows_ready.clear()
+        await windows_ready.wait()
+
+    batch = [buffers.get()]
+    deadline = loop.time() + BATCH_FLUSH_INTERVAL
+    while len(batch) < BATCH_SIZE:
+        window = buffers.get()
+        if window is not None:
+            batch.append(window)
+            continue
+        remaining = deadline - loop.time()
+        if remaining <= 0 or stopping:
+            break
+        windows_ready.clear()
+        try:
+            await asyncio.wait_for(windows_ready.wait(), remaining)
+        except asyncio.TimeoutError:
+            break
+    return batch, stopping and not len(buffers)
+
+async def process_batches():
+    """
+    Run the model stages and store the documents on the executor, through the same write-behind
+    buffer as the threaded pipeline (`pipeline.process_batch`). While MongoDB is behind, the buffer's
+    backpressure holds the consumer back and the ingest queues shed or pause reading.
+    """
+    while True:
+        batch, stop_requested = await collect_batch()
+
+        # Resume ingestion once the queues have drained enough
+        if not buffers.full():
+            queue_space.set()
+        if len(buffers) < BATCH_QUEUE_SIZE // 2:
+            subscriber.resume_reading()
+
+        if batch:
+            try:
+                await loop.run_in_executor(model_executor, pipeline.process_batch, batch)
+            except Exception as e:
+                logging.error(f"❌ [ERROR] Failed to process batch of {len(batch)} window(s): {e}", exc_info=True)
+        if stop_requested:
+            break
+
+# ⏳ Periodic Data Fetching & Publishing
+async def sync_scheduler():
+    while True:
+        await asyncio.sleep(settings.CLOUD_SYNC_PERIOD * 60)  # Convert minutes to seconds
+        try:
+            await loop.run_in_executor(sync_executor, pubsub.sync_training_data, client_publisher)
+        except Exception as e:
+            logging.error(f"❌ [ERROR] Failed during reduction and publishing: {e}", exc_info=True)
+
+async def serve(inbox, started):
+    global loop, windows_ready, queue_space, stop_event, stopping
+    loop = asyncio.get_running_loop()
+    windows_ready = asyncio.Event()
+    stopping = False
+    metrics.QUEUE_DEPTH.labels("ingest").set_function(lambda: len(buffers))
+    queue_space = asyncio.Event()
+    queue_space.set()
+    stop_event = asyncio.Event()
+
+    # Start the batch consumer before messages arrive
+    consumer = loop.create_task(process_batches())
+    if inbox is None:
+        subscriber.start()
+    else:
+        threading.Thread(target=consume, args=(inbox,), daemon=True).start()
+    publisher.start()
+
+    # Periodic cloud sync (once per edge, not per worker)
+    scheduler = loop.create_task(sync_scheduler()) if settings.WORKER_INDEX == 0 else None
+    logging.info(f"✅ Asyncio pipeline started (batch size: {BATCH_SIZE}, model workers: {ASYNC_MODEL_WORKERS}, "
+                 f"overflow policy: {buffers.policy}).")
+    started.set()
+
+    await stop_event.wait()
+
+    # Graceful shutdown: stop ingesting and process the queued batches (`stop` flushes the write buffer)
+    subscriber.stop()
+    stopping = True
+    windows_ready.set()
+    await consumer
+    if scheduler is not None:
+        scheduler.cancel()
+    publisher.stop()
+
+# 🚀 Start the asyncio MQTT Forwarder (Runnable from Main)
+def run(inbox=None):
+    """
+    Start the forwarder on its own event loop thread. Without `inbox`, sensor messages come
+    from the MQTT subscriber; with it, they are (topic, payload) pairs dispatched by the supervisor.
+    """
+    global loop_thread
+    logging.info("🚀 Starting asyncio MQTT Forwarder Module...")
+    started = threading.Event()
+    loop_thread = threading.Thread(target=asyncio.run, args=(serve(inbox, started),), daemon=True, name="apubsub")
+    loop_thread.start()
+    started.wait()
+
+# Graceful Shutdown
+def stop():
+    logging.info("👋 [EXITING] Disconnecting MQTT clients...")
+    if loop_thread is None or not loop_thread.is_alive():
+        return
+    loop.call_soon_threadsafe(stop_event.set)
+    loop_thread.join()
+    db.close()
+    logging.info("✅ [EXITED] Clean shutdown completed.")
+
+# Allow direct execution for debugging
+if __name__ == "__main__":
+    import time
+    try:
+        run()
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop()
@@ -0,0 +1,91 @@
+"""
+Outlier scorer benchmark for analysis_core.
+
+Checks that the compiled IsolationForest scorer gives exactly the same
+predictions as scikit-learn, that early exit gives the same window decisions
+as scoring every sample, and reports the time per batch of windows for each.
+
+Usage: python benchmarks/outlier.py [--batch 32] [--window 25] [--repeat 20] [--seed 0]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import joblib
+import numpy as np
+
+CORE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CORE_DIR)
+
+import settings
+import iforest
+
+OUTLIER_MODEL_PATH = os.path.join(CORE_DIR, "models", f"{settings.OUTLIER_MODEL}.joblib")
+
+def make_windows(compiled, rng, batch_size, window_size):
+    """Scaled-looking windows with a share of corrupted samples, so both decisions occur."""
+    windows = rng.normal(0, 1, (batch_size, window_size, compiled.n_features)).astype(np.float32)
+    corrupted = rng.random((batch_size, window_size)) < rng.random((batch_size, 1))
+    windows[corrupted] *= 25
+    return windows
+
+def min_valid_samples(window_size):
+    # Same threshold as outlier.validate_batch
+    for valid_count in range(window_size + 1):
+        if (valid_count / settings.SLIDING_WINDOW_SIZE) * 100 >= settings.OUTLIER_DROP_RATE:
+            return valid_count
+    return window_size + 1
+
+def sklearn_validate(model, windows, min_valid):
+    batch_size, window_size, n_features = windows.shape
+    predictions = model.predict(windows.reshape(-1, n_features))
+    return np.sum(predictions.reshape(batch_size, window_size) == 1, axis=1) >= min_valid
+
+def timed(function, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the compiled IsolationForest scorer with scikit-learn.")
+    parser.add_argument("--batch", type=int, default=settings.BATCH_SIZE, help="windows per batch")
+    parser.add_argument("--window", type=int, default=settings.SLIDING_WINDOW_SIZE, help="samples per window")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per scorer (median is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    model = joblib.load(OUTLIER_MODEL_PATH)
+    compiled = iforest.compile_forest(model)
+    rng = np.random.default_rng(args.seed)
+    min_valid = min_valid_samples(args.window)
+
+    # Per-sample equivalence, including values right on the split thresholds
+    samples = make_windows(compiled, rng, 200, args.window).reshape(-1, compiled.n_features)
+    samples[::7, :] = compiled.thresholds[rng.integers(0, len(compiled.thresholds), (len(samples[::7]), compiled.n_features))]
+    assert np.array_equal(compiled.score_samples(samples), model.score_samples(samples)), "score_samples differs from scikit-learn"
+    assert np.array_equal(compiled.predict(samples), model.predict(samples)), "predict differs from scikit-learn"
+
+    # Per-window equivalence with and without early exit
+    windows = make_windows(compiled, rng, 200, args.window)
+    expected = sklearn_validate(model, windows, min_valid)
+    assert np.array_equal(compiled.validate_windows(windows, min_valid, early_exit=False), expected), "window decisions differ"
+    assert np.array_equal(compiled.validate_windows(windows, min_valid, early_exit=True), expected), "early exit changes window decisions"
+    print(f"✅ Compiled scorer matches scikit-learn on {len(samples)} samples and {len(windows)} windows "
+          f"({int(expected.sum())} valid, min {min_valid}/{args.window} inliers).")
+
+    batch = make_windows(compiled, rng, args.batch, args.window)
+    results = {
+        "sklearn": timed(lambda: sklearn_validate(model, batch, min_valid), args.repeat),
+        "compiled": timed(lambda: compiled.validate_windows(batch, min_valid, early_exit=False), args.repeat),
+        "compiled + early exit": timed(lambda: compiled.validate_windows(batch, min_valid, early_exit=True), args.repeat),
+    }
+    print(f"{'scorer':<24}{'ms/batch':>10}{'speedup':>9}")
+    for name, seconds in results.items():
+        print(f"{name:<24}{seconds * 1000:>10.2f}{results['sklearn'] / seconds:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
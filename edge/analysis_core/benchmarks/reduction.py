@@ -0,0 +1,74 @@
+"""
+Scale + reduce benchmark for analysis_core.
+
+For every PCA variant, checks that the fused scaler+PCA transform matches the
+two-step scikit-learn path (Scaler.transform, then PCA.transform) on the same
+windows, and reports the time per batch of windows for each.
+
+Usage: python benchmarks/reduction.py [--batch 32] [--window 25] [--repeat 50] [--seed 0]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import joblib
+import numpy as np
+
+CORE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CORE_DIR)
+
+import settings
+import reduction
+
+SCALER_PATH = os.path.join(CORE_DIR, "models", "Scaler.joblib")
+
+# float32 GEMM against the float64 scikit-learn result
+RTOL = 1e-4
+ATOL = 1e-4
+
+def two_step(scaler, pca, windows):
+    """The reference path: scikit-learn scaler, then scikit-learn PCA."""
+    batch_size, window_size, n_features = windows.shape
+    scaled = scaler.transform(windows.reshape(-1, n_features))
+    return pca.transform(scaled).reshape(batch_size, window_size, -1)
+
+def timed(function, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the fused scaler+PCA transform with the two-step scikit-learn path.")
+    parser.add_argument("--batch", type=int, default=settings.BATCH_SIZE, help="windows per batch")
+    parser.add_argument("--window", type=int, default=settings.SLIDING_WINDOW_SIZE, help="samples per window")
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs per path (median is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    scaler = joblib.load(SCALER_PATH)
+    rng = np.random.default_rng(args.seed)
+    # Samples in the raw sensor range the scaler was fitted on
+    windows = (rng.normal(0, 1, (args.batch, args.window, len(scaler.mean_))) * scaler.scale_ + scaler.mean_).astype(np.float32)
+
+    print(f"{'model':<8}{'components':>11}{'max abs err':>13}{'sklearn ms':>12}{'fused ms':>10}{'speedup':>9}")
+    for name, path in reduction.PCA_PATHS.items():
+        pca = joblib.load(path)
+        fused = reduction.FusedReduction(scaler, pca)
+
+        expected = two_step(scaler, pca, windows)
+        actual = fused.transform(windows)
+        assert actual.shape == expected.shape, f"{name}: shape {actual.shape} != {expected.shape}"
+        assert np.allclose(actual, expected, rtol=RTOL, atol=ATOL), f"{name}: fused output differs from scikit-learn"
+
+        sklearn_s = timed(lambda: two_step(scaler, pca, windows), args.repeat)
+        fused_s = timed(lambda: fused.transform(windows), args.repeat)
+        print(f"{name:<8}{pca.n_components_:>11}{np.abs(actual - expected).max():>13.2e}"
+              f"{sklearn_s * 1000:>12.3f}{fused_s * 1000:>10.3f}{sklearn_s / fused_s:>8.1f}x")
+    print("✅ Fused transform matches the two-step scikit-learn path for every PCA model.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Offline replay benchmark for analysis_core.
+
+Builds sensor messages from the mHealth logs in `AI Module/Data` the way the
+sensor does (sensor scaler, same JSON or binary layout), and drives them through
+`pubsub.on_message` -> batch pipeline (inference, outlier detection) -> Database
+write buffer, followed by one cloud sync (reduction, serialization, publish) of
+the stored documents. MongoDB and the cloud MQTT broker are replaced by in-process
+stand-ins, so no Docker, EMQX or Mongo is needed.
+
+Every configuration (PCA/AE, window size 25/50/100) runs in a fresh interpreter
+and reports msgs/s, p50/p99 per stage (from the metrics stage timers) and the peak
+RSS. Inference runs where the shipped model accepts the input (PCA, window 25).
+With --baseline, msgs/s is compared with an earlier result file and the exit code
+is 1 if any configuration got slower than the tolerance.
+
+Usage: python benchmarks/replay.py [--messages 2000] [--devices 8] [--encoding json]
+                                   [--output replay.json] [--baseline old.json] [--tolerance 0.1]
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+CORE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(os.path.dirname(CORE_DIR))
+DATA_GLOB = os.path.join(REPO_DIR, "AI Module", "Data", "mHealth_subject*.log")
+SENSOR_SCALER_PATH = os.path.join(REPO_DIR, "sensor", "model", "Scaler.joblib")
+N_FIELDS = 23  # Sensor features per sample (the log's last column is the activity label)
+
+BINARY_TOPIC = "sensor/binary"
+
+# (REDUCTION_MODEL, SLIDING_WINDOW_SIZE)
+CONFIGS = [(model, window) for model in ("PCA", "AE") for window in (25, 50, 100)]
+STAGES = ("decode", "scale", "outlier", "reduction", "predict", "insert", "sync")
+
+def config_name(model, window):
+    return f"{model}-w{window}"
+
+def config_env(model, window, encoding):
+    """Settings of one configuration. The child never reaches a real broker or database."""
+    return {
+        "REDUCTION_MODEL": model,
+        "SLIDING_WINDOW_SIZE": str(window),
+        # The shipped inference model takes 25 x 16 PCA components
+        "INFERENCE_ENABLE": str(model == "PCA" and window == 25),
+        "SENSOR_MQTT_BINARY_TOPIC": BINARY_TOPIC if encoding == "binary" else "",
+        "METRICS_ENABLE": "False",
+        "SHED_POLICY": "block",  # Measure lossless throughput: the replay outruns the worker on purpose
+        "DB_URL": "mongodb://127.0.0.1:9/edge?connectTimeoutMS=100",
+        "LOG_LEVEL": "ERROR",
+        "TF_CPP_MIN_LOG_LEVEL": "3",
+    }
+
+def load_samples():
+    """All 23-feature samples of the mHealth logs, in recording order."""
+    import numpy as np
+    rows = []
+    for path in sorted(glob.glob(DATA_GLOB)):
+        with open(path) as f:
+            for line in f:
+                values = line.split()
+                if len(values) == N_FIELDS + 1:
+                    rows.append(values[:N_FIELDS])
+    if not rows:
+        raise FileNotFoundError(f"No sensor logs found at {DATA_GLOB}")
+    return np.array(rows, dtype=np.float64)
+
+def build_payloads(count, window, devices, encoding):
+    """(topic, payload) pairs as the sensor publishes them, cycling through the logs."""
+    import joblib
+    import numpy as np
+    import pandas as pd
+    import codec
+
+    samples = joblib.load(SENSOR_SCALER_PATH).transform(load_samples())
+    n_windows = len(samples) // window
+    payloads = []
+    for i in range(count):
+        data = samples[(i % n_windows) * window:(i % n_windows + 1) * window]
+        meta = {"device": f"sensor{i % devices + 1:02d}", "date": datetime.now(timezone.utc).isoformat(),
+                "windowSize": window, "label": int(i % 12 + 1), "latency": 1.0}
+        if encoding == "binary":
+            # Same sample layout as the sensor's load_to_binary
+            payloads.append((BINARY_TOPIC, codec.encode_window(meta, data.reshape(N_FIELDS, window).T)))
+        else:
+            # Same layout as the sensor's load_to_json
+            meta["data"] = json.loads(pd.DataFrame(data.reshape(N_FIELDS, window)).to_json(force_ascii=False))
+            payloads.append(("sensor/data", json.dumps(meta).encode()))
+    return payloads
+
+class MemoryCollection:
+    """Stand-in for the MongoDB collection: keeps the inserted documents in memory."""
+
+    def __init__(self):
+        from bson import ObjectId
+        self.object_id = ObjectId
+        self.documents = []
+
+    def insert_many(self, documents, ordered=True):
+        for document in documents:
+            document.setdefault("_id", self.object_id())
+        self.documents.extend(documents)
+
+    def insert_one(self, document):
+        self.insert_many([document])
+
+class MemoryPublisher:
+    """Stand-in for the cloud MQTT client: counts the published messages and bytes."""
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def publish(self, topic, payload):
+        import paho.mqtt.client as mqtt
+        self.messages += 1
+        self.bytes += len(payload)
+        return mqtt.MQTTMessageInfo(self.messages)
+
+class StageRecorder:
+    """Replaces a metrics stage histogram and keeps every observation."""
+
+    def __init__(self):
+        self.durations = []
+
+    def observe(self, value):
+        self.durations.append(value)
+
+def percentiles(durations):
+    import numpy as np
+    if not durations:
+        return None
+    durations = np.array(durations) * 1000
+    return {"count": len(durations), "p50_ms": float(np.percentile(durations, 50)),
+            "p99_ms": float(np.percentile(durations, 99)), "mean_ms": float(durations.mean())}
+
+def run_child(args):
+    """Replay the messages through one configuration (runs in the child process)."""
+    import resource
+    sys.path.insert(0, CORE_DIR)
+    os.chdir(CORE_DIR)
+    import paho.mqtt.client as mqtt
+    import settings
+    import metrics
+    import registry
+    import pipeline
+    import pubsub
+    from dbmodel import db
+
+    payloads = build_payloads(args.messages, settings.SLIDING_WINDOW_SIZE, args.devices, args.encoding)
+    registry.load_all()
+    collection = db.collection = MemoryCollection()
+
+    # Warm up the models outside the measurement (TensorFlow builds its graph on the first call)
+    warmup = [pubsub.decode_message(topic, payload) for topic, payload in payloads[:settings.BATCH_SIZE]]
+    pipeline.analyze_batch(warmup)
+
+    recorders = {stage: StageRecorder() for stage in STAGES}
+    metrics.stage_timers.update(recorders)
+    drops_before = sum(value.value for value in metrics.OUTLIER_DROPS.values.values())
+
+    # Ingest: MQTT callback -> batch worker -> write buffer, until everything is in the collection
+    pipeline.run()
+    start = time.perf_counter()
+    for topic, payload in payloads:
+        message = mqtt.MQTTMessage(topic=topic.encode())
+        message.payload = payload
+        pubsub.on_message(None, None, message)
+    pipeline.stop()
+    ingest_s = time.perf_counter() - start
+
+    # Cloud sync of everything that passed outlier validation
+    publisher = MemoryPublisher()
+    unread = [{key: document[key] for key in ("_id", "data", "label", "date") if key in document}
+              for document in collection.documents if document.get("processed") is False]
+    start = time.perf_counter()
+    for first in range(0, len(unread), settings.CLOUD_SYNC_BATCH_SIZE):
+        chunk_start = time.perf_counter()
+        records = pubsub.training_records(unread[first:first + settings.CLOUD_SYNC_BATCH_SIZE])
+        pubsub.publish_training_records(records, mark_processed=lambda ids: None, client=publisher)
+        recorders["sync"].observe(time.perf_counter() - chunk_start)
+    sync_s = time.perf_counter() - start
+
+    return {
+        "messages": len(payloads),
+        "stored": len(collection.documents),
+        "outlier_drops": sum(value.value for value in metrics.OUTLIER_DROPS.values.values()) - drops_before,
+        "ingest_s": ingest_s,
+        "msgs_per_s": len(payloads) / ingest_s,
+        "sync_records": len(unread),
+        "sync_s": sync_s,
+        "sync_records_per_s": len(unread) / sync_s if sync_s else None,
+        "sync_bytes": publisher.bytes,
+        "stages": {stage: percentiles(recorder.durations) for stage, recorder in recorders.items()},
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def measure(model, window, args):
+    """Start one analysis_core process with the given configuration and return its measurements."""
+    env = dict(os.environ, **config_env(model, window, args.encoding))
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--messages", str(args.messages),
+               "--devices", str(args.devices), "--encoding", args.encoding]
+    result = subprocess.run(command, cwd=CORE_DIR, env=env, capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith("REPLAY "):
+            return json.loads(line[len("REPLAY "):])
+    raise RuntimeError(f"Replay failed for {config_name(model, window)}: {result.stderr.strip()[-500:]}")
+
+def compare(results, baseline_path, tolerance):
+    """Return the configurations whose msgs/s fell below the baseline by more than `tolerance`."""
+    with open(baseline_path) as f:
+        baseline = {row["name"]: row for row in json.load(f)["results"]}
+    regressions = []
+    for row in results:
+        before = baseline.get(row["name"])
+        if before is not None and row["msgs_per_s"] < before["msgs_per_s"] * (1 - tolerance):
+            regressions.append((row["name"], before["msgs_per_s"], row["msgs_per_s"]))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay sensor logs through analysis_core without MQTT or MongoDB.")
+    parser.add_argument("--messages", type=int, default=2000, help="messages replayed per configuration")
+    parser.add_argument("--devices", type=int, default=8, help="sensors the messages are spread over")
+    parser.add_argument("--encoding", choices=("json", "binary"), default="json", help="sensor payload encoding")
+    parser.add_argument("--output", default="replay.json", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="earlier result file to check for msgs/s regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed msgs/s drop against the baseline (fraction)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print("REPLAY " + json.dumps(run_child(args)))
+        return
+
+    results = []
+    # Stage columns: p50/p99 in ms
+    print(f"{'config':<10}{'inference':>10}{'msgs/s':>9}{'drops':>7}" + "".join(f"{stage:>16}" for stage in STAGES) + f"{'RSS MB':>8}")
+    for model, window in CONFIGS:
+        env = config_env(model, window, args.encoding)
+        row = {"name": config_name(model, window), "settings": env, **measure(model, window, args)}
+        results.append(row)
+
+        stages = ""
+        for stage in STAGES:
+            timing = row["stages"][stage]
+            stages += f"{'-':>16}" if timing is None else f"{timing['p50_ms']:.2f}/{timing['p99_ms']:.2f}".rjust(16)
+        inference_label = "on" if env["INFERENCE_ENABLE"] == "True" else "off"
+        print(f"{row['name']:<10}{inference_label:>10}{row['msgs_per_s']:>9.0f}{row['outlier_drops']:>7}{stages}{row['peak_rss_mb']:>8.0f}")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "messages": args.messages,
+            "devices": args.devices,
+            "encoding": args.encoding,
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for name, before, after in regressions:
+            print(f"❌ {name}: {after:.0f} msgs/s, down from {before:.0f} msgs/s")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No configuration is more than {args.tolerance:.0%} slower than {args.baseline}.")
+
+if __name__ == "__main__":
+    main()
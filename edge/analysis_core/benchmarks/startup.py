@@ -0,0 +1,106 @@
+"""
+Cold-start benchmark for analysis_core.
+
+Starts a fresh interpreter for every settings combination, imports the
+analysis modules, loads the enabled models through the registry and reports
+the wall time, the per-model load time and the peak RSS of that process.
+
+Usage: python benchmarks/startup.py [--repeat N] [--output startup.json]
+"""
+import os
+import sys
+import json
+import argparse
+import itertools
+import statistics
+import subprocess
+
+CORE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child process
+CHILD = """
+import time, json, resource
+start = time.perf_counter()
+import registry, inference, outlier, reduction
+imported = time.perf_counter()
+load_times = registry.load_all()
+loaded = time.perf_counter()
+print("STARTUP " + json.dumps({
+    "import_s": imported - start,
+    "load_s": loaded - imported,
+    "total_s": loaded - start,
+    "models_s": load_times,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+# Settings combinations: (INFERENCE_ENABLE, INFERENCE_BACKEND, OUTLIER_ENABLE, REDUCTION_ENABLE, REDUCTION_MODEL)
+COMBINATIONS = [
+    combo for combo in itertools.product(["False", "True"], ["keras", "tflite"], ["False", "True"], ["False", "True"], ["PCA", "AE"])
+    # The backend only matters with inference on, the reduction model only when something reduces
+    if (combo[0] == "True" or combo[1] == "keras") and (combo[0] == "True" or combo[3] == "True" or combo[4] == "PCA")
+]
+
+def measure(combo):
+    """Start one analysis_core process with the given settings and return its measurements."""
+    inference_enable, backend, outlier_enable, reduction_enable, reduction_model = combo
+    env = dict(
+        os.environ,
+        INFERENCE_ENABLE=inference_enable,
+        INFERENCE_BACKEND=backend,
+        OUTLIER_ENABLE=outlier_enable,
+        REDUCTION_ENABLE=reduction_enable,
+        REDUCTION_MODEL=reduction_model,
+        LOG_LEVEL="ERROR",
+        TF_CPP_MIN_LOG_LEVEL="3",
+    )
+    result = subprocess.run([sys.executable, "-c", CHILD], cwd=CORE_DIR, env=env, capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith("STARTUP "):
+            return json.loads(line[len("STARTUP "):])
+    raise RuntimeError(f"Startup run failed for {combo}: {result.stderr.strip()[-500:]}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure analysis_core cold-start time and RSS per settings combination.")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per combination (median is reported)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'inference':<16}{'outlier':<9}{'reduction':<12}{'import s':>10}{'load s':>9}{'total s':>9}{'RSS MB':>9}")
+    for combo in COMBINATIONS:
+        runs = [measure(combo) for _ in range(args.repeat)]
+        inference_enable, backend, outlier_enable, reduction_enable, reduction_model = combo
+        row = {
+            "settings": {
+                "INFERENCE_ENABLE": inference_enable,
+                "INFERENCE_BACKEND": backend,
+                "OUTLIER_ENABLE": outlier_enable,
+                "REDUCTION_ENABLE": reduction_enable,
+                "REDUCTION_MODEL": reduction_model,
+            },
+            "import_s": statistics.median(run["import_s"] for run in runs),
+            "load_s": statistics.median(run["load_s"] for run in runs),
+            "total_s": statistics.median(run["total_s"] for run in runs),
+            "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+            "models_s": {name: statistics.median(run["models_s"][name] for run in runs) for name in runs[0]["models_s"]},
+        }
+        results.append(row)
+
+        inference_label = backend if inference_enable == "True" else "off"
+        if reduction_enable == "True":
+            reduction_label = reduction_model
+        else:
+            # Inference still loads the reduction model for its own input
+            reduction_label = f"({reduction_model})" if inference_enable == "True" else "off"
+        outlier_label = "on" if outlier_enable == "True" else "off"
+        print(f"{inference_label:<16}{outlier_label:<9}{reduction_label:<12}"
+              f"{row['import_s']:>10.2f}{row['load_s']:>9.2f}{row['total_s']:>9.2f}{row['peak_rss_mb']:>9.0f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Training payload benchmark for analysis_core.
+
+Reduces windows of the mHealth logs in `AI Module/Data` with every PCA model
+(the sensor scaler first, like stored documents) and compares the bytes per
+window on TRAINING_MQTT_TOPIC: the JSON records of TRAINING_ENCODING=json
+against the columnar encoding for each dtype and compression. Every columnar
+message is decoded with the reference decoder (`codec.decode_training`) and
+checked against the reduced windows and labels; the encode and decode time per
+message is reported too. The repository ships a short excerpt of one subject;
+point --data at the full mHealth logs for representative numbers.
+
+Usage: python benchmarks/training.py [--data "AI Module/Data/mHealth_subject*.log"] [--window 25]
+                                     [--chunk 100] [--messages 20] [--level 6]
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import joblib
+import numpy as np
+
+CORE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(os.path.dirname(CORE_DIR))
+sys.path.insert(0, CORE_DIR)
+
+import codec
+
+DATA_GLOB = os.path.join(REPO_DIR, "AI Module", "Data", "mHealth_subject*.log")
+SENSOR_SCALER_PATH = os.path.join(REPO_DIR, "sensor", "model", "Scaler.joblib")
+PCA_PATHS = {"PCA": os.path.join(CORE_DIR, "models", "PCA.joblib"), "PCA_7": os.path.join(CORE_DIR, "models", "PCA_7.joblib")}
+N_FIELDS = 23  # Sensor features per sample (the log's last column is the activity label)
+EDGE_ID = "Edge_UB01"
+
+# Largest decoding error accepted per dtype, relative to the largest reduced value
+TOLERANCE = {"float32": 1e-6, "float16": 1e-3}
+
+def load_samples(pattern):
+    """All samples and activity labels of the mHealth logs, in recording order."""
+    rows = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            for line in f:
+                values = line.split()
+                if len(values) == N_FIELDS + 1:
+                    rows.append(values)
+    if not rows:
+        raise FileNotFoundError(f"No sensor logs found at {pattern}")
+    rows = np.array(rows, dtype=np.float64)
+    return rows[:, :N_FIELDS], rows[:, N_FIELDS].astype(int)
+
+def json_message(windows, labels):
+    """The message TRAINING_ENCODING=json publishes (same record layout as pubsub.training_records)."""
+    records = []
+    for reduced, label in zip(windows, labels):
+        record = codec.to_document_data(np.round(reduced, 10))
+        record["label"] = int(label)
+        records.append(json.dumps(record).encode())
+    return b'{"edge_id": ' + json.dumps(EDGE_ID).encode() + b', "data": [' + b",".join(records) + b"]}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes per window of JSON and columnar training payloads.")
+    parser.add_argument("--data", default=DATA_GLOB, help="glob of mHealth subject logs")
+    parser.add_argument("--window", type=int, default=25, help="samples per window")
+    parser.add_argument("--chunk", type=int, default=100, help="windows per message")
+    parser.add_argument("--messages", type=int, default=20, help="messages per configuration")
+    parser.add_argument("--level", type=int, default=6, help="zlib level / lzma preset")
+    args = parser.parse_args()
+
+    samples, activity = load_samples(args.data)
+    samples = joblib.load(SENSOR_SCALER_PATH).transform(samples)
+    n_windows = min(len(samples) // args.window, args.chunk * args.messages)
+    windows = samples[:n_windows * args.window].reshape(n_windows, args.window, N_FIELDS)
+    labels = activity[:n_windows * args.window:args.window]
+    if n_windows < args.chunk * args.messages:
+        print(f"⚠️ The logs hold only {n_windows} window(s) of {args.window} samples. Compression ratios are more reliable with more data (--data).")
+    chunks = [slice(first, first + args.chunk) for first in range(0, n_windows, args.chunk)]
+
+    print(f"{'model':<7}{'encoding':<18}{'bytes/window':>13}{'vs JSON':>9}{'encode ms':>11}{'decode ms':>11}{'max abs err':>13}")
+    for name, path in PCA_PATHS.items():
+        pca = joblib.load(path)
+        reduced = pca.transform(windows.reshape(-1, N_FIELDS)).reshape(n_windows, args.window, -1)
+
+        start = time.perf_counter()
+        json_bytes = sum(len(json_message(reduced[chunk], labels[chunk])) for chunk in chunks)
+        json_ms = (time.perf_counter() - start) * 1000 / len(chunks)
+        print(f"{name:<7}{'json':<18}{json_bytes / n_windows:>13.0f}{1:>8.2f}x{json_ms:>11.2f}{'':>11}{'':>13}")
+
+        for dtype in codec.TRAINING_DTYPES:
+            for compression in codec.COMPRESSORS:
+                total, encode_s, decode_s, error = 0, 0.0, 0.0, 0.0
+                for chunk in chunks:
+                    start = time.perf_counter()
+                    message = codec.encode_training(EDGE_ID, reduced[chunk], labels[chunk], dtype, compression, args.level)
+                    encode_s += time.perf_counter() - start
+                    start = time.perf_counter()
+                    decoded = codec.decode_training(message)
+                    decode_s += time.perf_counter() - start
+
+                    assert decoded["edge_id"] == EDGE_ID and decoded["count"] == len(reduced[chunk])
+                    assert np.array_equal(decoded["label"], labels[chunk]), f"{name} {dtype}/{compression}: labels differ"
+                    error = max(error, float(np.abs(decoded["data"] - reduced[chunk]).max()))
+                    total += len(message)
+                limit = TOLERANCE[dtype] * np.abs(reduced).max()
+                assert error <= limit, f"{name} {dtype}/{compression}: decoding error {error:.2e} above {limit:.2e}"
+                print(f"{name:<7}{f'{dtype}/{compression}':<18}{total / n_windows:>13.0f}{json_bytes / total:>8.2f}x"
+                      f"{encode_s * 1000 / len(chunks):>11.2f}{decode_s * 1000 / len(chunks):>11.2f}{error:>13.2e}")
+    print(f"✅ Every columnar message decodes to its windows and labels ({n_windows} windows of {args.window} samples, {args.chunk} per message).")
+
+if __name__ == "__main__":
+    main()
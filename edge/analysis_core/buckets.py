@@ -0,0 +1,166 @@
+import datetime
+from collections import OrderedDict
+import numpy as np
+from bson import Binary
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+import settings
+from window import Window
+
+# Bucketed storage layout (DB_LAYOUT=bucket)
+# One document per device, window shape and DB_BUCKET_SECONDS time bucket:
+# {
+#   device, windowSize, features, date (bucket start), minDate, maxDate,
+#   count, processedCount, processed (no window left to publish to the cloud),
+#   samples: [Binary(float32 little-endian (windowSize, features) window), ...],
+#   windows: [{date, label, labelSource, latency, ..., publish}, ...]  # Everything else of each window
+# }
+# Windows are appended in arrival order; the cloud sync publishes them in that order and
+# tracks its progress per bucket in processedCount. Like `processed: False` in the document
+# layout, only windows with `publish` (validated and not published yet) are synced; a bucket
+# is processed once none of its windows from processedCount on is to be published.
+SAMPLE_DTYPE = "<f4"
+BUCKET_FIELDS = ("_id", "data", "shape", "device", "windowSize", "processed")  # Not repeated per window
+
+# Indexes of the bucket collection: name -> (keys, options)
+INDEXES = {
+    # Cloud sync: buckets with unpublished windows (only those are indexed)
+    "unprocessed_by_max_date": ([("processed", ASCENDING), ("maxDate", ASCENDING)], {"partialFilterExpression": {"processed": False}}),
+    # Latest buckets of a device
+    "device_date": ([("device", ASCENDING), ("date", DESCENDING)], {}),
+}
+
+def bucket_start(date, seconds=None):
+    """Start of the time bucket holding `date` (the current one for dates that are not datetimes)."""
+    seconds = max(1, seconds or settings.DB_BUCKET_SECONDS)
+    if not isinstance(date, datetime.datetime):
+        date = datetime.datetime.utcnow()
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=date.tzinfo)
+    offset = (date - epoch).total_seconds()
+    return epoch + datetime.timedelta(seconds=offset - offset % seconds)
+
+def window_samples(document):
+    """
+    The (window, features) float32 samples of a window document: packed bytes with a shape
+    (Window.to_document(packed=True)), an array, or the nested dict layout. None if unusable.
+    """
+    data = document.get("data")
+    if isinstance(data, (bytes, Binary)) and document.get("shape"):
+        return np.frombuffer(data, dtype=SAMPLE_DTYPE).reshape(document["shape"])
+    return Window.from_message(document).samples
+
+def group(documents):
+    """
+    Group window documents by bucket, keeping their order.
+    Returns {(device, bucket start, windowSize, features): [(samples, metadata), ...]}.
+    Windows without usable samples are left out.
+    """
+    groups = OrderedDict()
+    for document in documents:
+        samples = window_samples(document)
+        if samples is None or samples.ndim != 2:
+            continue
+        key = (document.get("device", "Unknown_Sensor"), bucket_start(document.get("date")), *samples.shape)
+        groups.setdefault(key, []).append((samples, window_metadata(document)))
+    return groups
+
+def window_metadata(document):
+    """
+    What a bucket keeps of a window document: every field but BUCKET_FIELDS, and `publish`, whether the cloud sync
+    is to publish it (documents with `processed: False`, i.e. validated by the outlier stage and not published yet).
+    """
+    metadata = {field: value for field, value in document.items() if field not in BUCKET_FIELDS}
+    metadata["publish"] = document.get("processed") is False
+    return metadata
+
+def pending(windows):
+    """Whether any of the (samples, metadata) pairs is still to be published."""
+    return any(metadata.get("publish") for _, metadata in windows)
+
+def pack(samples):
+    return Binary(np.ascontiguousarray(samples, dtype=SAMPLE_DTYPE).tobytes())
+
+def date_range(windows):
+    dates = [metadata["date"] for _, metadata in windows if isinstance(metadata.get("date"), datetime.datetime)]
+    return (min(dates), max(dates)) if dates else (None, None)
+
+def updates(documents, max_windows=None):
+    """
+    Upserts that append window documents to their buckets, one per bucket.
+    Returns (operations, number of windows per operation); unusable windows are not counted.
+    """
+    max_windows = max_windows or settings.DB_BUCKET_MAX_WINDOWS
+    operations, counts = [], []
+    for (device, start, window_size, features), windows in group(documents).items():
+        update = {
+            "$push": {
+                "samples": {"$each": [pack(samples) for samples, _ in windows]},
+                "windows": {"$each": [metadata for _, metadata in windows]},
+            },
+            "$inc": {"count": len(windows)},
+            "$setOnInsert": {"processedCount": 0},
+        }
+        if pending(windows):
+            update["$set"] = {"processed": False}
+        else:
+            update["$setOnInsert"]["processed"] = True  # Nothing to publish (an open bucket stays open)
+        min_date, max_date = date_range(windows)
+        if min_date is not None:
+            update["$min"] = {"minDate": min_date}
+            update["$max"] = {"maxDate": max_date}
+        # A full bucket is left alone: the upsert then starts a new one for the same period
+        query = {"device": device, "date": start, "windowSize": window_size, "features": features,
+                 "count": {"$lt": max_windows}}
+        operations.append(UpdateOne(query, update, upsert=True))
+        counts.append(len(windows))
+    return operations, counts
+
+def new_bucket(device, start, windows, processed=0):
+    """A complete bucket document for `windows` ((samples, metadata) pairs), the first `processed` not to be published."""
+    window_size, features = windows[0][0].shape
+    min_date, max_date = date_range(windows)
+    return {
+        "device": device, "windowSize": window_size, "features": features,
+        "date": start, "minDate": min_date or start, "maxDate": max_date or start,
+        "count": len(windows), "processedCount": processed, "processed": not pending(windows[processed:]),
+        "samples": [pack(samples) for samples, _ in windows],
+        "windows": [metadata for _, metadata in windows],
+    }
+
+def unpack(bucket, start=0):
+    """
+    The windows of a bucket from index `start` on.
+    Returns a (windows, windowSize, features) float32 array and the matching window metadata.
+    """
+    samples = bucket.get("samples", [])[start:]
+    shape = (len(samples), bucket["windowSize"], bucket["features"])
+    array = np.frombuffer(b"".join(samples), dtype=SAMPLE_DTYPE).reshape(shape)
+    return array, bucket.get("windows", [])[start:]
+
+def window_documents(bucket, start=0):
+    """
+    The windows to publish of a bucket from index `start` on, as window documents with `data` as a
+    (window, features) array and `_id` as (bucket _id, index), the way the cloud sync reads them.
+    """
+    samples, windows = unpack(bucket, start)
+    documents = []
+    for index, (data, metadata) in enumerate(zip(samples, windows), start):
+        if not metadata.get("publish"):
+            continue  # Failed or skipped outlier validation, or published before the migration
+        document = dict(metadata, _id=(bucket["_id"], index), device=bucket["device"], windowSize=bucket["windowSize"])
+        document["data"] = data
+        documents.append(document)
+    return documents
+
+def processed_updates(ids):
+    """
+    Updates that mark windows, given as (bucket _id, index), as published.
+    Windows are published in bucket order, so a bucket is processed up to its highest published index.
+    """
+    published = {}
+    for bucket_id, index in ids:
+        published[bucket_id] = max(published.get(bucket_id, 0), index + 1)
+    operations = []
+    for bucket_id, count in published.items():
+        operations.append(UpdateOne({"_id": bucket_id, "count": {"$lte": count}}, {"$set": {"processedCount": count, "processed": True}}))
+        operations.append(UpdateOne({"_id": bucket_id, "count": {"$gt": count}, "processedCount": {"$lt": count}}, {"$set": {"processedCount": count}}))
+    return operations
@@ -0,0 +1,112 @@
+import json
+import lzma
+import zlib
+import struct
+import numpy as np
+
+# Binary window payload
+# [ magic "ITW" | version (u8) | header length (u16 LE) | JSON header | raw sample buffer ]
+# The JSON header carries device, date, windowSize, label, latency, dtype and shape.
+# It is padded with spaces so the sample buffer starts on a 4-byte boundary.
+WINDOW_MAGIC = b"ITW"
+WINDOW_VERSION = 1
+WINDOW_PREFIX = struct.Struct("<3sBH")
+WINDOW_DTYPE = "<f4"
+
+# Columnar training payload
+# [ magic "ITT" | version (u8) | header length (u16 LE) | JSON header | compressed body ]
+# The JSON header carries edge_id, count, shape (window, features), dtype, labelDtype and compression.
+# The body holds the reduced windows feature-major, as a (features, count, window) array, so each
+# feature's values are contiguous across the windows of the message, followed by one label per
+# window (-1 = unlabelled). The whole body is compressed with zlib, lzma (xz container) or not at all.
+TRAINING_MAGIC = b"ITT"
+TRAINING_VERSION = 1
+TRAINING_DTYPES = {"float32": "<f4", "float16": "<f2"}
+TRAINING_LABEL_DTYPE = "<i2"
+COMPRESSORS = {
+    "zlib": lambda data, level: zlib.compress(data, level),
+    "lzma": lambda data, level: lzma.compress(data, preset=level),
+    "none": lambda data, level: data,
+}
+DECOMPRESSORS = {"zlib": zlib.decompress, "lzma": lzma.decompress, "none": bytes}
+
+def is_binary_window(payload):
+    """Check whether a payload starts with the binary window magic."""
+    return payload[:len(WINDOW_MAGIC)] == WINDOW_MAGIC
+
+def encode_window(meta, window):
+    """
+    Encode window metadata and a (window, features) array into a binary payload.
+    `meta` holds device, date, windowSize, label and latency.
+    """
+    samples = np.ascontiguousarray(window, dtype=WINDOW_DTYPE)
+    header = dict(meta, dtype=WINDOW_DTYPE, shape=list(samples.shape))
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    header_bytes += b" " * (-(WINDOW_PREFIX.size + len(header_bytes)) % 4)
+    prefix = WINDOW_PREFIX.pack(WINDOW_MAGIC, WINDOW_VERSION, len(header_bytes))
+    return prefix + header_bytes + samples.tobytes()
+
+def decode_window(payload):
+    """
+    Decode a binary window payload.
+    Returns the message dict with "data" as a read-only (window, features) view on the payload.
+    """
+    magic, version, header_length = WINDOW_PREFIX.unpack_from(payload)
+    if magic != WINDOW_MAGIC:
+        raise ValueError("Payload is not a binary window.")
+    if version != WINDOW_VERSION:
+        raise ValueError(f"Unsupported binary window version {version}.")
+
+    offset = WINDOW_PREFIX.size + header_length
+    data = json.loads(bytes(payload[WINDOW_PREFIX.size:offset]))
+    dtype = np.dtype(data.pop("dtype"))
+    shape = tuple(data.pop("shape"))
+    count = int(np.prod(shape))
+    data["data"] = np.frombuffer(payload, dtype=dtype, count=count, offset=offset).reshape(shape)
+    return data
+
+def encode_training(edge_id, windows, labels, dtype="float32", compression="zlib", level=6):
+    """
+    Encode reduced windows of one shape, a (count, window, features) array, and their labels
+    into a columnar training payload. float16 halves the data again but keeps ~3 significant digits.
+    """
+    windows = np.asarray(windows)
+    data = np.ascontiguousarray(windows.transpose(2, 0, 1), dtype=TRAINING_DTYPES[dtype])
+    label_array = np.asarray(labels, dtype=TRAINING_LABEL_DTYPE)
+    header = {
+        "edge_id": edge_id, "count": len(windows), "shape": list(windows.shape[1:]),
+        "dtype": TRAINING_DTYPES[dtype], "labelDtype": TRAINING_LABEL_DTYPE, "compression": compression,
+    }
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    prefix = WINDOW_PREFIX.pack(TRAINING_MAGIC, TRAINING_VERSION, len(header_bytes))
+    return prefix + header_bytes + COMPRESSORS[compression](data.tobytes() + label_array.tobytes(), level)
+
+def decode_training(payload):
+    """
+    Reference decoder for columnar training payloads.
+    Returns the header dict with "data" as a (count, window, features) array and "label" as an int array.
+    """
+    magic, version, header_length = WINDOW_PREFIX.unpack_from(payload)
+    if magic != TRAINING_MAGIC:
+        raise ValueError("Payload is not a columnar training message.")
+    if version != TRAINING_VERSION:
+        raise ValueError(f"Unsupported training payload version {version}.")
+
+    offset = WINDOW_PREFIX.size + header_length
+    data = json.loads(bytes(payload[WINDOW_PREFIX.size:offset]))
+    body = DECOMPRESSORS[data["compression"]](payload[offset:])
+    count = data["count"]
+    window_size, n_features = data["shape"]
+    dtype = np.dtype(data["dtype"])
+    values = np.frombuffer(body, dtype=dtype, count=count * window_size * n_features)
+    data["data"] = values.reshape(n_features, count, window_size).transpose(1, 2, 0)
+    data["label"] = np.frombuffer(body, dtype=data["labelDtype"], count=count, offset=values.nbytes)
+    return data
+
+def to_document_data(window):
+    """
+    Convert a (window, features) array into the nested dict layout used by JSON
+    payloads and stored documents: {"<sample>": {"<feature>": value}}.
+    """
+    features = [str(i) for i in range(window.shape[1])]
+    return {str(i): dict(zip(features, row)) for i, row in enumerate(window.tolist())}
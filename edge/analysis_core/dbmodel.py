@@ -1,19 +1,98 @@
+import time
 import logging
 import datetime
+import argparse
+import threading
+import bson
+import numpy as np
 import settings
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, PyMongoError
+import metrics
+import spool
+import buckets
+from pymongo import ASCENDING, DESCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure, PyMongoError
 
 # Configure Logging
 logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Indexes the pipeline relies on: name -> (keys, options)
+INDEXES = {
+    # Cloud sync: unread documents of the last period (only unprocessed documents are indexed)
+    "unprocessed_by_date": ([("processed", ASCENDING), ("date", ASCENDING)], {"partialFilterExpression": {"processed": False}}),
+    # Service core: latest documents of a device
+    "device_date": ([("device", ASCENDING), ("date", DESCENDING)], {}),
+}
+TTL_INDEX = "date_ttl"
+RECONNECT_MIN_DELAY = 1  # Seconds before the first reconnect attempt, doubled after every failure
+RECONNECT_MAX_DELAY = 60
+DUPLICATE_KEY = 11000
+
+def sensor_timezone(name):
+    """The tzinfo of SENSOR_TIMEZONE (UTC if the name is unknown)."""
+    if name.upper() == "UTC":
+        return datetime.timezone.utc
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(name)
+    except Exception as e:
+        logging.warning(f"⚠️ Unknown SENSOR_TIMEZONE '{name}' ({e}). Reading sensor dates as UTC.")
+        return datetime.timezone.utc
+
+SENSOR_TIMEZONE = sensor_timezone(settings.SENSOR_TIMEZONE)
+
+def to_datetime(value):
+    """
+    Convert a message date into a naive UTC datetime for BSON storage, the form pymongo reads back
+    and the time-window queries compare with utcnow(). Sensors send ISO dates with a UTC offset;
+    dates without one (str(datetime.now()) on older sensors) are local time in SENSOR_TIMEZONE.
+    Values that are not ISO formatted are returned unchanged.
+    """
+    if not isinstance(value, str):
+        return value
+    try:
+        date = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=SENSOR_TIMEZONE)
+    return date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
 class Database:
     def __init__(self):
         self.client = None
         self.db = None
-        self.collection = None
+        self.collection = None  # Window documents, or their buckets with DB_LAYOUT=bucket
+        self.documents = None  # Window documents (the source of the bucket migration)
+        self.checkpoints = None
         self.test_col = None
+        self.bucketed = settings.DB_LAYOUT == "bucket"
+        if settings.DB_LAYOUT not in ("document", "bucket"):
+            logging.warning(f"⚠️ Unknown DB_LAYOUT '{settings.DB_LAYOUT}'. Using document.")
+        self.collection_name = settings.DB_BUCKET_COLLECTION if self.bucketed else settings.DB_COLLECTION
+
+        # Write-behind buffer state
+        self.write_buffer = []
+        self.write_buffer_since = None
+        self.pending_docs = 0  # Buffered + currently being flushed
+        self.write_cond = threading.Condition()
+        self.writer_thread = None
+        self.writer_stopping = False
+        self.stats = {"flushed_batches": 0, "flushed_docs": 0, "failed_docs": 0, "rejected_docs": 0}
+
+        # Disk spool for outages, replayed by a background thread
+        self.available = False  # Last ping or write succeeded
+        self.spool = spool.Spool() if settings.SPOOL_ENABLE else None
+        self.replay_thread = None
+        self.replay_stopping = threading.Event()
+        self.replay_wakeup = threading.Event()
+
         self.connect()
+        if self.spool is not None:
+            metrics.SPOOL_BYTES.labels().set_function(lambda: self.spool.size)
+            metrics.SPOOL_SEGMENTS.labels().set_function(lambda: len(self.spool))
+            if len(self.spool):
+                logging.info(f"🛢️ Spool holds {self.spool.size / 1e6:.1f} MB in {len(self.spool)} segment(s) from an earlier run.")
+            self.start_replay()
 
     def connect(self):
         """Establishes a database connection."""
@@ -21,18 +100,152 @@ class Database:
             logging.info("🔌 Connecting to MongoDB...")
             self.client = MongoClient(settings.DB_URL, serverSelectionTimeoutMS=5000)
             self.db = self.client["edge"]
-            self.collection = self.db[settings.DB_COLLECTION]
+            self.collection = self.db[self.collection_name]
+            self.documents = self.db[settings.DB_COLLECTION]
+            self.checkpoints = self.db[settings.DB_CHECKPOINT_COLLECTION]
             self.test_col = self.db["test"]
 
             # Ping to verify connection
             self.client.admin.command("ping")
             logging.info("✅ Database connected successfully!")
+            self.available = True
+            self.ensure_indexes()
         except ConnectionFailure:
             logging.error("❌ Database connection failed!")
-            self.client = None
+            self.close_client()
         except PyMongoError as e:
             logging.error(f"❌ MongoDB error: {e}")
-            self.client = None
+            self.close_client()
+
+    def close_client(self):
+        """Drop a client that could not connect (its monitor threads would otherwise keep running)."""
+        if self.client is not None:
+            self.client.close()
+        self.client = None
+        # Nothing may keep using the collections of the closed client
+        self.db = None
+        self.collection = None
+        self.documents = None
+        self.checkpoints = None
+        self.test_col = None
+        self.available = False
+
+    def ensure_indexes(self):
+        """Create the indexes the pipeline needs, keep the TTL index in line with DB_RETENTION_DAYS, and check them."""
+        indexes = buckets.INDEXES if self.bucketed else INDEXES
+        try:
+            for name, (keys, options) in indexes.items():
+                self.collection.create_index(keys, name=name, **options)
+
+            existing = self.collection.index_information()
+            expire_after = settings.DB_RETENTION_DAYS * 24 * 3600
+            if expire_after > 0:
+                if TTL_INDEX not in existing:
+                    self.collection.create_index([("date", ASCENDING)], name=TTL_INDEX, expireAfterSeconds=expire_after)
+                elif existing[TTL_INDEX].get("expireAfterSeconds") != expire_after:
+                    # Change the retention in place instead of rebuilding the index
+                    self.db.command({"collMod": self.collection.name, "index": {"name": TTL_INDEX, "expireAfterSeconds": expire_after}})
+            elif TTL_INDEX in existing:
+                self.collection.drop_index(TTL_INDEX)
+
+            existing = self.collection.index_information()
+            missing = [name for name in indexes if name not in existing]
+            if missing:
+                logging.warning(f"⚠️ Missing indexes on '{self.collection.name}': {', '.join(missing)}")
+            else:
+                retention = f"{settings.DB_RETENTION_DAYS} day(s) retention" if expire_after > 0 else "no retention"
+                logging.info(f"✅ Indexes ready on '{self.collection.name}' ({retention}).")
+        except OperationFailure as e:
+            logging.error(f"❌ Error creating indexes: {e}")
+        except PyMongoError as e:
+            logging.error(f"❌ MongoDB error while creating indexes: {e}")
+
+    def migrate_dates(self, batch_size=1000):
+        """Convert documents stored with string dates to BSON datetimes. Returns the number of converted documents."""
+        if self.collection is None:
+            logging.error("❌ Database not connected. Cannot migrate dates.")
+            return 0
+
+        converted = 0
+        try:
+            operations = []
+            with self.collection.find({"date": {"$type": "string"}}, {"date": 1}, batch_size=batch_size) as cursor:
+                for document in cursor:
+                    date = to_datetime(document["date"])
+                    if isinstance(date, str):
+                        logging.warning(f"⚠️ Document {document['_id']} has an unparsable date '{date}'. Skipping.")
+                        continue
+                    # Only update documents whose date did not change since they were read
+                    operations.append(UpdateOne({"_id": document["_id"], "date": document["date"]}, {"$set": {"date": date}}))
+                    if len(operations) >= batch_size:
+                        converted += self.collection.bulk_write(operations, ordered=False).modified_count
+                        operations = []
+            if operations:
+                converted += self.collection.bulk_write(operations, ordered=False).modified_count
+            logging.info(f"✅ Converted {converted} string date(s) to datetimes.")
+        except PyMongoError as e:
+            logging.error(f"❌ Error migrating dates: {e}")
+        return converted
+
+    def migrate_buckets(self, batch_size=1000, delete_source=False):
+        """
+        Convert the window documents of DB_COLLECTION into buckets in DB_BUCKET_COLLECTION, device by device in date order.
+        Only windows still to be published (`processed: False`) are synced from the buckets. With `delete_source`, converted documents
+        are deleted after every batch of buckets, so an interrupted migration can be run again to resume it.
+        Returns the number of converted documents.
+        """
+        if self.documents is None:
+            logging.error("❌ Database not connected. Cannot migrate to buckets.")
+            return 0
+
+        target = self.db[settings.DB_BUCKET_COLLECTION]
+        converted, skipped = 0, 0
+        try:
+            if not delete_source and target.estimated_document_count():
+                logging.error(f"❌ '{target.name}' already holds buckets. Converting again without deleting the source would store "
+                              "the windows twice. Use --delete-source to resume a migration.")
+                return 0
+
+            pending = []  # (bucket document, source ids) waiting to be written
+
+            def write_pending():
+                target.insert_many([bucket for bucket, _ in pending], ordered=True)
+                if delete_source:
+                    self.documents.delete_many({"_id": {"$in": [i for _, source_ids in pending for i in source_ids]}})
+                pending.clear()
+
+            for device in self.documents.distinct("device"):
+                key, windows, ids, published = None, [], [], 0
+                with self.documents.find({"device": device}, batch_size=batch_size).sort("date", ASCENDING) as cursor:
+                    for document in cursor:
+                        document["date"] = to_datetime(document.get("date"))
+                        samples = buckets.window_samples(document)
+                        if samples is None or samples.ndim != 2:
+                            skipped += 1
+                            continue
+                        document_key = (buckets.bucket_start(document["date"]), samples.shape)
+                        if windows and (document_key != key or len(windows) >= settings.DB_BUCKET_MAX_WINDOWS):
+                            pending.append((buckets.new_bucket(device, key[0], windows, published), ids))
+                            key, windows, ids, published = None, [], [], 0
+                            if sum(len(source_ids) for _, source_ids in pending) >= batch_size:
+                                write_pending()
+                        key = document_key
+                        metadata = buckets.window_metadata(document)
+                        if not metadata["publish"] and published == len(windows):
+                            published += 1
+                        windows.append((samples, metadata))
+                        ids.append(document["_id"])
+                        converted += 1
+                if windows:
+                    pending.append((buckets.new_bucket(device, key[0], windows, published), ids))
+            if pending:
+                write_pending()
+            logging.info(f"✅ Converted {converted} document(s) into buckets in '{target.name}'"
+                         f"{', deleting them from ' + repr(self.documents.name) if delete_source else ''}. "
+                         f"{skipped} document(s) without usable samples were left as they are.")
+        except PyMongoError as e:
+            logging.error(f"❌ Error migrating to buckets: {e}")
+        return converted
 
     def fetch_by_query(self, query, projection):
         """Fetch documents from MongoDB based on a query."""
@@ -49,13 +262,196 @@ class Database:
 
     def fetch_data_batch(self, minutes):
         """Fetch only unread (unprocessed) data from MongoDB."""
+        if self.bucketed:
+            return [document for batch in self.iter_data_batches(minutes, settings.DB_BUCKET_MAX_WINDOWS) for document in batch]
         query = {
             "processed": False,  # Only fetch unread data
-            "date": {"$gte": str(datetime.datetime.utcnow() - datetime.timedelta(minutes=minutes))}
+            "date": {"$gte": datetime.datetime.utcnow() - datetime.timedelta(minutes=minutes)}
         }
         projection = {"data": 1, "label": 1,"date":1,  "_id": 1}  # Include _id for marking as processed
         return self.fetch_by_query(query, projection)
 
+    def iter_data_batches(self, minutes, batch_size):
+        """
+        Stream unread (unprocessed) data from MongoDB in lists of up to `batch_size` documents.
+        The cursor fetches one batch at a time, so memory does not grow with the period.
+        """
+        if self.collection is None:
+            logging.error("❌ Database not connected. Cannot fetch data.")
+            return
+
+        since = datetime.datetime.utcnow() - datetime.timedelta(minutes=minutes)
+        if self.bucketed:
+            yield from self.iter_bucket_batches({"processed": False, "maxDate": {"$gte": since}}, batch_size, since)
+            return
+
+        query = {
+            "processed": False,  # Only fetch unread data
+            "date": {"$gte": since}
+        }
+        projection = {"data": 1, "label": 1, "date": 1, "_id": 1}  # Include _id for marking as processed
+        try:
+            with self.collection.find(query, projection, batch_size=batch_size) as cursor:
+                batch = []
+                for document in cursor:
+                    batch.append(document)
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+                if batch:
+                    yield batch
+        except PyMongoError as e:
+            logging.error(f"❌ Error fetching data: {e}")
+
+    def iter_new_batches(self, after_id, before_id, batch_size):
+        """
+        Stream unread data with an _id in (after_id, before_id), in _id order and in lists of up to `batch_size` documents.
+        `after_id` is the sync watermark (None reads from the start); `before_id` keeps back recent, possibly unsettled inserts.
+        Buckets keep their own progress (processedCount), so the bucket layout reads every unpublished window of the
+        buckets created before `before_id` and does not need the watermark.
+        """
+        if self.collection is None:
+            logging.error("❌ Database not connected. Cannot fetch data.")
+            return
+        if self.bucketed:
+            yield from self.iter_bucket_batches({"_id": {"$lt": before_id}, "processed": False}, batch_size)
+            return
+
+        id_range = {"$lt": before_id}
+        if after_id is not None:
+            id_range["$gt"] = after_id
+        query = {"_id": id_range, "processed": False}
+        projection = {"data": 1, "label": 1, "date": 1, "_id": 1}
+        try:
+            with self.collection.find(query, projection, batch_size=batch_size).sort("_id", ASCENDING) as cursor:
+                batch = []
+                for document in cursor:
+                    batch.append(document)
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+                if batch:
+                    yield batch
+        except PyMongoError as e:
+            logging.error(f"❌ Error fetching data: {e}")
+
+    def iter_bucket_batches(self, query, batch_size, since=None):
+        """
+        Stream the unpublished windows of the buckets matching `query`, in bucket _id and arrival order, as
+        window documents (see buckets.window_documents) in lists of up to `batch_size`. Windows dated before
+        `since` are left out.
+        """
+        try:
+            with self.collection.find(query).sort("_id", ASCENDING) as cursor:
+                batch = []
+                for bucket in cursor:
+                    documents = buckets.window_documents(bucket, bucket.get("processedCount", 0))
+                    if not documents:
+                        # Only windows not to be published are left: close the bucket unless windows were added meanwhile
+                        self.collection.update_one({"_id": bucket["_id"], "count": bucket["count"]},
+                                                   {"$set": {"processed": True, "processedCount": bucket["count"]}})
+                        continue
+                    for document in documents:
+                        date = document.get("date")
+                        if since is not None and isinstance(date, datetime.datetime) and date < since:
+                            continue
+                        batch.append(document)
+                        if len(batch) >= batch_size:
+                            yield batch
+                            batch = []
+                if batch:
+                    yield batch
+        except PyMongoError as e:
+            logging.error(f"❌ Error fetching data: {e}")
+
+    def fetch_windows(self, device, since=None, until=None, window_size=None):
+        """
+        Read the stored windows of a device with `window_size` samples (default SLIDING_WINDOW_SIZE), oldest first,
+        optionally dated within [since, until]. Works with both layouts.
+        Returns a (windows, window size, features) float32 array and the metadata of each window.
+        """
+        window_size = window_size or settings.SLIDING_WINDOW_SIZE
+        arrays, metadata = [], []
+        if self.collection is None:
+            logging.error("❌ Database not connected. Cannot fetch data.")
+            return np.empty((0, window_size, 0), dtype=np.float32), metadata
+
+        def in_range(date):
+            if since is None and until is None:
+                return True
+            if not isinstance(date, datetime.datetime):
+                return False
+            return (since is None or date >= since) and (until is None or date <= until)
+
+        try:
+            if self.bucketed:
+                query = {"device": device, "windowSize": window_size}
+                if since is not None:
+                    query["maxDate"] = {"$gte": since}
+                if until is not None:
+                    query["minDate"] = {"$lte": until}
+                with self.collection.find(query).sort("date", ASCENDING) as cursor:
+                    for bucket in cursor:
+                        samples, windows = buckets.unpack(bucket)
+                        keep = [index for index, window in enumerate(windows) if in_range(window.get("date"))]
+                        arrays.append(samples[keep])
+                        metadata.extend(windows[index] for index in keep)
+            else:
+                query = {"device": device}
+                if since is not None or until is not None:
+                    query["date"] = {key: value for key, value in (("$gte", since), ("$lte", until)) if value is not None}
+                with self.collection.find(query).sort("date", ASCENDING) as cursor:
+                    for document in cursor:
+                        samples = buckets.window_samples(document)
+                        if samples is None or samples.shape[0] != window_size:
+                            continue
+                        arrays.append(samples[np.newaxis])
+                        metadata.append({key: value for key, value in document.items() if key != "data"})
+        except PyMongoError as e:
+            logging.error(f"❌ Error fetching windows: {e}")
+            return np.empty((0, window_size, 0), dtype=np.float32), []
+
+        arrays = [array for array in arrays if len(array)]
+        if not arrays:
+            return np.empty((0, window_size, 0), dtype=np.float32), []
+        return np.concatenate(arrays), metadata
+
+    def load_watermark(self, name):
+        """Return the last synced _id stored under `name`, or None if there is no checkpoint yet."""
+        if self.checkpoints is None:
+            return None
+        try:
+            checkpoint = self.checkpoints.find_one({"_id": name})
+            return checkpoint["last_id"] if checkpoint else None
+        except PyMongoError as e:
+            logging.error(f"❌ Error loading sync checkpoint '{name}': {e}")
+            return None
+
+    def save_watermark(self, name, last_id):
+        """Persist the last synced _id under `name`."""
+        if self.checkpoints is None:
+            return
+        try:
+            self.checkpoints.update_one(
+                {"_id": name},
+                {"$set": {"last_id": last_id, "updated": datetime.datetime.utcnow()}},
+                upsert=True,
+            )
+        except PyMongoError as e:
+            logging.error(f"❌ Error saving sync checkpoint '{name}': {e}")
+
+    def mark_processed(self, ids):
+        """Mark the given documents (or bucketed windows, as (bucket _id, index)) as processed (published to the cloud)."""
+        if self.collection is None or not ids:
+            return
+        try:
+            if self.bucketed:
+                self.collection.bulk_write(buckets.processed_updates(ids), ordered=False)
+                return
+            self.collection.update_many({"_id": {"$in": ids}}, {"$set": {"processed": True}})
+        except PyMongoError as e:
+            logging.error(f"❌ Error marking data as processed: {e}")
+
 
     def insert(self, data):
         """Insert data into the main collection."""
@@ -65,7 +461,11 @@ class Database:
             return
             
         try:
-            self.collection.insert_one(data)
+            data["date"] = to_datetime(data.get("date"))
+            if self.bucketed:
+                self.bulk_insert([data])
+            else:
+                self.collection.insert_one(data)
             #logging.info("✅ Data inserted successfully.")
         except PyMongoError as e:
             logging.error(f"❌ Error inserting data: {e}")
@@ -77,13 +477,281 @@ class Database:
             return
         try:
             if data_list:
-                self.collection.insert_many(data_list)
+                for data in data_list:
+                    data["date"] = to_datetime(data.get("date"))
+                if self.bucketed:
+                    self.bulk_insert(data_list)
+                else:
+                    self.collection.insert_many(data_list)
                 logging.info(f"✅ {len(data_list)} records inserted successfully.")
             else:
                 logging.warning("⚠️ No data to insert.")
         except PyMongoError as e:
             logging.error(f"❌ Error inserting batch data: {e}")
 
+    def write(self, data_list):
+        """
+        Queue documents for a buffered, unordered bulk insert.
+        Blocks while too many documents are pending (backpressure) and returns
+        False if they could not be queued within DB_BUFFER_BLOCK_TIMEOUT seconds.
+        With the spool enabled, documents that do not fit are spooled to disk instead.
+        """
+        if not data_list:
+            return True
+
+        self.start_writer()
+        if self.spool is not None:
+            with self.write_cond:
+                saturated = self.pending_docs + len(data_list) > settings.DB_BUFFER_MAX_PENDING and self.pending_docs > 0
+            if saturated:
+                return self.spool_documents(data_list, "saturated")
+
+        deadline = time.monotonic() + settings.DB_BUFFER_BLOCK_TIMEOUT
+        with self.write_cond:
+            while self.pending_docs + len(data_list) > settings.DB_BUFFER_MAX_PENDING and self.pending_docs > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.writer_stopping:
+                    self.stats["rejected_docs"] += len(data_list)
+                    metrics.DB_ERRORS.labels("rejected").inc(len(data_list))
+                    logging.error(f"❌ Write buffer is full ({self.pending_docs} pending). {len(data_list)} record(s) rejected.")
+                    return False
+                self.write_cond.wait(remaining)
+
+            was_empty = not self.write_buffer
+            if was_empty:
+                self.write_buffer_since = time.monotonic()
+            self.write_buffer.extend(data_list)
+            self.pending_docs += len(data_list)
+            if was_empty or len(self.write_buffer) >= settings.DB_BUFFER_SIZE:
+                self.write_cond.notify_all()
+        return True
+
+    def start_writer(self):
+        """Start the background flush thread if it is not running yet."""
+        with self.write_cond:
+            if self.writer_thread is not None and self.writer_thread.is_alive():
+                return
+            self.writer_stopping = False
+            self.writer_thread = threading.Thread(target=self.writer_loop, daemon=True)
+            self.writer_thread.start()
+
+    def writer_loop(self):
+        """Flush the write buffer whenever it is full or old enough."""
+        max_age = settings.DB_BUFFER_MAX_AGE_MS / 1000
+        while True:
+            with self.write_cond:
+                while not self.writer_stopping:
+                    if len(self.write_buffer) >= settings.DB_BUFFER_SIZE:
+                        break
+                    if self.write_buffer and time.monotonic() - self.write_buffer_since >= max_age:
+                        break
+                    timeout = max_age - (time.monotonic() - self.write_buffer_since) if self.write_buffer else None
+                    self.write_cond.wait(timeout)
+
+                if self.writer_stopping and not self.write_buffer:
+                    return
+                batch = self.write_buffer[:settings.DB_BUFFER_SIZE]
+                del self.write_buffer[:settings.DB_BUFFER_SIZE]
+                self.write_buffer_since = time.monotonic() if self.write_buffer else None
+
+            try:
+                self.flush_batch(batch)
+            except Exception as e:
+                # E.g. bson.errors.InvalidDocument from a bad payload: the batch is lost, the writer keeps running
+                self.stats["failed_docs"] += len(batch)
+                metrics.DB_ERRORS.labels("failed").inc(len(batch))
+                logging.error(f"❌ Error flushing {len(batch)} record(s): {e}", exc_info=True)
+            finally:
+                with self.write_cond:
+                    self.pending_docs -= len(batch)
+                    self.write_cond.notify_all()
+
+    def bulk_insert(self, data_list):
+        """
+        Write documents in one unordered bulk call: insert_many, or one upsert per bucket with DB_LAYOUT=bucket.
+        Returns how many documents failed (duplicates of replayed documents and, for buckets, windows without
+        usable samples included). Connection and other MongoDB errors are raised.
+        """
+        if self.bucketed:
+            operations, counts = buckets.updates(data_list)
+            unusable = len(data_list) - sum(counts)
+            if not operations:
+                return unusable
+            try:
+                self.collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                return unusable + sum(counts[error["index"]] for error in e.details.get("writeErrors", []))
+            return unusable
+
+        try:
+            self.collection.insert_many(data_list, ordered=False)
+        except BulkWriteError as e:
+            return len([error for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY])
+        return 0
+
+    def flush_batch(self, data_list):
+        """Write one batch with an unordered bulk insert and update the counters. Spools it while MongoDB is down."""
+        if self.spool is not None and (self.client is None or not self.available):
+            self.spool_documents(data_list, "outage")
+            return
+
+        if self.collection is None:
+            logging.error("❌ Database not connected. Cannot insert data.")
+            self.stats["failed_docs"] += len(data_list)
+            metrics.DB_ERRORS.labels("failed").inc(len(data_list))
+            return
+
+        for data in data_list:
+            data["date"] = to_datetime(data.get("date"))
+        try:
+            with metrics.timed("insert"):
+                failed = self.bulk_insert(data_list)
+            self.stats["flushed_batches"] += 1
+            self.stats["flushed_docs"] += len(data_list) - failed
+            if failed:
+                self.stats["failed_docs"] += failed
+                metrics.DB_ERRORS.labels("failed").inc(failed)
+                logging.error(f"❌ {failed} of {len(data_list)} record(s) failed in bulk insert.")
+        except ConnectionFailure as e:
+            if self.spool is None:
+                self.stats["failed_docs"] += len(data_list)
+                metrics.DB_ERRORS.labels("failed").inc(len(data_list))
+                logging.error(f"❌ Error inserting batch data: {e}")
+                return
+            # Part of the batch may be stored already: replayed documents are written at least once
+            logging.error(f"❌ MongoDB is unreachable ({e}). Spooling to disk until it is back.")
+            self.available = False
+            self.replay_wakeup.set()
+            self.spool_documents(data_list, "outage")
+        except PyMongoError as e:
+            self.stats["failed_docs"] += len(data_list)
+            metrics.DB_ERRORS.labels("failed").inc(len(data_list))
+            logging.error(f"❌ Error inserting batch data: {e}")
+
+    def spool_documents(self, data_list, reason):
+        """Append documents to the disk spool. Returns False if the spool is full and they were rejected."""
+        for data in data_list:
+            data["date"] = to_datetime(data.get("date"))
+        try:
+            spooled = self.spool.append(data_list)
+        except (OSError, bson.errors.BSONError) as e:
+            spooled = 0
+            logging.error(f"❌ Error writing to the spool: {e}")
+        if not spooled:
+            self.stats["rejected_docs"] += len(data_list)
+            metrics.DB_ERRORS.labels("spool_full").inc(len(data_list))
+            logging.error(f"❌ Spool is full ({self.spool.size / 1e6:.1f} MB). {len(data_list)} record(s) rejected.")
+            return False
+        metrics.SPOOLED_DOCS.labels(reason).inc(spooled)
+        self.replay_wakeup.set()
+        return True
+
+    def start_replay(self):
+        """Start the background thread that reconnects to MongoDB and replays the spool."""
+        if self.replay_thread is not None and self.replay_thread.is_alive():
+            return
+        self.replay_stopping.clear()
+        self.replay_thread = threading.Thread(target=self.replay_loop, daemon=True)
+        self.replay_thread.start()
+
+    def replay_loop(self):
+        """Reconnect with exponential backoff while MongoDB is down, and replay the spool once it is back."""
+        delay = RECONNECT_MIN_DELAY
+        while not self.replay_stopping.is_set():
+            self.spool.sync()
+            if not self.available:
+                if self.ping():
+                    logging.info(f"✅ MongoDB is reachable again. Replaying {self.spool.size / 1e6:.1f} MB of spooled records.")
+                    delay = RECONNECT_MIN_DELAY
+                else:
+                    self.replay_stopping.wait(delay)
+                    delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                    continue
+
+            # Live records go first: replay only while the write buffer has room
+            if len(self.spool) and self.pending_docs < settings.DB_BUFFER_MAX_PENDING // 2:
+                self.replay()
+                continue
+            self.replay_wakeup.wait(1)
+            self.replay_wakeup.clear()
+
+    def ping(self):
+        """Check whether MongoDB answers, connecting first if the initial connection failed."""
+        if self.client is None:
+            self.connect()
+            return self.client is not None
+        try:
+            self.client.admin.command("ping")
+            self.available = True
+        except PyMongoError:
+            self.available = False
+        return self.available
+
+    def replay(self):
+        """
+        Insert the oldest spooled segment in unordered bulk inserts of SPOOL_REPLAY_BATCH records,
+        at most SPOOL_REPLAY_RATE records per second, and delete it once it is stored.
+        """
+        name = self.spool.next_segment()
+        if name is None:
+            return
+        documents, offsets = self.spool.read(name)
+        batch_size = max(1, settings.SPOOL_REPLAY_BATCH)
+        start = time.monotonic()
+        replayed = 0
+        for first in range(0, len(documents), batch_size):
+            if self.replay_stopping.is_set() or not self.available:
+                return
+            batch = documents[first:first + batch_size]
+            try:
+                with metrics.timed("insert"):
+                    failed = self.bulk_insert(batch)
+                if failed:
+                    self.stats["failed_docs"] += failed
+                    metrics.DB_ERRORS.labels("failed").inc(failed)
+                    logging.error(f"❌ {failed} of {len(batch)} spooled record(s) failed in bulk insert.")
+            except ConnectionFailure as e:
+                logging.error(f"❌ MongoDB is unreachable again ({e}). Replay pauses.")
+                self.available = False
+                return
+            except PyMongoError as e:
+                logging.error(f"❌ Error replaying spooled records: {e}. Retrying later.")
+                self.replay_stopping.wait(RECONNECT_MAX_DELAY)
+                return
+            self.spool.mark_replayed(name, offsets[first + len(batch) - 1], len(batch))
+            metrics.REPLAYED_DOCS.inc(len(batch))
+            replayed += len(batch)
+            if settings.SPOOL_REPLAY_RATE > 0:
+                self.replay_stopping.wait(max(0.0, start + replayed / settings.SPOOL_REPLAY_RATE - time.monotonic()))
+
+        self.spool.remove(name)
+        elapsed = time.monotonic() - start
+        rate = f" ({replayed / elapsed:.0f} records/s)" if replayed and elapsed > 0 else ""
+        logging.info(f"🛢️ Replayed {replayed} spooled record(s) from {name}{rate}. "
+                     f"{self.spool.size / 1e6:.1f} MB in {len(self.spool)} segment(s) left.")
+
+    def close(self):
+        """Flush everything still buffered, stop the background writer and close the spool."""
+        with self.write_cond:
+            writer = self.writer_thread
+            self.writer_stopping = True
+            self.write_cond.notify_all()
+        if writer is not None:
+            writer.join()
+        self.writer_thread = None
+        logging.info(
+            f"🛢️ Write buffer closed: {self.stats['flushed_docs']} record(s) in {self.stats['flushed_batches']} batch(es), "
+            f"{self.stats['failed_docs']} failed, {self.stats['rejected_docs']} rejected."
+        )
+        if self.spool is not None:
+            self.replay_stopping.set()
+            if self.replay_thread is not None:
+                self.replay_thread.join()
+            self.spool.close()
+            stats = self.spool.stats
+            logging.info(f"🛢️ Spool closed: {stats['spooled_docs']} record(s) spooled, {stats['replayed_docs']} replayed, "
+                         f"{self.spool.size / 1e6:.1f} MB in {len(self.spool)} segment(s) left for the next start.")
+
     def insert_test(self, data):
         """Insert data into the test collection."""
         if self.test_col is None:
@@ -111,7 +779,16 @@ class Database:
 
 # Create a single instance of the Database class
 db = Database()
+metrics.QUEUE_DEPTH.labels("db_buffer").set_function(lambda: db.pending_docs)
 
 if __name__ == "__main__":
-    db.connect()
+    parser = argparse.ArgumentParser(description="Edge database maintenance.")
+    parser.add_argument("--migrate-dates", action="store_true", help="convert string dates of stored documents to datetimes")
+    parser.add_argument("--migrate-buckets", action="store_true", help="convert stored window documents into the bucket layout")
+    parser.add_argument("--delete-source", action="store_true", help="with --migrate-buckets: delete converted documents (resumable)")
+    args = parser.parse_args()
+    if args.migrate_dates:
+        db.migrate_dates()
+    if args.migrate_buckets:
+        db.migrate_buckets(delete_source=args.delete_source)
 
@@ -0,0 +1,29 @@
+import sys
+import logging
+import tensorflow as tf
+import settings
+import inference
+
+# Configure Logging
+logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s - %(levelname)s - %(message)s")
+
+def export(output_path=inference.TFLITE_MODEL_PATH):
+    """
+    Convert the Keras inference model into a float32 `.tflite` model for INFERENCE_BACKEND=tflite.
+    No quantization is applied, so the TFLite backend predicts the same labels as the Keras one.
+    """
+    model = tf.keras.models.load_model(
+        inference.MODEL_PATH,
+        custom_objects={"f1_m": inference.f1_m, "precision_m": inference.precision_m, "recall_m": inference.recall_m},
+    )
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    # LSTM layers need select TF ops and keep their TensorList ops unlowered
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+    converter._experimental_lower_tensor_list_ops = False
+
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+    logging.info(f"✅ Exported '{settings.INFERENCE_MODEL}' to {output_path}.")
+
+if __name__ == "__main__":
+    export(*sys.argv[1:])
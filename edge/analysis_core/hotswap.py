@@ -0,0 +1,164 @@
+import os
+import re
+import json
+import logging
+import threading
+import paho.mqtt.client as mqtt
+import settings
+import registry
+import metrics
+import pubsub
+
+# Configure Logging
+logging.basicConfig(
+    level=settings.LOG_LEVEL,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Load Settings
+MODEL_WATCH_INTERVAL = settings.MODEL_WATCH_INTERVAL
+MODEL_ADMIN_TOPIC = settings.MODEL_ADMIN_TOPIC
+STATUS_TOPIC = f"{MODEL_ADMIN_TOPIC}/status"
+
+# Variants name files inside models/, so they are plain file names without a path
+VARIANT_PATTERN = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]*")
+
+# Every worker process subscribes itself (no shared subscription), so a command swaps the models of all workers
+admin_client = mqtt.Client(f"{settings.CLIENT_ID}_Models{pubsub.CLIENT_SUFFIX}")
+stopping = threading.Event()
+watch_thread = None
+pending_stamps = {}  # Model -> file stamp seen by the last check, until it is stable
+rejected_stamps = {}  # Model -> file stamp that failed to load, not retried until the files change again
+
+def swappable():
+    """Models of the enabled stages that can be swapped (those loaded from a variant's files)."""
+    return [name for name, entry in registry.loaders.items() if entry["enabled"] and entry["variant"] is not None]
+
+def swap(changes, trigger):
+    """Swap models (see `registry.swap`), count the outcome and report the active versions."""
+    result = "swapped" if registry.swap(changes) else "failed"
+    metrics.MODEL_SWAPS.labels(trigger, result).inc()
+    if MODEL_ADMIN_TOPIC:
+        status = {"client_id": settings.CLIENT_ID, "worker": settings.WORKER_INDEX, "trigger": trigger,
+                  "result": result, "modelVersion": registry.versions()}
+        admin_client.publish(STATUS_TOPIC, json.dumps(status))
+    return result == "swapped"
+
+def changed_models():
+    """
+    Loaded models whose files changed on disk. A change counts once every file exists and its
+    size and mtime stayed the same for one check, so a model that is still being copied is not read.
+    """
+    model_set = registry.current()
+    changed = []
+    for name in swappable():
+        if name not in model_set.models:
+            continue  # Not loaded yet: it is read from disk on first use anyway
+        stamp = registry.stamp(registry.files(name))
+        if stamp == model_set.stamps.get(name) or stamp == rejected_stamps.get(name) or None in stamp:
+            pending_stamps.pop(name, None)
+        elif pending_stamps.get(name) == stamp:
+            del pending_stamps[name]
+            changed.append(name)
+        else:
+            pending_stamps[name] = stamp
+    return changed
+
+def watch():
+    """Check the files of the active models every MODEL_WATCH_INTERVAL seconds and reload the changed ones."""
+    while not stopping.wait(MODEL_WATCH_INTERVAL):
+        try:
+            changed = changed_models()
+            if not changed:
+                continue
+            logging.info(f"📂 Model file(s) of {', '.join(changed)} changed on disk. Reloading...")
+            stamps = {name: registry.stamp(registry.files(name)) for name in changed}
+            if not swap(dict.fromkeys(changed), "file"):
+                rejected_stamps.update(stamps)
+        except Exception as e:
+            logging.error(f"❌ [ERROR] Model file check failed: {e}", exc_info=True)
+
+def parse_command(payload):
+    """
+    Parse a model command: {"<model>": "<variant>", ..., "reload": ["<model>", ...] or true}, e.g.
+    {"reduction": "PCA_7"} or {"reload": ["outlier"]}. Returns {model: variant, or None to reload its files}.
+    Raises ValueError for unknown models and for variants without model files.
+    """
+    command = json.loads(payload)
+    if not isinstance(command, dict):
+        raise ValueError("expected a JSON object")
+    names = swappable()
+    reload = command.pop("reload", [])
+    if reload is True:
+        reload = names
+    elif isinstance(reload, str):
+        reload = [reload]
+    elif not isinstance(reload, list):
+        raise ValueError("'reload' must be a list of models or true")
+    changes = dict.fromkeys(reload)
+    changes.update({name: str(variant) for name, variant in command.items()})
+    if not changes:
+        raise ValueError("no model to swap")
+
+    for name, variant in changes.items():
+        if name not in names:
+            raise ValueError(f"'{name}' is not a model of an enabled stage (expected one of: {', '.join(names)})")
+        if variant is not None and not VARIANT_PATTERN.fullmatch(variant):
+            raise ValueError(f"'{variant}' is not a model name")
+        paths = registry.files(name, variant)
+        if not paths or not all(os.path.isfile(path) for path in paths):
+            raise ValueError(f"no model files for {name} '{variant or registry.variant(name)}'")
+    return changes
+
+# ✅ Admin Client: On Connect
+def on_connect(client, userdata, flags, rc):
+    if rc == 0:
+        logging.info(f"✅ Subscribed to model commands on {settings.SENSOR_MQTT_BROKER}:{settings.SENSOR_MQTT_PORT} [{MODEL_ADMIN_TOPIC}]")
+        client.subscribe(MODEL_ADMIN_TOPIC)
+    else:
+        logging.error(f"❌ Model command subscription failed with code {rc}. Retrying...")
+
+# 📩 Admin Client: On Message (the swap runs in the background, never on the network thread)
+def on_message(client, userdata, message):
+    try:
+        changes = parse_command(message.payload)
+    except ValueError as e:
+        logging.error(f"❌ Rejected model command on {message.topic}: {e}")
+        metrics.MODEL_SWAPS.labels("admin", "rejected").inc()
+        return
+    requested = ", ".join(f"{name}={variant or 'reload'}" for name, variant in changes.items())
+    logging.info(f"📨 Model command received ({requested}). Loading in the background...")
+    threading.Thread(target=swap, args=(changes, "admin"), daemon=True, name="model-swap").start()
+
+admin_client.on_connect = on_connect
+admin_client.on_message = on_message
+
+def run():
+    """Start the model file watcher and the admin topic subscriber (each only if configured)."""
+    global watch_thread
+    stopping.clear()
+    if MODEL_WATCH_INTERVAL > 0 and (watch_thread is None or not watch_thread.is_alive()):
+        watch_thread = threading.Thread(target=watch, daemon=True, name="model-watch")
+        watch_thread.start()
+    if MODEL_ADMIN_TOPIC:
+        # Reconnects are handled by the network loop
+        admin_client.connect_async(settings.SENSOR_MQTT_BROKER, settings.SENSOR_MQTT_PORT, 60)
+        admin_client.loop_start()
+    if MODEL_WATCH_INTERVAL > 0 or MODEL_ADMIN_TOPIC:
+        file_check = f"every {MODEL_WATCH_INTERVAL}s" if MODEL_WATCH_INTERVAL > 0 else "off"
+        logging.info(f"✅ Model hot swap enabled (file check: {file_check}, "
+                     f"admin topic: {MODEL_ADMIN_TOPIC or 'off'}, active: {registry.versions() or 'none'}).")
+    else:
+        logging.warning("⚠️ Model hot swap is disabled.")
+
+def stop():
+    """Stop the file watcher and disconnect the admin client."""
+    stopping.set()
+    if MODEL_ADMIN_TOPIC:
+        admin_client.loop_stop()
+        admin_client.disconnect()
+
+# Allow module execution for debugging
+if __name__ == "__main__":
+    run()
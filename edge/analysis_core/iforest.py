@@ -0,0 +1,122 @@
+import numpy as np
+
+def average_path_length(n_samples):
+    """
+    Average path length of an unsuccessful search in a binary search tree of `n_samples` nodes,
+    the depth correction of the Isolation Forest paper. Same formula and operation order as
+    sklearn's private `_average_path_length`, kept here so the scores do not depend on it.
+    """
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    path_length = np.zeros(n_samples.shape)
+    path_length[n_samples == 2] = 1.0
+    deep = n_samples > 2
+    path_length[deep] = 2.0 * (np.log(n_samples[deep] - 1.0) + np.euler_gamma) - 2.0 * (n_samples[deep] - 1.0) / n_samples[deep]
+    return path_length
+
+class CompiledForest:
+    """
+    An sklearn IsolationForest flattened into contiguous NumPy node arrays.
+    All trees are traversed together with vectorized steps, and the scores are
+    accumulated in the same order and precision as sklearn, so `predict` matches
+    `IsolationForest.predict` exactly.
+    """
+
+    def __init__(self, model):
+        # Models pickled by older scikit-learn releases only have `n_features_`
+        n_features = getattr(model, "n_features_in_", None) or model.__dict__["n_features_"]
+        # Trees only see a column subset when max_features < 1.0
+        subsample_features = model._max_features != n_features
+        features, thresholds, left, right, leaf_depth, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for tree, tree_features in zip(model.estimators_, model.estimators_features_):
+            nodes = tree.tree_
+            is_leaf = nodes.children_left == -1
+            node_ids = np.arange(nodes.node_count)
+
+            # Leaves point to themselves, so extra traversal steps leave them in place
+            left.append(np.where(is_leaf, node_ids, nodes.children_left) + offset)
+            right.append(np.where(is_leaf, node_ids, nodes.children_right) + offset)
+            node_features = np.maximum(nodes.feature, 0)
+            if subsample_features:
+                node_features = np.asarray(tree_features)[node_features]
+            features.append(np.where(is_leaf, 0, node_features))
+            thresholds.append(nodes.threshold)
+
+            # Number of nodes on the path to every node (sklearn's decision_path().sum())
+            path_nodes = np.ones(nodes.node_count, dtype=np.int64)
+            for node in node_ids:
+                if not is_leaf[node]:
+                    path_nodes[nodes.children_left[node]] = path_nodes[node] + 1
+                    path_nodes[nodes.children_right[node]] = path_nodes[node] + 1
+            # Per-leaf contribution to the depth, computed exactly like sklearn does
+            leaf_depth.append(path_nodes + average_path_length(nodes.n_node_samples) - 1.0)
+
+            roots.append(offset)
+            offset += nodes.node_count
+            max_depth = max(max_depth, int(path_nodes.max()) - 1)
+
+        self.n_features = n_features
+        self.features = np.concatenate(features).astype(np.intp)
+        self.thresholds = np.concatenate(thresholds)
+        self.left = np.concatenate(left).astype(np.intp)
+        self.right = np.concatenate(right).astype(np.intp)
+        self.leaf_depth = np.concatenate(leaf_depth)
+        self.roots = np.array(roots, dtype=np.intp)
+        self.max_depth = max_depth
+        self.offset = model.offset_
+        self.denominator = len(model.estimators_) * average_path_length([model.max_samples_])
+
+    def score_samples(self, X):
+        """Same as `IsolationForest.score_samples`: the lower, the more abnormal."""
+        # sklearn's trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.features[nodes]] <= self.thresholds[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        # Sequential sum over the trees, in sklearn's order
+        depths = np.cumsum(self.leaf_depth[nodes], axis=1)[:, -1] if len(self.roots) else np.zeros(len(X))
+        scores = 2 ** (-np.divide(depths, self.denominator, out=np.ones_like(depths), where=self.denominator != 0))
+        return -scores
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset
+
+    def predict(self, X):
+        """Same as `IsolationForest.predict`: 1 for inliers, -1 for outliers."""
+        is_inlier = np.ones(len(X), dtype=int)
+        is_inlier[self.decision_function(X) < 0] = -1
+        return is_inlier
+
+    def validate_windows(self, windows, min_valid, early_exit=True, chunk_size=5):
+        """
+        Decide for a (batch, window, features) array which windows have at least
+        `min_valid` inlier samples. With `early_exit`, samples are scored in chunks
+        and a window stops being scored as soon as its decision is settled.
+        """
+        batch_size, window_size, n_features = windows.shape
+        if not early_exit:
+            valid_count = np.sum(self.predict(windows.reshape(-1, n_features)).reshape(batch_size, window_size) == 1, axis=1)
+            return valid_count >= min_valid
+
+        valid_count = np.zeros(batch_size, dtype=int)
+        active = np.arange(batch_size)
+        for start in range(0, window_size, chunk_size):
+            chunk = windows[active, start:start + chunk_size]
+            inliers = self.predict(chunk.reshape(-1, n_features)).reshape(len(active), -1) == 1
+            valid_count[active] += inliers.sum(axis=1)
+
+            # Keep scoring only the windows that can still go either way
+            remaining = window_size - (start + chunk.shape[1])
+            unsettled = (valid_count[active] < min_valid) & (valid_count[active] + remaining >= min_valid)
+            active = active[unsettled]
+            if len(active) == 0:
+                break
+        return valid_count >= min_valid
+
+def compile_forest(model):
+    """Flatten a fitted sklearn IsolationForest into a CompiledForest."""
+    return CompiledForest(model)
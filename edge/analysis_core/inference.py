@@ -1,15 +1,15 @@
 import os
 import json
 import logging
-import joblib
+import threading
 import numpy as np
-import pandas as pd
-import tensorflow as tf
 import settings
 import outlier
 import reduction
-from dbmodel import db
-from tensorflow.keras import backend as K
+import registry
+import metrics
+import verification
+from window import group_by_shape, stack
 
 # Configure Logging
 logging.basicConfig(
@@ -20,119 +20,229 @@ logging.basicConfig(
 
 # Load Settings
 INFERENCE_ENABLE = settings.INFERENCE_ENABLE
-STORE_ENABLE = settings.REDUCTION_ENABLE
 SLIDING_WINDOW_SIZE = settings.SLIDING_WINDOW_SIZE
 INFERENCE_MODEL_NAME = settings.INFERENCE_MODEL
+INFERENCE_BACKEND = settings.INFERENCE_BACKEND
 
 # Model Paths
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
-SCALER_PATH = os.path.join(MODEL_DIR, "Scaler.joblib")
+SCALER_NAME = "Scaler"
 MODEL_PATH = os.path.join(MODEL_DIR, f"{INFERENCE_MODEL_NAME}.h5")
+TFLITE_MODEL_PATH = os.path.join(MODEL_DIR, f"{INFERENCE_MODEL_NAME}.tflite")
 
-# Load Scaler Model
-scaler_model = None
-try:
-    scaler_model = joblib.load(SCALER_PATH)
-    logging.info("✅ Scaler model loaded successfully.")
-except FileNotFoundError:
-    logging.error(f"❌ Scaler model not found at {SCALER_PATH}.")
-except Exception as e:
-    logging.error(f"❌ Error loading scaler model: {e}")
+def scaler_path(scaler_name):
+    return os.path.join(MODEL_DIR, f"{scaler_name}.joblib")
+
+def model_path(model_name):
+    """File of an inference model for the configured backend."""
+    return os.path.join(MODEL_DIR, f"{model_name}.tflite" if INFERENCE_BACKEND == "tflite" else f"{model_name}.h5")
+
+def load_scaler(scaler_name=SCALER_NAME):
+    """Load the scaler model (called by the model registry)."""
+    path = scaler_path(scaler_name)
+    try:
+        model = registry.load_joblib(path)
+        logging.info(f"✅ Scaler model '{scaler_name}' loaded successfully.")
+        return model
+    except FileNotFoundError:
+        logging.error(f"❌ Scaler model not found at {path}.")
+        return None
 
 # Custom Metrics for Model Loading
 def recall_m(y_true, y_pred):
+    from tensorflow.keras import backend as K
     true_positives = K.sum(K.round(K.clip(y_true * y_pred, 0, 1)))
     possible_positives = K.sum(K.round(K.clip(y_true, 0, 1)))
     return true_positives / (possible_positives + K.epsilon())
 
 def precision_m(y_true, y_pred):
+    from tensorflow.keras import backend as K
     true_positives = K.sum(K.round(K.clip(y_true * y_pred, 0, 1)))
     predicted_positives = K.sum(K.round(K.clip(y_pred, 0, 1)))
     return true_positives / (predicted_positives + K.epsilon())
 
 def f1_m(y_true, y_pred):
+    from tensorflow.keras import backend as K
     precision = precision_m(y_true, y_pred)
     recall = recall_m(y_true, y_pred)
     return 2 * ((precision * recall) / (precision + recall + K.epsilon()))
 
-# Load Inference Model
-inference_model = None
-try:
-    inference_model = tf.keras.models.load_model(
-        MODEL_PATH, custom_objects={"f1_m": f1_m, "precision_m": precision_m, "recall_m": recall_m}
-    )
-    logging.info(f"✅ Inference model '{INFERENCE_MODEL_NAME}' loaded successfully.")
-except FileNotFoundError:
-    logging.error(f"❌ Inference model '{INFERENCE_MODEL_NAME}' not found at {MODEL_PATH}.")
-except Exception as e:
-    logging.error(f"❌ Error loading inference model: {e}")
+class TFLiteModel:
+    """
+    Runs a converted `.tflite` model with the same `predict` call as a Keras model.
+    Every worker thread gets its own interpreter, since interpreters are not thread-safe.
+    """
+
+    def __init__(self, model_path, batch_size):
+        # The converted CNN_LSTM models use select TF ops (Flex), which the
+        # standalone tflite_runtime interpreter cannot run.
+        import tensorflow as tf
+        self.interpreter_class = tf.lite.Interpreter
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.local = threading.local()
+        self.get_interpreter()  # Fail early if the model cannot be loaded
+
+    def get_interpreter(self):
+        """Return this thread's interpreter, creating it with tensors pre-allocated for a full batch."""
+        state = getattr(self.local, "state", None)
+        if state is None:
+            interpreter = self.interpreter_class(model_path=self.model_path)
+            input_details = interpreter.get_input_details()[0]
+            output_details = interpreter.get_output_details()[0]
+            input_shape = [self.batch_size, *input_details["shape"][1:]]
+            interpreter.resize_tensor_input(input_details["index"], input_shape)
+            interpreter.allocate_tensors()
+            state = self.local.state = {
+                "interpreter": interpreter,
+                "input_index": input_details["index"],
+                "input_dtype": input_details["dtype"],
+                "output_index": output_details["index"],
+                "batch_size": self.batch_size,
+            }
+        return state
+
+    def predict(self, data, batch_size=None, verbose=0):
+        """Run the whole batch through one interpreter call."""
+        state = self.get_interpreter()
+        interpreter = state["interpreter"]
+        data = np.asarray(data, dtype=state["input_dtype"])
+
+        # Resize the input only when the batch size changes
+        if len(data) != state["batch_size"]:
+            interpreter.resize_tensor_input(state["input_index"], data.shape)
+            interpreter.allocate_tensors()
+            state["batch_size"] = len(data)
+
+        interpreter.set_tensor(state["input_index"], data)
+        interpreter.invoke()
+        return interpreter.get_tensor(state["output_index"]).copy()
+
+def load_model(model_name=INFERENCE_MODEL_NAME):
+    """Load an inference model for the configured backend (called by the model registry)."""
+    path = model_path(model_name)
+    if not os.path.exists(path):
+        logging.error(f"❌ Inference model '{model_name}' not found at {path}.")
+        return None
+
+    if INFERENCE_BACKEND == "tflite":
+        model = TFLiteModel(path, settings.BATCH_SIZE)
+    else:
+        import tensorflow as tf  # Only imported when inference is enabled
+        model = tf.keras.models.load_model(
+            path, custom_objects={"f1_m": f1_m, "precision_m": precision_m, "recall_m": recall_m}
+        )
+    logging.info(f"✅ Inference model '{model_name}' loaded successfully ({INFERENCE_BACKEND} backend).")
+    return model
+
+def warmup(model):
+    """
+    Run a dummy window through the scaler, reduction and inference models (called by the model
+    registry before a swap), so a new model is compiled and checked against the others before it serves.
+    """
+    scaler_model = registry.get("scaler")
+    if scaler_model is None:
+        raise ValueError("the scaler model is not available")
+    n_features = getattr(scaler_model, "n_features_in_", None) or len(scaler_model.scale_)
+    samples = np.zeros((1, SLIDING_WINDOW_SIZE, n_features), dtype=np.float32)
+    scaled_data = scaler_model.transform(samples.reshape(-1, samples.shape[-1])).reshape(samples.shape)
+    reduced_data = reduction.inference_reduce_batch(scaled_data, samples)
+    if reduced_data is None:
+        raise ValueError("the reduction model failed on the dummy window")
+    model.predict(reduced_data, batch_size=1, verbose=0)
+
+# Register Scaler and Inference Models (loaded only when inference is enabled)
+registry.register("scaler", load_scaler, INFERENCE_ENABLE, SCALER_NAME, lambda name: [scaler_path(name)])
+registry.register("inference", load_model, INFERENCE_ENABLE, INFERENCE_MODEL_NAME, lambda name: [model_path(name)], warmup)
 
 def run():
     """Initialize inference module."""
-    if INFERENCE_ENABLE and inference_model:
-        logging.info(f"✅ Inference module enabled with model '{INFERENCE_MODEL_NAME}'.")
+    if INFERENCE_ENABLE and registry.get("inference"):
+        logging.info(f"✅ Inference module enabled with model '{registry.variant('inference')}' ({INFERENCE_BACKEND} backend).")
+        verification.run()
     else:
         logging.warning("⚠️ Inference module is disabled or the model is unavailable.")
 
-def scale_data(data):
-    """Scale input data using the pre-loaded scaler model."""
+def scale_batch(windows):
+    """
+    Scale same-shaped windows using the pre-loaded scaler model.
+    Results are cached on each window; returns the stacked (batch, window, features) array.
+    """
+    scaler_model = registry.get("scaler")
     if scaler_model is None:
         logging.error("❌ Scaler model is not available. Cannot scale data.")
         return None
 
-    try:
-        converted_data = pd.DataFrame(data["data"]).T
-        return scaler_model.transform(converted_data)
-    except Exception as e:
-        logging.error(f"❌ Error in scaling data: {e}")
-        return None
-
-def feed(data):
+    missing = [window for window in windows if window.scaled is None]
+    if missing:
+        try:
+            samples = stack(missing)
+            n_features = samples.shape[-1]
+            with metrics.timed("scale"):
+                scaled_data = scaler_model.transform(samples.reshape(-1, n_features)).reshape(samples.shape)
+        except Exception as e:
+            logging.error(f"❌ Error in scaling data: {e}")
+            return None
+        for window, scaled in zip(missing, scaled_data):
+            window.scaled = scaled
+    return stack(windows, "scaled")
+
+def feed_batch(windows):
     """
-    Perform inference on incoming sensor data.
+    Perform inference on a batch of incoming sensor windows.
     Includes outlier detection, dimensionality reduction, and prediction.
+    Only the windows picked by the verification policy are re-inferred; the others keep the sensor's label.
     """
     if not INFERENCE_ENABLE:
-        #logging.warning("⚠️ Inference is disabled. Skipping processing.")
         return
 
+    inference_model = registry.get("inference")
     if inference_model is None:
         logging.error("❌ Inference model is not loaded. Cannot perform predictions.")
         return
 
-    if "data" not in data or not isinstance(data["data"], dict):
-        logging.error("❌ Invalid data format for inference. Skipping processing.")
-        return
-
-    # Step 1: Scale Data
-    scaled_data = scale_data(data)
-    if scaled_data is None:
-        logging.error("❌ Error in scaling data. Skipping inference.")
-        return
+    invalid_count = sum(window.samples is None for window in windows)
+    if invalid_count:
+        logging.error(f"❌ Invalid data format for inference in {invalid_count} message(s). Skipping processing.")
+
+    # Step 0: Windows shed under overload keep the sensor's label; of the others, only the sampled ones are re-inferred
+    windows = verification.select([window for window in windows if not window.skip_inference])
+
+    for group in group_by_shape(windows):
+        # Step 1: Scale Data
+        scaled_data = scale_batch(group)
+        if scaled_data is None:
+            logging.error("❌ Error in scaling data. Skipping inference.")
+            continue
+
+        # Step 2: Outlier Detection
+        valid_mask = outlier.inference_feed_batch(scaled_data)
+        if not valid_mask.any():
+            logging.info("✅ No significant outliers detected. Skipping further processing.")
+            continue
+        valid_windows = [window for window, valid in zip(group, valid_mask) if valid]
+
+        # Step 3: Dimensionality Reduction
+        with metrics.timed("reduction"):
+            reduced_data = reduction.inference_reduce_batch(scaled_data[valid_mask], stack(valid_windows))
+        if reduced_data is None:
+            logging.error("❌ Error in dimensionality reduction. Skipping inference.")
+            continue
+        for window, reduced in zip(valid_windows, reduced_data):
+            window.reduced = reduced
+
+        # Step 4: Perform Prediction
+        try:
+            with metrics.timed("predict"):
+                prediction = inference_model.predict(reduced_data, batch_size=len(reduced_data), verbose=0)
+            for window, label in zip(valid_windows, np.argmax(prediction, axis=1)):
+                verification.record(window, int(label))
+                window.message["label"] = int(label)
+                window.message["labelSource"] = "edge"
+            logging.info(f"✅ Inference completed for {len(valid_windows)} window(s).")
+        except Exception as e:
+            logging.error(f"❌ Error during inference prediction: {e}")
 
-    # Step 2: Outlier Detection
-    outlier_result = outlier.inference_feed(scaled_data)
-    if not outlier_result["value"]:
-        logging.info("✅ No significant outliers detected. Skipping further processing.")
-        return
-
-    # Step 3: Dimensionality Reduction
-    reduced_data = reduction.inference_reduce_data(outlier_result["data"])
-    if reduced_data is None:
-        logging.error("❌ Error in dimensionality reduction. Skipping inference.")
-        return
-
-    reduced_data_np = np.expand_dims(reduced_data, axis=0)
-
-    # Step 4: Perform Prediction
-    try:
-        prediction = inference_model.predict(np.array(reduced_data_np), batch_size=1)
-        data["label"] = int(np.argmax(prediction))
-        logging.info(f"✅ Inference completed. Predicted label: {data['label']}")
-    except Exception as e:
-        logging.error(f"❌ Error during inference prediction: {e}")
-        return
-    
 # Allow module execution for debugging
 if __name__ == "__main__":
     run()
@@ -1,19 +1,38 @@
 import logging
 import threading
 import settings
-import pubsub
-import outlier
-import reduction
-import inference
 import time
 
 # Configure logging
 logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s - %(levelname)s - %(message)s")
 
-def main():
+def main(inbox=None):
+    """
+    Run the pipeline in this process. `inbox` is set for workers that get their
+    sensor messages from the supervisor instead of subscribing themselves.
+    """
+    # Imported here, so a supervisor process opens no database, spool or MQTT clients of its own
+    import outlier
+    import reduction
+    import inference
+    import registry
+    import hotswap
+    import metrics
+
+    # MQTT forwarder: threaded paho loops, or a single asyncio event loop (only the selected one
+    # is imported, as each creates its MQTT clients and executors on import)
+    if settings.PUBSUB_MODE == "asyncio":
+        import apubsub as forwarder
+    else:
+        import pubsub as forwarder
+
     try:
         logging.info("🚀 Starting Edge Data Processing Pipeline...")
 
+        # Load the models of all enabled stages in parallel
+        logging.info("📦 Loading models for enabled stages...")
+        registry.load_all()
+
         # Initialize Inference Module
         logging.info("🧠 Initializing Inference Module...")
         inference.run()
@@ -26,18 +45,33 @@ def main():
         logging.info("📉 Initializing Dimensionality Reduction Module...")
         reduction.run()
 
+        # Watch the model files and the admin topic for new model versions
+        hotswap.run()
+
+        # Start the Prometheus metrics endpoint
+        if settings.METRICS_ENABLE:
+            metrics.run()
+
         # Start MQTT PubSub Module in a separate thread
-        logging.info("📡 Starting MQTT PubSub Module in a background thread...")
-        mqtt_thread = threading.Thread(target=pubsub.run, daemon=True)
+        logging.info(f"📡 Starting MQTT PubSub Module ({settings.PUBSUB_MODE}) in a background thread...")
+        mqtt_thread = threading.Thread(target=forwarder.run, kwargs={"inbox": inbox}, daemon=True)
         mqtt_thread.start()
 
         # Keep main process running
         while True:
             time.sleep(1)
 
+    except KeyboardInterrupt:
+        hotswap.stop()
+        forwarder.stop()
     except Exception as e:
         logging.error(f"❌ Critical Error: {e}", exc_info=True)
 
 if __name__ == "__main__":
-    main()
+    if settings.WORKER_PROCESSES > 1:
+        # Scale-out mode: one pipeline per worker process
+        import supervisor
+        supervisor.run()
+    else:
+        main()
 
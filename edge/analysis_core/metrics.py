@@ -0,0 +1,251 @@
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import settings
+
+# Configure Logging
+logging.basicConfig(
+    level=settings.LOG_LEVEL,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Registered metrics, in exposition order
+metrics = []
+_lock = threading.Lock()
+
+# Per-device labels are capped: devices beyond METRICS_MAX_DEVICES share the "other" label
+OTHER_DEVICE = "other"
+_devices = set()
+
+# Latency buckets in seconds, from sub-millisecond decodes to slow MongoDB writes
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+server = None
+
+class CounterValue:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+class GaugeValue(CounterValue):
+    def __init__(self):
+        super().__init__()
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Read the value from `function` at scrape time instead (e.g. a queue size)."""
+        self.function = function
+
+    def samples(self, name, labels):
+        yield name, labels, self.function() if self.function is not None else self.value
+
+class HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self, name, labels):
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            yield f"{name}_bucket", labels + (("le", format_value(bound)),), cumulative
+        yield f"{name}_sum", labels, total
+        yield f"{name}_count", labels, cumulative
+
+class Metric:
+    """A named metric with optional labels. Every label combination gets its own value."""
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        if not self.labelnames:
+            self.labels()  # Exposed from the start
+        with _lock:
+            metrics.append(self)
+
+    def new_value(self):
+        raise NotImplementedError
+
+    def labels(self, *labelvalues):
+        """Return the value of one label combination, creating it on first use."""
+        value = self.values.get(labelvalues)
+        if value is None:
+            with _lock:
+                value = self.values.setdefault(labelvalues, self.new_value())
+        return value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labelvalues, value in list(self.values.items()):
+            for name, labels, sample in value.samples(self.name, tuple(zip(self.labelnames, labelvalues))):
+                lines.append(f"{name}{format_labels(labels)} {format_value(sample)}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def new_value(self):
+        return CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def new_value(self):
+        return GaugeValue()
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def new_value(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+def device_label(device):
+    """Label value for a device, keeping the set of device labels bounded."""
+    device = str(device)
+    if device in _devices:
+        return device
+    with _lock:
+        if len(_devices) < settings.METRICS_MAX_DEVICES:
+            _devices.add(device)
+            return device
+    return OTHER_DEVICE
+
+# Pipeline metrics
+STAGE_SECONDS = Histogram("analysis_stage_seconds", "Time spent per pipeline stage call (decode: per message, other stages: per batch).", ["stage"])
+MESSAGES = Counter("analysis_messages_total", "Sensor messages decoded.", ["device"])
+OUTLIER_DROPS = Counter("analysis_outlier_drops_total", "Windows discarded by outlier validation.", ["device"])
+BATCH_WINDOWS = Histogram("analysis_batch_windows", "Windows per analyzed batch.", buckets=SIZE_BUCKETS)
+DB_ERRORS = Counter("analysis_db_errors_total", "Documents that could not be written to MongoDB.", ["reason"])
+SYNC_RECORDS = Histogram("analysis_sync_records", "Training records per published cloud sync message.", buckets=SIZE_BUCKETS)
+SYNC_SKIPPED = Counter("analysis_sync_skipped_records_total", "Unread documents the watermark sync passed without publishing them.")
+QUEUE_DEPTH = Gauge("analysis_queue_depth", "Items waiting in the pipeline queues.", ["queue"])
+SHED_WINDOWS = Counter("analysis_shed_windows_total", "Windows dropped or sent past inference by the ingest shedding policy.", ["device", "policy"])
+
+# MongoDB spool metrics
+SPOOLED_DOCS = Counter("analysis_spooled_documents_total", "Documents written to the disk spool instead of MongoDB.", ["reason"])
+REPLAYED_DOCS = Counter("analysis_replayed_documents_total", "Spooled documents replayed into MongoDB.")
+SPOOL_BYTES = Gauge("analysis_spool_bytes", "Bytes held in the disk spool.")
+SPOOL_SEGMENTS = Gauge("analysis_spool_segments", "Segment files in the disk spool.")
+
+# Label verification metrics
+VERIFIED_WINDOWS = Counter("analysis_verified_windows_total", "Sensor labels re-checked by the edge model.", ["device", "result"])
+TRUSTED_WINDOWS = Counter("analysis_trusted_windows_total", "Windows stored with the sensor's label, without edge inference.", ["device"])
+VERIFY_AGREEMENT = Gauge("analysis_verify_agreement", "Moving agreement rate of sensor and edge labels.", ["device"])
+VERIFY_SAMPLING = Gauge("analysis_verify_sampling", "Share of a device's windows re-checked by the edge model.", ["device"])
+
+# Model hot swap metrics
+MODEL_SWAPS = Counter("analysis_model_swaps_total", "Model swap attempts by trigger (file, admin) and result.", ["trigger", "result"])
+
+# Pre-create the stage series, so they are exposed before the first observation
+stage_timers = {stage: STAGE_SECONDS.labels(stage) for stage in ("decode", "scale", "outlier", "reduction", "predict", "insert")}
+
+@contextmanager
+def timed(stage):
+    """Observe the duration of the `with` block in the stage latency histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_timers[stage].observe(time.perf_counter() - start)
+
+def expose():
+    """Render every metric in the Prometheus text format."""
+    lines = []
+    for metric in list(metrics):
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = expose().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would flood the pipeline log
+
+# 🚀 Start the metrics endpoint (Runnable from Main)
+def run(port=None):
+    """Serve GET /metrics on METRICS_PORT (+ WORKER_INDEX, so worker processes don't collide)."""
+    global server
+    if server is not None:
+        return
+    port = port if port is not None else settings.METRICS_PORT + settings.WORKER_INDEX
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    except OSError as e:
+        logging.error(f"❌ Metrics endpoint could not listen on port {port}: {e}")
+        return
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    logging.info(f"📊 Metrics endpoint listening on :{port}/metrics")
+
+def stop():
+    global server
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        server = None
+
+# Allow module execution for debugging
+if __name__ == "__main__":
+    run()
+    while True:
+        time.sleep(1)
@@ -1,10 +1,11 @@
 import os
 import logging
-import joblib
-import pandas as pd
 import numpy as np
 import settings
-from dbmodel import db
+import registry
+import iforest
+import metrics
+from window import group_by_shape, stack
 
 # Configure Logging
 logging.basicConfig(
@@ -18,100 +19,119 @@ SLIDING_WINDOW_SIZE = settings.SLIDING_WINDOW_SIZE
 OUTLIER_DROP_RATE = settings.OUTLIER_DROP_RATE
 OUTLIER_ENABLE = settings.OUTLIER_ENABLE
 OUTLIER_MODEL_NAME = settings.OUTLIER_MODEL
+OUTLIER_SCORER = settings.OUTLIER_SCORER
+OUTLIER_EARLY_EXIT = settings.OUTLIER_EARLY_EXIT
 
 # Model Path
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
-OUTLIER_MODEL_PATH = os.path.join(MODEL_DIR, f"{OUTLIER_MODEL_NAME}.joblib")
-
-# Load Outlier Model
-outlier_model = None
-try:
-    outlier_model = joblib.load(OUTLIER_MODEL_PATH)
-    logging.info(f"✅ Outlier detection model '{OUTLIER_MODEL_NAME}' loaded successfully.")
-except FileNotFoundError:
-    logging.error(f"❌ Outlier model '{OUTLIER_MODEL_NAME}' not found at {OUTLIER_MODEL_PATH}.")
-except Exception as e:
-    logging.error(f"❌ Error loading outlier model: {e}")
+
+def model_path(model_name):
+    return os.path.join(MODEL_DIR, f"{model_name}.joblib")
+
+def load_model(model_name=OUTLIER_MODEL_NAME):
+    """Load an outlier detection model (called by the model registry)."""
+    path = model_path(model_name)
+    try:
+        model = registry.load_joblib(path)
+        if OUTLIER_SCORER == "compiled" and type(model).__name__ == "IsolationForest":
+            model = iforest.compile_forest(model)
+        logging.info(f"✅ Outlier detection model '{model_name}' loaded successfully ({OUTLIER_SCORER} scorer).")
+        return model
+    except FileNotFoundError:
+        logging.error(f"❌ Outlier model '{model_name}' not found at {path}.")
+        return None
+
+def warmup(model):
+    """Score a dummy window (called by the model registry before a swap)."""
+    # Models pickled by older scikit-learn releases only have `n_features_`
+    n_features = getattr(model, "n_features", None) or getattr(model, "n_features_in_", None) or model.__dict__["n_features_"]
+    validate_batch(np.zeros((1, SLIDING_WINDOW_SIZE, n_features)))
+
+# Register Outlier Model (loaded only when outlier detection is enabled)
+registry.register("outlier", load_model, OUTLIER_ENABLE, OUTLIER_MODEL_NAME, lambda name: [model_path(name)], warmup)
 
 def run():
     """Initialize the outlier detection module."""
-    if OUTLIER_ENABLE and outlier_model:
-        logging.info(f"✅ Outlier detection module enabled with model '{OUTLIER_MODEL_NAME}'.")
+    if OUTLIER_ENABLE and registry.get("outlier"):
+        logging.info(f"✅ Outlier detection module enabled with model '{registry.variant('outlier')}'.")
     else:
         logging.warning("⚠️ Outlier detection module is disabled or the model is unavailable.")
 
-def feed(data):
+def min_valid_samples(window_size):
+    """Smallest number of inliers a window of `window_size` samples needs to pass the drop-rate threshold."""
+    for valid_count in range(window_size + 1):
+        if (valid_count / SLIDING_WINDOW_SIZE) * 100 >= OUTLIER_DROP_RATE:
+            return valid_count
+    return window_size + 1
+
+def validate_batch(windows):
+    """
+    Run outlier detection once over a stacked (batch, window, features) array.
+    Returns a boolean mask marking the windows that pass the drop-rate threshold.
     """
-    Process incoming data and check for outliers before storing it.
+    outlier_model = registry.get("outlier")
+    batch_size, window_size, n_features = windows.shape
+    with metrics.timed("outlier"):
+        if isinstance(outlier_model, iforest.CompiledForest):
+            return outlier_model.validate_windows(windows, min_valid_samples(window_size), early_exit=OUTLIER_EARLY_EXIT)
+
+        data_validation = outlier_model.predict(windows.reshape(-1, n_features))
+    valid_count = np.sum(data_validation.reshape(batch_size, window_size) == 1, axis=1)  # Count valid data points per window
+    return (valid_count / SLIDING_WINDOW_SIZE) * 100 >= OUTLIER_DROP_RATE
+
+def feed_batch(windows):
+    """
+    Check a batch of windows for outliers before storing them.
     If outlier detection is disabled, stores data without validation.
     """
-    if not OUTLIER_ENABLE or outlier_model is None:
+    if not OUTLIER_ENABLE or registry.get("outlier") is None:
         logging.warning("⚠️ Outlier detection is disabled or model is unavailable. Storing data without validation.")
-        data["validation"] = "unchecked"
-        data["outlier_model"] = None
+        for window in windows:
+            window.message["validation"] = "unchecked"
+            window.message["outlier_model"] = None
         return
 
     # Ensure valid data format
-    if "data" not in data or not isinstance(data["data"], dict):
-        logging.error("❌ Invalid data format for outlier detection. Skipping processing.")
-        return
-
-    try:
-        # Convert data to DataFrame
-        converted_data = pd.DataFrame(data["data"]).T.to_numpy()
-
-        # Ensure valid data for the model
-        if converted_data.size == 0 or converted_data.shape[1] == 0:
-            logging.warning("⚠️ Received empty or invalid data for outlier detection. Skipping processing.")
-            return
-
-        # Detect outliers
-        data_validation = outlier_model.predict(converted_data)
-        valid_count = np.sum(data_validation == 1)  # Count valid data points
-
-        # Check validity threshold
-        if (valid_count / SLIDING_WINDOW_SIZE) * 100 >= OUTLIER_DROP_RATE:
-            data["validation"] = "checked"
-            data["outlier_model"] = OUTLIER_MODEL_NAME
-            data["processed"] = False
-            #logging.info("✅ Data passed outlier detection and was stored.")
-        else:
-            logging.warning("❌ Data failed outlier validation and was discarded.")
-
-    except Exception as e:
-        logging.error(f"❌ Error during outlier detection processing: {e}", exc_info=True)
-
-def inference_feed(data):
+    invalid_count = sum(window.samples is None for window in windows)
+    if invalid_count:
+        logging.error(f"❌ Invalid data format for outlier detection in {invalid_count} message(s). Skipping processing.")
+
+    for group in group_by_shape(windows):
+        try:
+            # Detect outliers and check validity threshold
+            passed = validate_batch(stack(group))
+            for window, is_valid in zip(group, passed):
+                if is_valid:
+                    window.message["validation"] = "checked"
+                    window.message["outlier_model"] = registry.variant("outlier")
+                    window.message["processed"] = False
+            if not passed.all():
+                for window, is_valid in zip(group, passed):
+                    if not is_valid:
+                        metrics.OUTLIER_DROPS.labels(metrics.device_label(window.device)).inc()
+                logging.warning(f"❌ {int((~passed).sum())} window(s) failed outlier validation and were discarded.")
+
+        except Exception as e:
+            logging.error(f"❌ Error during outlier detection processing: {e}", exc_info=True)
+
+def inference_feed_batch(windows):
     """
-    Perform outlier detection for inference.
-    Returns {"value": True, "data": data} if valid, else {"value": False, "data": None}.
+    Perform outlier detection for inference on a stacked (batch, window, features) array.
+    Returns a boolean mask of the windows that are valid for inference.
     """
-    if not OUTLIER_ENABLE or outlier_model is None:
+    if not OUTLIER_ENABLE or registry.get("outlier") is None:
         logging.error("❌ Outlier model is not available. Cannot perform inference.")
-        return {"value": False, "data": None}
+        return np.zeros(len(windows), dtype=bool)
 
-    try:
-        # Convert input to DataFrame if necessary
-        if isinstance(data, np.ndarray):
-            data = pd.DataFrame(data)
-
-        if data.empty or data.shape[1] == 0:
-            logging.warning("⚠️ Empty or invalid input for outlier detection inference.")
-            return {"value": False, "data": None}
-
-        # Perform outlier detection
-        data_validation = outlier_model.predict(data)
-        valid_count = np.sum(data_validation == 1)
-
-        # Check validity threshold
-        if (valid_count / SLIDING_WINDOW_SIZE) * 100 >= OUTLIER_DROP_RATE:
-            return {"value": True, "data": data}
-        else:
-            return {"value": False, "data": None}
+    if windows.size == 0 or windows.shape[-1] == 0:
+        logging.warning("⚠️ Empty or invalid input for outlier detection inference.")
+        return np.zeros(len(windows), dtype=bool)
 
+    try:
+        return validate_batch(windows)
     except Exception as e:
         logging.error(f"❌ Error during outlier detection inference: {e}", exc_info=True)
-        return {"value": False, "data": None}
+        return np.zeros(len(windows), dtype=bool)
 
 # Allow module execution for debugging
 if __name__ == "__main__":
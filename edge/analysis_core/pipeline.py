@@ -0,0 +1,135 @@
+import time
+import logging
+import threading
+import settings
+import inference
+import outlier
+import metrics
+import registry
+import shedding
+import verification
+from dbmodel import db
+
+# Configure Logging
+logging.basicConfig(
+    level=settings.LOG_LEVEL,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Load Settings
+BATCH_SIZE = max(1, settings.BATCH_SIZE)
+BATCH_FLUSH_INTERVAL = settings.BATCH_FLUSH_MS / 1000  # Convert ms to seconds
+
+# Bounded per-device queues between the MQTT network thread and the batch worker
+buffers = shedding.DeviceBuffers()
+condition = threading.Condition()  # Guards `buffers`; notified when windows arrive or space frees up
+stopping = False  # Set by `stop`: the worker drains the queues and exits
+worker_thread = None
+metrics.QUEUE_DEPTH.labels("ingest").set_function(lambda: len(buffers))
+
+def enqueue(window):
+    """
+    Hand a decoded window over to the batch worker. Never blocks the MQTT thread: on overflow the
+    shedding policy drops or degrades windows (except SHED_POLICY=block, which waits for space).
+    """
+    with condition:
+        if buffers.policy == "block":
+            while buffers.full():
+                condition.wait()
+        buffers.put(window)
+        condition.notify_all()
+
+def collect_batch():
+    """
+    Wait for the first window, then keep draining until BATCH_SIZE windows
+    are collected or BATCH_FLUSH_MS has passed. Devices are served in turn.
+    Returns (batch, stop_requested).
+    """
+    with condition:
+        while not len(buffers):
+            if stopping:
+                return [], True
+            condition.wait()
+
+        batch = [buffers.get()]
+        deadline = time.monotonic() + BATCH_FLUSH_INTERVAL
+        while len(batch) < BATCH_SIZE:
+            window = buffers.get()
+            if window is not None:
+                batch.append(window)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or stopping:
+                break
+            condition.wait(remaining)
+        condition.notify_all()  # Space for a blocked producer
+        return batch, stopping and not len(buffers)
+
+def analyze_batch(batch):
+    """
+    Run inference and outlier detection once for a whole batch of windows. Returns the documents to store.
+    The whole batch runs on one model set (a model swap takes effect with the next batch), whose versions
+    are stored with every document.
+    """
+    metrics.BATCH_WINDOWS.observe(len(batch))
+
+    # Sensor labels in the edge model's classes, also when inference is disabled
+    verification.normalize(batch)
+
+    with registry.pinned():
+        # Step 1: Pass Data to Inference Module
+        inference.feed_batch(batch)
+
+        # Step 2: Pass Processed Data to Outlier Detection Module
+        outlier.feed_batch(batch)
+
+        model_version = registry.versions()
+    for window in batch:
+        window.message["modelVersion"] = model_version
+
+    return [window.to_document(packed=db.bucketed) for window in batch]
+
+def process_batch(batch):
+    """Run inference, outlier detection and storage once for a whole batch of windows."""
+    # Step 3: Store Processed Data in MongoDB (write-behind buffer)
+    db.write(analyze_batch(batch))
+
+def worker():
+    """Drain the ingest queue and process it batch by batch."""
+    while True:
+        batch, stop_requested = collect_batch()
+        if batch:
+            try:
+                process_batch(batch)
+            except Exception as e:
+                logging.error(f"❌ [ERROR] Failed to process batch of {len(batch)} window(s): {e}", exc_info=True)
+        if stop_requested:
+            break
+
+def run():
+    """Start the batch worker thread."""
+    global worker_thread, stopping
+    if worker_thread is not None and worker_thread.is_alive():
+        return
+    stopping = False
+    worker_thread = threading.Thread(target=worker, daemon=True)
+    worker_thread.start()
+    logging.info(f"✅ Batch pipeline started (batch size: {BATCH_SIZE}, flush interval: {settings.BATCH_FLUSH_MS} ms, "
+                 f"overflow policy: {buffers.policy}).")
+
+def stop():
+    """Flush the pending windows and stop the batch worker."""
+    global stopping
+    if worker_thread is None:
+        return
+    with condition:
+        stopping = True
+        condition.notify_all()
+    worker_thread.join()
+    db.close()
+    logging.info("✅ Batch pipeline stopped.")
+
+# Allow module execution for debugging
+if __name__ == "__main__":
+    run()
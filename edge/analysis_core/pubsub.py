@@ -2,16 +2,21 @@ import time
 import json
 import threading
 import logging
+import numpy as np
 import paho.mqtt.client as mqtt
 import settings
-import inference
 import reduction
-import outlier
+import registry
+import pipeline
+import codec
+import metrics
+from window import Window
 from dbmodel import db  # Import Database instance
-from datetime import datetime
+from bson import ObjectId
+from datetime import datetime, timedelta
 
-client_subscriber = mqtt.Client(f"{settings.CLIENT_ID}_Subscriber")
-client_publisher = mqtt.Client(f"{settings.CLIENT_ID}_Publisher")
+# Worker processes need their own MQTT client ids
+CLIENT_SUFFIX = f"_{settings.WORKER_INDEX}" if settings.WORKER_PROCESSES > 1 else ""
 
 active_sensors = set()
 
@@ -23,51 +28,67 @@ logging.basicConfig(
 )
 
 # Initialize MQTT clients
-client_subscriber = mqtt.Client(f"{settings.CLIENT_ID}_Subscriber")
-client_publisher = mqtt.Client(f"{settings.CLIENT_ID}_Publisher")
+client_subscriber = mqtt.Client(f"{settings.CLIENT_ID}_Subscriber{CLIENT_SUFFIX}")
+client_publisher = mqtt.Client(f"{settings.CLIENT_ID}_Publisher{CLIENT_SUFFIX}")
+
+def subscription_topic(topic):
+    """Workers sharing the sensor topics subscribe through an MQTT shared subscription."""
+    if settings.WORKER_PROCESSES > 1 and settings.WORKER_SHARDING == "shared":
+        return f"$share/{settings.WORKER_SHARED_GROUP}/{topic}"
+    return topic
 
 # ✅ Subscriber: On Connect
 def on_connect_subscriber(client, userdata, flags, rc):
     if rc == 0:
-        logging.info(f"✅ Subscribed to {settings.SENSOR_MQTT_BROKER}:{settings.SENSOR_MQTT_PORT} [{settings.SENSOR_MQTT_TOPIC}]")
-        client.subscribe(settings.SENSOR_MQTT_TOPIC)
+        topic = subscription_topic(settings.SENSOR_MQTT_TOPIC)
+        logging.info(f"✅ Subscribed to {settings.SENSOR_MQTT_BROKER}:{settings.SENSOR_MQTT_PORT} [{topic}]")
+        client.subscribe(topic)
+        if settings.SENSOR_MQTT_BINARY_TOPIC:
+            binary_topic = subscription_topic(settings.SENSOR_MQTT_BINARY_TOPIC)
+            logging.info(f"✅ Subscribed to binary windows [{binary_topic}]")
+            client.subscribe(binary_topic)
     else:
         logging.error(f"❌ Subscription failed with code {rc}. Retrying...")
 
 # 📩 Subscriber: On Message (Data Processing Pipeline)
 def on_message(client, userdata, message):
+    handle_message(message.topic, message.payload)
+
+def handle_message(topic, payload):
+    """Decode one sensor message and hand it over to the batch pipeline."""
     try:
-        payload = message.payload.decode()
-        #logging.info(f"📩 [RECEIVED] Data received on topic: {settings.SENSOR_MQTT_TOPIC}")
+        window = decode_message(topic, payload)
+        if window is not None:
+            pipeline.enqueue(window)
+    except Exception as e:
+        logging.error(f"❌ [ERROR] Failed to process incoming message: {e}", exc_info=True)
+
+def decode_message(topic, payload):
+    """Decode one sensor message into a Window (None for empty messages)."""
+    with metrics.timed("decode"):
+        if settings.SENSOR_MQTT_BINARY_TOPIC and mqtt.topic_matches_sub(settings.SENSOR_MQTT_BINARY_TOPIC, topic):
+            # Binary window: the samples stay a view on the payload buffer
+            data = codec.decode_window(payload)
+        else:
+            payload = payload.decode()
+            #logging.info(f"📩 [RECEIVED] Data received on topic: {settings.SENSOR_MQTT_TOPIC}")
 
-        # Convert to JSON if possible
-        data = json.loads(payload) if payload.startswith("{") else {"raw_data": payload}
+            # Convert to JSON if possible
+            data = json.loads(payload) if payload.startswith("{") else {"raw_data": payload}
 
         if not data:
             logging.warning("⚠️ Received empty message. Skipping processing.")
-            return
+            return None
 
         # Detect new sensor
         sensor_name = data.get("device", "Unknown_Sensor")  # Ensure a sensor identifier is present
         if sensor_name not in active_sensors:
             active_sensors.add(sensor_name)
             logging.info(f"🆕 [NEW SENSOR] Sensor {sensor_name} started publishing data.")
+        metrics.MESSAGES.labels(metrics.device_label(sensor_name)).inc()
 
-        # Step 1: Pass Data to Inference Module
-        #logging.info("🧠 Sending data to inference module...")
-        inference.feed(data)
-
-        # Step 2: Pass Processed Data to Outlier Detection Module
-        #logging.info("🔍 Sending data to outlier detection module...")
-        outlier.feed(data)
-
-        # Step 3: Store Processed Data in MongoDB
-        
-        db.insert(data)
-        #logging.info("🛢️ [STORED] Data successfully saved to MongoDB.")
-
-    except Exception as e:
-        logging.error(f"❌ [ERROR] Failed to process incoming message: {e}", exc_info=True)
+        # Decode the window once
+        return Window.from_message(data)
 
 # ✅ Publisher: On Connect
 def on_connect_publisher(client, userdata, flags, rc):
@@ -100,54 +121,204 @@ def reconnect_client(client):
             attempt += 1
 
 # ⏳ Periodic Data Fetching & Publishing
-# ✅ Fetch unread data, process it, and publish to cloud
+TRAINING_COLUMNAR = settings.TRAINING_ENCODING == "columnar"
+if settings.TRAINING_ENCODING not in ("json", "columnar"):
+    logging.warning(f"⚠️ Unknown TRAINING_ENCODING '{settings.TRAINING_ENCODING}'. Using json.")
+if TRAINING_COLUMNAR and (settings.TRAINING_DTYPE not in codec.TRAINING_DTYPES or settings.TRAINING_COMPRESSION not in codec.COMPRESSORS):
+    logging.warning(f"⚠️ Unknown TRAINING_DTYPE '{settings.TRAINING_DTYPE}' or TRAINING_COMPRESSION '{settings.TRAINING_COMPRESSION}'. "
+                    "Using float32 and zlib.")
+    settings.TRAINING_DTYPE, settings.TRAINING_COMPRESSION = "float32", "zlib"
+COLUMNAR_OVERHEAD = 256  # Bytes kept free for the prefix and JSON header of a columnar message
+
+def training_records(documents):
+    """
+    Reduce a chunk of stored documents in one call.
+    Returns (document id, training record) pairs for the documents that could be reduced:
+    the serialized JSON record, or (reduced window, label) with the columnar encoding.
+    """
+    windows = []
+    for data in documents:
+        if "data" not in data:
+            logging.warning("⚠️ Skipping entry: Missing 'data' field.")
+            continue
+        windows.append(Window.from_message(data))
+
+    with registry.pinned():  # One reduction model for the whole chunk, even across a model swap
+        if not reduction.reduce_batch(windows):
+            return []
+
+    records = []
+    for window in windows:
+        if window.reduced is None:
+            continue
+        label = window.message.get("label")
+        label = int(label) if label is not None else -1
+        if TRAINING_COLUMNAR:
+            records.append((window.message["_id"], (window.reduced, label)))
+            continue
+        # Same layout as DataFrame(reduced).to_json(orient="index"), plus the label
+        record = codec.to_document_data(np.round(window.reduced, 10))
+        record["label"] = label
+        records.append((window.message["_id"], json.dumps(record).encode()))
+    return records
+
+def chunk_records(records, max_payload, overhead):
+    """Group (id, record) pairs into chunks whose message stays within `max_payload` bytes."""
+    chunk, size = [], overhead
+    for record_id, record in records:
+        record_size = len(record) + 1  # Including the separator
+        if overhead + record_size > max_payload:
+            logging.error(f"❌ Training record {record_id} ({len(record)} bytes) exceeds CLOUD_SYNC_MAX_PAYLOAD. Skipping.")
+            continue
+        if chunk and size + record_size > max_payload:
+            yield chunk
+            chunk, size = [], overhead
+        chunk.append((record_id, record))
+        size += record_size
+    if chunk:
+        yield chunk
+
+def json_messages(records):
+    """Group serialized JSON records into {"edge_id", "data": [records]} messages. Yields (chunk, message)."""
+    head = b'{"edge_id": ' + json.dumps(settings.CLIENT_ID).encode() + b', "data": ['
+    tail = b"]}"
+    for chunk in chunk_records(records, settings.CLOUD_SYNC_MAX_PAYLOAD, len(head) + len(tail)):
+        yield chunk, head + b",".join(record for _, record in chunk) + tail
+
+def encode_columnar(chunk):
+    windows = np.stack([reduced for _, (reduced, _) in chunk])
+    labels = [label for _, (_, label) in chunk]
+    return codec.encode_training(settings.CLIENT_ID, windows, labels, settings.TRAINING_DTYPE,
+                                 settings.TRAINING_COMPRESSION, settings.TRAINING_COMPRESSION_LEVEL)
+
+def fitting_messages(chunk):
+    """Encode a columnar chunk, split in halves until every message fits CLOUD_SYNC_MAX_PAYLOAD. Yields (chunk, message)."""
+    message = encode_columnar(chunk)
+    if len(message) <= settings.CLOUD_SYNC_MAX_PAYLOAD:
+        yield chunk, message
+    elif len(chunk) == 1:
+        logging.error(f"❌ Training record {chunk[0][0]} ({len(message)} bytes) exceeds CLOUD_SYNC_MAX_PAYLOAD. Skipping.")
+    else:
+        yield from fitting_messages(chunk[:len(chunk) // 2])
+        yield from fitting_messages(chunk[len(chunk) // 2:])
+
+def columnar_messages(records):
+    """
+    Group (reduced window, label) records into compressed columnar messages. Yields (chunk, message).
+    A message holds consecutive windows of one shape, so the record order is kept. Chunks are sized
+    with the compression ratio of the previous message and split if they still end up too large.
+    """
+    itemsize = np.dtype(codec.TRAINING_DTYPES[settings.TRAINING_DTYPE]).itemsize
+    budget = 0.9 * (settings.CLOUD_SYNC_MAX_PAYLOAD - COLUMNAR_OVERHEAD)  # 10% margin, as the ratio varies between chunks
+    ratio = 1.0  # Raw / encoded bytes of the last chunk
+    chunk, raw, shape = [], 0, None
+    for record in records:
+        reduced = record[1][0]
+        record_raw = reduced.size * itemsize + 2  # Data and an int16 label
+        if chunk and (reduced.shape != shape or (raw + record_raw) / ratio > budget):
+            encoded = 0
+            for part, message in fitting_messages(chunk):
+                encoded += len(message)
+                yield part, message
+            ratio = max(1.0, raw / max(1, encoded))
+            chunk, raw = [], 0
+        chunk.append(record)
+        raw += record_raw
+        shape = reduced.shape
+    if chunk:
+        yield from fitting_messages(chunk)
+
+def training_messages(records):
+    """Group training records into size-capped messages in the TRAINING_ENCODING. Yields (chunk, message)."""
+    return columnar_messages(records) if TRAINING_COLUMNAR else json_messages(records)
+
+def publish_training_records(records, mark_processed=db.mark_processed, client=None):
+    """
+    Publish training records in size-capped messages (with `client`, default: the publisher).
+    Each message's documents are marked as processed once it is handed to the client,
+    by calling `mark_processed` with their ids (in record order).
+    Returns (number of published records, whether every message was published).
+    """
+    client = client or client_publisher
+    published = 0
+    for chunk, msg in training_messages(records):
+        info = client.publish(settings.TRAINING_MQTT_TOPIC, msg)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            logging.error(f"❌ Failed to publish {len(chunk)} training records (rc={info.rc}). They stay unprocessed.")
+            return published, False
+
+        metrics.SYNC_RECORDS.observe(len(chunk))
+
+        # ✅ Mark only this message's data as read in MongoDB
+        mark_processed([record_id for record_id, _ in chunk])
+        published += len(chunk)
+    return published, True
+
+def log_published(published, documents):
+    # Extract time range
+    timestamps = [data["date"] for data in documents if "date" in data]
+    first_date = min(timestamps) if timestamps else "N/A"
+    last_date = max(timestamps) if timestamps else "N/A"
+    logging.info(f"📤 Published {published} records from {first_date} to {last_date} to {settings.TRAINING_MQTT_TOPIC}")
+
+def sync_window(client=None):
+    """Publish the unread data of the last CLOUD_SYNC_PERIOD minutes. Returns the number of fetched documents."""
+    fetched = 0
+    for documents in db.iter_data_batches(settings.CLOUD_SYNC_PERIOD, settings.CLOUD_SYNC_BATCH_SIZE):
+        fetched += len(documents)
+        published, _ = publish_training_records(training_records(documents), client=client)
+        if published:
+            log_published(published, documents)
+    return fetched
+
+def sync_watermark(client=None):
+    """
+    Publish the unread data inserted since the persisted watermark, in _id order.
+    The watermark advances after every fully published chunk, so a restart resumes where the last sync stopped.
+    Only published documents are marked as processed: documents that could not be reduced or did not fit
+    a message stay unread behind the watermark, and are logged and counted.
+    Returns the number of fetched documents.
+    """
+    checkpoint = f"{settings.CLIENT_ID}/{db.collection_name}"
+    watermark = db.load_watermark(checkpoint)
+    # ObjectIds start with their creation time: keep back inserts that may still be in flight
+    settled = ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=settings.CLOUD_SYNC_SETTLE_SECONDS))
+
+    fetched = 0
+    for documents in db.iter_new_batches(watermark, settled, settings.CLOUD_SYNC_BATCH_SIZE):
+        fetched += len(documents)
+        published, complete = publish_training_records(training_records(documents), client=client)
+        if published:
+            log_published(published, documents)
+        if not complete:
+            logging.warning(f"⚠️ Sync stopped at watermark {watermark}. The remaining data is retried next period.")
+            break
+        skipped = len(documents) - published
+        if skipped:
+            metrics.SYNC_SKIPPED.inc(skipped)
+            logging.warning(f"⚠️ {skipped} record(s) could not be reduced or exceeded CLOUD_SYNC_MAX_PAYLOAD. "
+                            f"They stay unprocessed and are not retried by the watermark sync.")
+        watermark = documents[-1]["_id"]
+        db.save_watermark(checkpoint, watermark)
+    return fetched
+
+def sync_training_data(client=None):
+    """Run one cloud sync in the configured CLOUD_SYNC_MODE."""
+    logging.info("🔍 Fetching unread data from DB for training...")
+    if settings.CLOUD_SYNC_MODE == "watermark":
+        fetched = sync_watermark(client)
+    else:
+        fetched = sync_window(client)
+
+    if not fetched:
+        logging.info("📭 No unread data found. Skipping training data publication.")
+
+# ✅ Fetch unread data chunk by chunk, reduce it, and publish it to the cloud
 def fetch_reduce_and_publish():
     while True:
         try:
             time.sleep(settings.CLOUD_SYNC_PERIOD * 60)  # Convert minutes to seconds
-            
-            logging.info("🔍 Fetching unread data from DB for training...")
-            data_batch = db.fetch_data_batch(settings.CLOUD_SYNC_PERIOD)
-             # ✅ Convert ObjectId to string for readability
-            if not data_batch:
-                logging.info("📭 No unread data found. Skipping training data publication.")
-                continue
-
-            processed_batch = []
-            processed_ids = []  # Track processed document IDs
-
-            # Extract time range
-            timestamps = [data.get("date") for data in data_batch if "date" in data]
-            first_date = min(timestamps) if timestamps else "N/A"
-            last_date = max(timestamps) if timestamps else "N/A"
-
-            for data in data_batch:
-                if "data" not in data:
-                    logging.warning("⚠️ Skipping entry: Missing 'data' field.")
-                    continue
-
-                # Reduce Data using Dimensionality Reduction
-                reduced_data = reduction.reduce_data(data["data"])
-                if reduced_data:
-                    try:
-                        red_json_data = json.loads(reduced_data)
-                        red_json_data["label"] = int(data.get("label", -1))  # Add label if available
-                        processed_batch.append(red_json_data)
-                        processed_ids.append(data["_id"])  # Store document ID for marking as read
-                    except json.JSONDecodeError as e:
-                        logging.error(f"❌ Error converting reduced data to JSON: {e}")
-                        continue
-
-            if processed_batch:
-                msg = json.dumps({"edge_id": settings.CLIENT_ID, "data": processed_batch})
-                client_publisher.publish(settings.TRAINING_MQTT_TOPIC, msg)
-                logging.info(f"📤 Published {len(processed_batch)} records from {first_date} to {last_date} to {settings.TRAINING_MQTT_TOPIC}")
-
-
-                # ✅ Mark Data as Read in MongoDB
-                db.collection.update_many({"_id": {"$in": processed_ids}}, {"$set": {"processed": True}})
-                #logging.info("✅ Marked published data as processed.")
-
+            sync_training_data()
         except Exception as e:
             logging.error(f"❌ [ERROR] Failed during reduction and publishing: {e}", exc_info=True)
 
@@ -175,20 +346,40 @@ def connect_with_retry(client, broker, port):
             time.sleep(wait_time)
             attempt += 1
 
+# 📥 Consume messages dispatched by the supervisor (device sharding)
+def consume(inbox):
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        handle_message(*item)
+
 # 🚀 Start the MQTT Forwarder (Runnable from Main)
-def run():
+def run(inbox=None):
+    """
+    Start the forwarder. Without `inbox`, sensor messages come from the MQTT subscriber;
+    with it, they are (topic, payload) pairs dispatched by the supervisor.
+    """
     logging.info("🚀 Starting MQTT Forwarder Module...")
 
     # Connect to Brokers with Retry Logic
-    connect_with_retry(client_subscriber, settings.SENSOR_MQTT_BROKER, settings.SENSOR_MQTT_PORT)
+    if inbox is None:
+        connect_with_retry(client_subscriber, settings.SENSOR_MQTT_BROKER, settings.SENSOR_MQTT_PORT)
     connect_with_retry(client_publisher, settings.CLOUD_MQTT_BROKER, settings.CLOUD_MQTT_PORT)
 
+    # Start the batch worker before messages arrive
+    pipeline.run()
+
     # Start MQTT loops
-    client_subscriber.loop_start()
+    if inbox is None:
+        client_subscriber.loop_start()
+    else:
+        threading.Thread(target=consume, args=(inbox,), daemon=True).start()
     client_publisher.loop_start()
 
-    # Start periodic data fetching & publishing thread
-    threading.Thread(target=fetch_reduce_and_publish, daemon=True).start()
+    # Start periodic data fetching & publishing thread (once per edge, not per worker)
+    if settings.WORKER_INDEX == 0:
+        threading.Thread(target=fetch_reduce_and_publish, daemon=True).start()
 
 # Graceful Shutdown
 def stop():
@@ -197,6 +388,7 @@ def stop():
     client_publisher.loop_stop()
     client_subscriber.disconnect()
     client_publisher.disconnect()
+    pipeline.stop()
     logging.info("✅ [EXITED] Clean shutdown completed.")
 
 # Allow direct execution for debugging
@@ -1,9 +1,9 @@
 import os
 import logging
 import settings
-import joblib
-import pandas as pd
-import tensorflow as tf
+import numpy as np
+import registry
+from window import group_by_shape, stack
 
 # Configure Logging
 logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -11,77 +11,147 @@ logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s - %(levelname)
 # Load Settings
 REDUCTION_ENABLE = settings.REDUCTION_ENABLE
 REDUCTION_MODEL_NAME = settings.REDUCTION_MODEL
+REDUCTION_FUSED = settings.REDUCTION_FUSED
 
 # Model Paths
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
-PCA_PATH = os.path.join(MODEL_DIR, "PCA.joblib")
+PCA_PATHS = {
+    "PCA": os.path.join(MODEL_DIR, "PCA.joblib"),  # 16 components
+    "PCA_16": os.path.join(MODEL_DIR, "PCA.joblib"),
+    "PCA_7": os.path.join(MODEL_DIR, "PCA_7.joblib"),
+}
 AE_PATH = os.path.join(MODEL_DIR, "encoder.h5")
 
-# Global Model Variable
-reduction_model = None
-
 def model_selector(model_name):
     """Loads the appropriate dimensionality reduction model (PCA or AE)."""
     try:
-        if model_name == "PCA":
-            logging.info("✅ PCA selected as reduction model.")
-            return joblib.load(PCA_PATH)
+        if model_name in PCA_PATHS:
+            logging.info(f"✅ {model_name} selected as reduction model.")
+            return registry.load_joblib(PCA_PATHS[model_name])
         elif model_name == "AE":
             logging.info("✅ Auto-Encoder (AE) selected as reduction model.")
+            import tensorflow as tf  # Only imported when the AE is selected
             return tf.keras.models.load_model(AE_PATH)
         else:
-            logging.error(f"❌ '{model_name}' is not supported! Please set it as 'PCA' or 'AE'.")
+            logging.error(f"❌ '{model_name}' is not supported! Please set it as 'PCA', 'PCA_16', 'PCA_7' or 'AE'.")
             return None
     except Exception as e:
         logging.error(f"❌ Error loading {model_name} model: {e}")
         return None
 
-def reduce_data(data):
+class FusedReduction:
     """
-    Performs dimensionality reduction on data using the selected model.
-    Returns JSON-formatted reduced data.
+    The inference scaler followed by PCA, folded into a single affine map.
+    ((x - mean) / scale - pca_mean) @ components.T is rewritten as x @ W + b,
+    so raw samples are scaled and reduced with one float32 GEMM.
     """
-    if not REDUCTION_ENABLE or reduction_model is None:
-        logging.warning("⚠️ Dimensionality reduction is disabled or model is unavailable.")
-        return None
 
-    try:
-        converted_data = pd.DataFrame(data).T.to_numpy()
-
-        if REDUCTION_MODEL_NAME == "PCA":
-            #logging.info("🔹 Running PCA Reduction...")
-            reduced_data = pd.DataFrame(reduction_model.transform(converted_data))
-        elif REDUCTION_MODEL_NAME == "AE":
-            #logging.info("🔹 Running AutoEncoder Reduction...")
-            reduced_data = pd.DataFrame(reduction_model.predict(converted_data))
-        else:
-            logging.error("❌ Invalid reduction model.")
-            return None
+    def __init__(self, scaler, pca):
+        mean = scaler.mean_ if scaler.mean_ is not None else 0.0
+        scale = scaler.scale_ if scaler.scale_ is not None else 1.0
+        components = pca.components_.T  # (features, components)
+        if pca.whiten:
+            components = components / np.sqrt(pca.explained_variance_)
 
-        return reduced_data.to_json(orient="index")
-    except Exception as e:
-        logging.error(f"❌ Error during dimensionality reduction: {e}")
+        # Folded in float64, stored in float32
+        self.weights = np.ascontiguousarray(components / np.reshape(scale, (-1, 1)), dtype=np.float32)
+        self.bias = (-(mean / scale + pca.mean_) @ components).astype(np.float32)
+
+    def transform(self, samples):
+        """Scale and reduce a (..., features) array into (..., components)."""
+        samples = np.asarray(samples, dtype=np.float32)
+        reduced = samples.reshape(-1, samples.shape[-1]) @ self.weights
+        reduced += self.bias
+        return reduced.reshape(*samples.shape[:-1], -1)
+
+def load_fused():
+    """Fuse the inference scaler and the PCA model (called by the model registry). None for the AE."""
+    model_name = registry.variant("reduction")
+    if model_name not in PCA_PATHS:
+        return None
+    scaler_model = registry.get("scaler")
+    reduction_model = registry.get("reduction")
+    if scaler_model is None or reduction_model is None:
+        logging.error("❌ Scaler or PCA model is not available. Cannot fuse them.")
         return None
+    logging.info(f"✅ Scaler and {model_name} fused into one affine transform.")
+    return FusedReduction(scaler_model, reduction_model)
 
-def inference_reduce_data(data):
+def model_files(model_name):
+    if model_name in PCA_PATHS:
+        return [PCA_PATHS[model_name]]
+    return [AE_PATH] if model_name == "AE" else []
+
+def warmup(model):
+    """Reduce a dummy sample (called by the model registry before a swap)."""
+    if registry.variant("reduction") in PCA_PATHS:
+        model.transform(np.zeros((1, model.components_.shape[1])))
+    else:
+        model.predict(np.zeros((1, model.input_shape[-1])), verbose=0)
+
+# Register Reduction Models (inference reduces its input too)
+registry.register("reduction", model_selector, REDUCTION_ENABLE or settings.INFERENCE_ENABLE, REDUCTION_MODEL_NAME, model_files, warmup)
+registry.register("fused_reduction", load_fused, settings.INFERENCE_ENABLE and REDUCTION_FUSED, depends=("scaler", "reduction"))
+
+def reduce_batch(windows):
+    """
+    Performs dimensionality reduction on many windows, with one model call per window shape.
+    Results are cached on each window (`window.reduced`); returns False if reduction is unavailable.
+    """
+    reduction_model = registry.get("reduction")
+    if not REDUCTION_ENABLE or reduction_model is None:
+        logging.warning("⚠️ Dimensionality reduction is disabled or model is unavailable.")
+        return False
+
+    for group in group_by_shape([window for window in windows if window.reduced is None]):
+        samples = stack(group)
+        flat_samples = samples.reshape(-1, samples.shape[-1])
+        try:
+            if registry.variant("reduction") in PCA_PATHS:
+                reduced_data = reduction_model.transform(flat_samples)
+            elif registry.variant("reduction") == "AE":
+                reduced_data = reduction_model.predict(flat_samples, verbose=0)
+            else:
+                logging.error("❌ Invalid reduction model.")
+                return False
+        except Exception as e:
+            logging.error(f"❌ Error during dimensionality reduction: {e}")
+            continue
+        for window, reduced in zip(group, reduced_data.reshape(len(group), samples.shape[1], -1)):
+            window.reduced = reduced
+    return True
+
+def inference_reduce_batch(windows, samples=None):
     """
-    Performs dimensionality reduction for inference.
-    Returns a Pandas DataFrame of reduced features.
+    Performs dimensionality reduction for inference on a stacked, scaled (batch, window, features) array.
+    When the raw `samples` are given and the fused scaler+PCA transform is loaded,
+    they are scaled and reduced in one step instead.
+    Returns a (batch, window, components) NumPy array.
     """
+    fused_reduction = registry.get("fused_reduction") if samples is not None else None
+    if fused_reduction is not None:
+        try:
+            return fused_reduction.transform(samples)
+        except Exception as e:
+            logging.error(f"❌ Error during fused dimensionality reduction: {e}")
+            return None
+
+    reduction_model = registry.get("reduction")
     if reduction_model is None:
         logging.error("❌ Reduction model is not loaded. Cannot perform reduction.")
         return None
 
     try:
-        if REDUCTION_MODEL_NAME == "PCA":
-            logging.info("🔹 Running PCA Reduction for Inference...")
-            return pd.DataFrame(reduction_model.transform(data))
-        elif REDUCTION_MODEL_NAME == "AE":
-            logging.info("🔹 Running AutoEncoder Reduction for Inference...")
-            return pd.DataFrame(reduction_model.predict(data))
+        batch_size, window_size, n_features = windows.shape
+        flat_windows = windows.reshape(-1, n_features)
+        if registry.variant("reduction") in PCA_PATHS:
+            reduced_data = reduction_model.transform(flat_windows)
+        elif registry.variant("reduction") == "AE":
+            reduced_data = reduction_model.predict(flat_windows, verbose=0)
         else:
             logging.error("❌ Invalid reduction model.")
             return None
+        return reduced_data.reshape(batch_size, window_size, -1)
     except Exception as e:
         logging.error(f"❌ Error during inference dimensionality reduction: {e}")
         return None
@@ -90,9 +160,8 @@ def run():
     """
     Initializes the reduction module by loading the appropriate model.
     """
-    global reduction_model
     if REDUCTION_ENABLE:
-        reduction_model = model_selector(REDUCTION_MODEL_NAME)
+        registry.get("reduction")
     else:
         logging.warning("⚠️ Dimensionality Reduction is disabled.")
 
@@ -0,0 +1,227 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import settings
+
+# Configure Logging
+logging.basicConfig(
+    level=settings.LOG_LEVEL,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Registered model loaders: name -> {"loader", "enabled", "variant", "files", "warmup", "depends"}
+# Loaders import their heavy frameworks (TensorFlow, scikit-learn) themselves,
+# so nothing is imported for a stage that is switched off.
+# A loader may call `get` for the models it is derived from (listed in `depends`).
+loaders = {}
+load_times = {}
+_locks = {}
+# Unpickling scikit-learn models imports sklearn submodules, which is not safe
+# from several threads at once (circular imports show up half-initialized)
+_joblib_lock = threading.Lock()
+_swap_lock = threading.Lock()  # One swap at a time
+_local = threading.local()  # Model set pinned by the current thread
+
+class ModelSet:
+    """
+    One consistent set of models: the variant of each model (e.g. PCA_7 for "reduction"),
+    the models loaded so far, their versions and the stat of the files they were loaded from.
+    A swap builds a new set and replaces the active one as a whole.
+    """
+
+    def __init__(self, variants=None):
+        self.variants = dict(variants or {})
+        self.models = {}
+        self.versions = {}
+        self.stamps = {}
+
+    def keep(self, other, names):
+        """Take over the loaded models `names` of another set."""
+        for name in names:
+            if name in other.models:
+                self.models[name] = other.models[name]
+                self.versions[name] = other.versions.get(name)
+                self.stamps[name] = other.stamps.get(name)
+
+_active = ModelSet()
+
+def register(name, loader, enabled=True, variant=None, files=None, warmup=None, depends=()):
+    """
+    Register the loader of a model. Nothing is loaded until `load_all` or `get` is called.
+    Swappable models have a `variant`, passed to the loader, and `files(variant)`, the paths it is
+    loaded from. `warmup(model)` runs a dummy batch before a swap; `depends` are the models it is derived from.
+    """
+    loaders[name] = {"loader": loader, "enabled": enabled, "variant": variant, "files": files,
+                     "warmup": warmup, "depends": tuple(depends)}
+    _locks.setdefault(name, threading.Lock())
+    _active.variants[name] = variant
+
+def load_joblib(path):
+    """joblib.load for loaders, serialized so parallel loads do not race on sklearn imports."""
+    import joblib
+    with _joblib_lock:
+        return joblib.load(path)
+
+def files(name, variant=None):
+    """Paths the model `name` is loaded from, for its active variant or the given one."""
+    entry = loaders.get(name)
+    if entry is None or entry["files"] is None:
+        return []
+    return list(entry["files"](variant if variant is not None else current().variants.get(name)))
+
+def stamp(paths):
+    """(mtime, size) of each file, None for missing ones. Compared by the file watcher."""
+    stamps = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamps.append(None)
+    return tuple(stamps)
+
+def fingerprint(variant, paths):
+    """Version of a model: its variant and the first 8 hex digits of the SHA-256 of its files."""
+    if variant is None:
+        return None
+    digest = hashlib.sha256()
+    for path in paths:
+        try:
+            with open(path, "rb") as file:
+                for block in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(block)
+        except OSError:
+            return str(variant)
+    return f"{variant}:{digest.hexdigest()[:8]}" if paths else str(variant)
+
+def _load(name, model_set):
+    entry = loaders[name]
+    variant = model_set.variants.get(name)
+    paths = files(name, variant)
+    start = time.perf_counter()
+    try:
+        # Stat and hash before loading: a file replaced meanwhile is picked up by the next check
+        model_set.stamps[name] = stamp(paths)
+        model_set.versions[name] = fingerprint(variant, paths)
+        model = entry["loader"](variant) if variant is not None else entry["loader"]()
+    except Exception as e:
+        logging.error(f"❌ Error loading model '{name}': {e}")
+        model = None
+    load_times[name] = time.perf_counter() - start
+    model_set.models[name] = model
+    return model
+
+def current():
+    """The model set pinned by this thread, else the active one."""
+    return getattr(_local, "model_set", None) or _active
+
+@contextmanager
+def pinned(model_set=None):
+    """
+    Resolve `get` against one model set for the whole block (a batch), so a swap in between
+    takes effect with the next batch. Nested blocks keep the outer pin.
+    """
+    previous = getattr(_local, "model_set", None)
+    _local.model_set = model_set or previous or _active
+    try:
+        yield _local.model_set
+    finally:
+        _local.model_set = previous
+
+def get(name):
+    """Return a loaded model, loading it on first use. Returns None for disabled or failed models."""
+    model_set = current()
+    if name in model_set.models:
+        return model_set.models[name]
+    entry = loaders.get(name)
+    if entry is None or not entry["enabled"]:
+        return None
+    with _locks[name]:
+        if name not in model_set.models:
+            _load(name, model_set)
+    return model_set.models[name]
+
+def variant(name):
+    """Active variant of a model (e.g. "PCA_7" for "reduction"), as pinned by this thread."""
+    return current().variants.get(name)
+
+def versions():
+    """Versions of the enabled models of the current set, e.g. {"reduction": "PCA:3f2a9c1e"}."""
+    model_set = current()
+    return {name: version for name, version in model_set.versions.items()
+            if version is not None and model_set.models.get(name) is not None}
+
+def dependents(names):
+    """`names` and every model derived from them, dependencies first."""
+    affected = set(names)
+    ordered = []
+    def visit(name, chain=()):
+        if name in ordered or name in chain:
+            return
+        for dependency in loaders[name]["depends"]:
+            if dependency in loaders:
+                visit(dependency, chain + (name,))
+        if name in affected or any(dependency in affected for dependency in loaders[name]["depends"]):
+            affected.add(name)
+            ordered.append(name)
+    for name in loaders:
+        visit(name)
+    return ordered
+
+def swap(changes):
+    """
+    Load new model versions and make them active.
+    `changes` maps model names to a variant, or to None to reload the current variant's files.
+    The changed models and those derived from them are loaded into a copy of the active set,
+    every model of the copy is warmed up with a dummy batch, and the copy becomes the active set
+    in one assignment. Batches in flight finish on the set they pinned. If anything fails, the
+    active set is kept. Returns True if the models were swapped.
+    """
+    global _active
+    with _swap_lock:
+        base = _active
+        staged = ModelSet(base.variants)
+        for name, new_variant in changes.items():
+            if new_variant is not None:
+                staged.variants[name] = new_variant
+        affected = [name for name in dependents(changes) if loaders[name]["enabled"]]
+        staged.keep(base, [name for name in base.models if name not in affected])
+
+        start = time.perf_counter()
+        try:
+            with pinned(staged):
+                for name in affected:
+                    # Derived models (without a variant) may be None, e.g. the fused PCA when AE is selected
+                    if _load(name, staged) is None and staged.variants.get(name) is not None:
+                        raise ValueError(f"model '{name}' ({staged.variants[name]}) could not be loaded")
+                for name, entry in loaders.items():
+                    model = get(name) if entry["enabled"] and entry["warmup"] is not None else None
+                    if model is not None:
+                        entry["warmup"](model)
+        except Exception as e:
+            logging.error(f"❌ Model swap failed, keeping the active models: {e}")
+            return False
+
+        _active = staged
+        swapped = ", ".join(f"{name} {base.versions.get(name)} → {staged.versions.get(name)}"
+                            for name in affected if staged.versions.get(name) is not None)
+        logging.info(f"🔄 Models swapped in {time.perf_counter() - start:.2f}s ({swapped or 'derived models only'}).")
+        return True
+
+def load_all():
+    """Load every enabled model in parallel and log how long each one took."""
+    pending = [name for name, entry in loaders.items() if entry["enabled"] and name not in _active.models]
+    start = time.perf_counter()
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            list(executor.map(get, pending))
+    total = time.perf_counter() - start
+
+    breakdown = ", ".join(f"{name}: {load_times[name]:.2f}s" for name in pending) or "nothing enabled"
+    logging.info(f"⏱️ Models loaded in {total:.2f}s ({breakdown}).")
+    return dict(load_times)
@@ -0,0 +1,141 @@
+import time
+import logging
+from collections import deque
+import settings
+import metrics
+
+# Configure Logging
+logging.basicConfig(
+    level=settings.LOG_LEVEL,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Load Settings
+SHED_POLICY = settings.SHED_POLICY
+DEVICE_QUEUE_SIZE = max(1, settings.DEVICE_QUEUE_SIZE)
+BATCH_QUEUE_SIZE = max(1, settings.BATCH_QUEUE_SIZE)
+SHED_KEEP_EVERY = max(2, settings.SHED_KEEP_EVERY)
+
+POLICIES = ("drop_oldest", "keep_every_k", "skip_inference", "block")
+WARNING_INTERVAL = 10  # Seconds between overload warnings in the log
+
+if SHED_POLICY not in POLICIES:
+    logging.warning(f"⚠️ Unknown SHED_POLICY '{SHED_POLICY}'. Using drop_oldest.")
+    SHED_POLICY = "drop_oldest"
+
+class DeviceBuffers:
+    """
+    Bounded FIFO queue per sensor between ingest and the batch worker.
+
+    `get` serves the devices round-robin, so one chatty sensor cannot starve the others.
+    A device holds at most DEVICE_QUEUE_SIZE windows and all devices together BATCH_QUEUE_SIZE.
+    On overflow, the device that overflowed (or, for the total limit, the one with the longest
+    backlog) sheds windows by policy:
+
+    - drop_oldest: its oldest window is dropped.
+    - keep_every_k: its backlog is thinned to every SHED_KEEP_EVERY-th window (the newest is kept).
+    - skip_inference: its newest window is kept but marked to skip inference (it is still validated
+      and stored). Only beyond twice the limits are the oldest windows dropped.
+    - block: nothing is shed; the producer waits while `full()` (the previous behaviour).
+
+    Not thread-safe: the threaded pipeline calls it under a lock, the asyncio forwarder from its loop.
+    """
+
+    def __init__(self, policy=SHED_POLICY, device_size=DEVICE_QUEUE_SIZE, total_size=BATCH_QUEUE_SIZE):
+        self.policy = policy
+        self.device_size = device_size
+        self.total_size = total_size
+        self.queues = {}  # device -> deque of windows
+        self.ready = deque()  # Devices with queued windows, in serving order
+        self.size = 0
+        self.shed_count = 0  # Windows shed since the last warning
+        self.last_warning = float("-inf")
+
+    def __len__(self):
+        return self.size
+
+    def full(self):
+        return self.size >= self.total_size
+
+    def put(self, window):
+        """Queue one window, shedding by policy if a limit is exceeded."""
+        device = window.device
+        queue = self.queues.get(device)
+        if queue is None:
+            queue = self.queues[device] = deque()
+            self.ready.append(device)
+        queue.append(window)
+        self.size += 1
+        if self.policy == "block":
+            return
+
+        if self.policy == "skip_inference":
+            if len(queue) > self.device_size:
+                self.skip_inference(device)
+            elif self.size > self.total_size:
+                self.skip_inference(self.longest())
+            # Hard limits, so memory stays bounded when even storing falls behind
+            if len(queue) > 2 * self.device_size:
+                self.drop_oldest(device)
+            elif self.size > 2 * self.total_size:
+                self.drop_oldest(self.longest())
+        elif len(queue) > self.device_size:
+            self.shed(device)
+        elif self.size > self.total_size:
+            self.shed(self.longest())
+
+    def get(self):
+        """Next window of the next device in turn, or None if nothing is queued."""
+        if not self.ready:
+            return None
+        device = self.ready.popleft()
+        queue = self.queues[device]
+        window = queue.popleft()
+        self.size -= 1
+        if queue:
+            self.ready.append(device)
+        else:
+            del self.queues[device]  # Idle devices take no space
+        if window.skip_inference:
+            self.count(device, "skip_inference")
+        return window
+
+    def longest(self):
+        return max(self.ready, key=lambda device: len(self.queues[device]))
+
+    def shed(self, device):
+        if self.policy == "keep_every_k":
+            queue = self.queues[device]
+            kept = list(queue)[::-1][::SHED_KEEP_EVERY][::-1]
+            dropped = len(queue) - len(kept)
+            if dropped:
+                self.queues[device] = deque(kept)
+                self.size -= dropped
+                self.count(device, "keep_every_k", dropped)
+                return
+        # A single queued window cannot be thinned, so it is dropped to keep the total bound
+        self.drop_oldest(device)
+
+    def skip_inference(self, device):
+        # Counted when the worker takes the window, since it may still be dropped at the hard limit
+        self.queues[device][-1].skip_inference = True  # The newest window of the device
+
+    def drop_oldest(self, device):
+        queue = self.queues[device]
+        queue.popleft()
+        self.size -= 1
+        if not queue:
+            # Its only window was dropped: `get` must not serve the device any more
+            del self.queues[device]
+            self.ready.remove(device)
+        self.count(device, "drop_oldest")
+
+    def count(self, device, policy, amount=1):
+        metrics.SHED_WINDOWS.labels(metrics.device_label(device), policy).inc(amount)
+        self.shed_count += amount
+        now = time.monotonic()
+        if now - self.last_warning >= WARNING_INTERVAL:
+            logging.warning(f"⚠️ Ingest is overloaded: {self.shed_count} window(s) shed ({self.policy}) since the last warning, "
+                            f"{self.size} queued for {len(self.queues)} device(s).")
+            self.last_warning, self.shed_count = now, 0
@@ -0,0 +1,185 @@
+import os
+import time
+import zlib
+import struct
+import logging
+import threading
+import bson
+import settings
+
+# Configure Logging
+logging.basicConfig(level=settings.LOG_LEVEL, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Load Settings
+SPOOL_DIR = settings.SPOOL_DIR
+if settings.WORKER_PROCESSES > 1:
+    SPOOL_DIR = os.path.join(SPOOL_DIR, f"worker-{settings.WORKER_INDEX}")  # Every worker process replays its own spool
+SPOOL_SEGMENT_BYTES = max(1, settings.SPOOL_SEGMENT_MB) * 1024 * 1024
+SPOOL_MAX_BYTES = max(1, settings.SPOOL_MAX_MB) * 1024 * 1024
+SPOOL_FSYNC_RECORDS = max(1, settings.SPOOL_FSYNC_RECORDS)
+SPOOL_FSYNC_INTERVAL = settings.SPOOL_FSYNC_MS / 1000
+
+SEGMENT_MAGIC = b"EDGESPL1"  # First bytes of every segment file (format version 1)
+SEGMENT_SUFFIX = ".seg"
+OFFSET_SUFFIX = ".done"  # Side file with the offset up to which a segment was replayed
+RECORD_HEADER = struct.Struct("<II")  # Length and CRC-32 of the BSON document that follows
+
+class Spool:
+    """
+    Append-only log of documents that could not be written to MongoDB.
+
+    Documents are stored as length-prefixed, checksummed BSON records (dates and
+    binary data survive unchanged) in segment files of up to SPOOL_SEGMENT_MB.
+    Appends are flushed to the OS at once and fsynced every SPOOL_FSYNC_RECORDS records
+    or SPOOL_FSYNC_MS. Full segments are sealed and replayed oldest first; a replayed
+    segment is deleted. The spool holds at most SPOOL_MAX_MB; beyond that new documents
+    are rejected, so the oldest data is never lost to newer data. Thread-safe.
+    """
+
+    def __init__(self, directory=SPOOL_DIR, segment_bytes=SPOOL_SEGMENT_BYTES, max_bytes=SPOOL_MAX_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # Segments left by an earlier run are sealed and replayed first
+        self.sealed = sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+        self.size = sum(os.path.getsize(self.path(name)) for name in self.sealed)
+        self.next_sequence = int(self.sealed[-1][:-len(SEGMENT_SUFFIX)]) + 1 if self.sealed else 0
+        self.active = None  # Segment file being appended to
+        self.active_name = None
+        self.active_size = 0
+        self.unsynced = 0  # Records written since the last fsync
+        self.last_sync = time.monotonic()
+        self.stats = {"spooled_docs": 0, "replayed_docs": 0, "rejected_docs": 0}
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def __len__(self):
+        """Number of segments holding data."""
+        with self.lock:
+            return len(self.sealed) + (self.active is not None)
+
+    def append(self, documents):
+        """Append documents to the active segment. Returns how many were spooled (0 if the spool is full)."""
+        records = []
+        for document in documents:
+            # Stored without _id: replayed documents get new ones, after the cloud sync watermark
+            body = bson.encode({key: value for key, value in document.items() if key != "_id"})
+            records.append(RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body)
+        data = b"".join(records)
+
+        with self.lock:
+            if self.size + len(data) > self.max_bytes:
+                self.stats["rejected_docs"] += len(records)
+                return 0
+            if self.active is None:
+                self.open_segment()
+            self.active.write(data)
+            self.active.flush()
+            self.active_size += len(data)
+            self.size += len(data)
+            self.unsynced += len(records)
+            self.stats["spooled_docs"] += len(records)
+            if self.active_size >= self.segment_bytes:
+                self.seal()
+            elif self.unsynced >= SPOOL_FSYNC_RECORDS or time.monotonic() - self.last_sync >= SPOOL_FSYNC_INTERVAL:
+                self.fsync()
+        return len(records)
+
+    def open_segment(self):
+        self.active_name = f"{self.next_sequence:012d}{SEGMENT_SUFFIX}"
+        self.next_sequence += 1
+        self.active = open(self.path(self.active_name), "ab")
+        self.active.write(SEGMENT_MAGIC)
+        self.active_size = len(SEGMENT_MAGIC)
+        self.size += len(SEGMENT_MAGIC)
+
+    def fsync(self):
+        if self.active is not None and self.unsynced:
+            os.fsync(self.active.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def sync(self):
+        """Fsync records that are still only in the OS cache."""
+        with self.lock:
+            self.fsync()
+
+    def seal(self):
+        """Close the active segment, so it can be replayed."""
+        if self.active is None:
+            return
+        self.fsync()
+        self.active.close()
+        self.sealed.append(self.active_name)
+        self.active = None
+        self.active_name = None
+        self.active_size = 0
+
+    def next_segment(self):
+        """Name of the oldest segment to replay (the active one is sealed first), or None if the spool is empty."""
+        with self.lock:
+            if not self.sealed:
+                self.seal()
+            return self.sealed[0] if self.sealed else None
+
+    def read(self, name):
+        """
+        Read a sealed segment from where its last replay stopped.
+        Returns (documents, end offsets of the records). A torn or corrupt tail is skipped with a warning.
+        """
+        with open(self.path(name), "rb") as file:
+            data = file.read()
+        if not data.startswith(SEGMENT_MAGIC):
+            logging.error(f"❌ Spool segment {name} has an unknown format. Skipping it.")
+            return [], []
+
+        offset = max(len(SEGMENT_MAGIC), self.replayed_offset(name))
+        documents, offsets = [], []
+        while offset < len(data):
+            if offset + RECORD_HEADER.size > len(data):
+                break
+            length, checksum = RECORD_HEADER.unpack_from(data, offset)
+            body = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+            if len(body) != length or zlib.crc32(body) != checksum:
+                break
+            documents.append(bson.decode(body))
+            offset += RECORD_HEADER.size + length
+            offsets.append(offset)
+        if offset < len(data):
+            logging.warning(f"⚠️ Spool segment {name} ends with {len(data) - offset} unreadable byte(s). They are skipped.")
+        return documents, offsets
+
+    def replayed_offset(self, name):
+        try:
+            with open(self.path(name + OFFSET_SUFFIX)) as file:
+                return int(file.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def mark_replayed(self, name, offset, count):
+        """Persist how far a segment was replayed, so a restart does not insert those documents again."""
+        with open(self.path(name + OFFSET_SUFFIX), "w") as file:
+            file.write(str(offset))
+            file.flush()
+            os.fsync(file.fileno())
+        with self.lock:
+            self.stats["replayed_docs"] += count
+
+    def remove(self, name):
+        """Delete a fully replayed segment."""
+        with self.lock:
+            size = os.path.getsize(self.path(name))
+            os.remove(self.path(name))
+            if os.path.exists(self.path(name + OFFSET_SUFFIX)):
+                os.remove(self.path(name + OFFSET_SUFFIX))
+            self.sealed.remove(name)
+            self.size -= size
+
+    def close(self):
+        """Fsync and close the active segment."""
+        with self.lock:
+            self.seal()
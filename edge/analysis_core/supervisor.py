@@ -0,0 +1,178 @@
+import os
+import re
+import time
+import zlib
+import queue
+import signal
+import logging
+import multiprocessing
+import paho.mqtt.client as mqtt
+import settings
+import codec
+import metrics
+import shedding
+
+# Configure Logging
+logging.basicConfig(
+    level=settings.LOG_LEVEL,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Load Settings
+WORKER_PROCESSES = settings.WORKER_PROCESSES
+WORKER_SHARDING = settings.WORKER_SHARDING
+
+# Workers are started fresh (no fork), so each one imports and loads its own models, DB buffer and MQTT clients
+context = multiprocessing.get_context("spawn")
+workers = {}
+inboxes = []  # Device sharding: one queue of (topic, payload) per worker
+overflows = {}  # keep_every_k: messages per device that found their inbox full
+shed_count = 0  # Messages shed since the last warning
+last_warning = float("-inf")
+
+dispatcher = mqtt.Client(f"{settings.CLIENT_ID}_Dispatcher")
+
+# Cheap device lookup in JSON payloads, without decoding the whole window
+DEVICE_PATTERN = re.compile(rb'"device"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+def raise_interrupt(signum, frame):
+    # Only the first signal interrupts, so a second one cannot cut the shutdown flush short
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+def worker_main(index, inbox):
+    """Entry point of a worker process."""
+    signal.signal(signal.SIGTERM, raise_interrupt)  # Stop like on Ctrl+C, flushing the pipeline
+    import main
+    logging.info(f"👷 Worker {index + 1}/{WORKER_PROCESSES} started ({WORKER_SHARDING} sharding).")
+    main.main(inbox)
+
+def start_worker(index):
+    inbox = inboxes[index] if inboxes else None
+    # Read by settings when the worker imports it (spawned workers inherit the environment)
+    os.environ["WORKER_INDEX"] = str(index)
+    process = context.Process(target=worker_main, args=(index, inbox), name=f"analysis_core-{index}")
+    process.start()
+    workers[index] = process
+
+def device_of(topic, payload):
+    """Return the device of a sensor message as bytes (empty if it has none)."""
+    if settings.SENSOR_MQTT_BINARY_TOPIC and mqtt.topic_matches_sub(settings.SENSOR_MQTT_BINARY_TOPIC, topic):
+        try:
+            return str(codec.decode_window(payload).get("device", "")).encode()
+        except ValueError:
+            return b""
+    match = DEVICE_PATTERN.search(payload)
+    return match.group(1) if match else b""
+
+def shard_of(device):
+    """Stable device -> worker mapping (the same on every start, unlike hash())."""
+    return zlib.crc32(device) % WORKER_PROCESSES
+
+def shed(device, amount=1):
+    """Count messages shed at a full inbox, with a warning at most every WARNING_INTERVAL seconds."""
+    global shed_count, last_warning
+    metrics.SHED_WINDOWS.labels(metrics.device_label(device.decode(errors="replace")), shedding.SHED_POLICY).inc(amount)
+    shed_count += amount
+    now = time.monotonic()
+    if now - last_warning >= shedding.WARNING_INTERVAL:
+        logging.warning(f"⚠️ A worker is falling behind: {shed_count} message(s) shed ({shedding.SHED_POLICY}) "
+                        f"at full inboxes since the last warning.")
+        last_warning, shed_count = now, 0
+
+def dispatch(inbox, topic, payload, device):
+    """
+    Queue a message for a worker without blocking the network thread, which also sends the keepalive pings.
+    A full inbox sheds by SHED_POLICY: the oldest queued message makes room for the new one (keep_every_k does
+    this for every SHED_KEEP_EVERY-th overflowing message of a device and drops the others). skip_inference cannot
+    mark raw messages, so it drops the oldest too; block waits for space, stalling the dispatcher as before.
+    """
+    if shedding.SHED_POLICY == "block":
+        inbox.put((topic, payload))
+        return
+    try:
+        inbox.put_nowait((topic, payload))
+        return
+    except queue.Full:
+        pass
+
+    if shedding.SHED_POLICY == "keep_every_k":
+        overflows[device] = overflows.get(device, 0) + 1
+        if overflows[device] % shedding.SHED_KEEP_EVERY:
+            shed(device)
+            return
+    try:
+        shed(device_of(*inbox.get_nowait()))
+    except queue.Empty:
+        pass  # The worker took it meanwhile
+    try:
+        inbox.put_nowait((topic, payload))
+    except queue.Full:
+        shed(device)
+
+# 📩 Dispatcher: every message of a device goes to the same worker, in order
+def on_message(client, userdata, message):
+    try:
+        device = device_of(message.topic, message.payload)
+        dispatch(inboxes[shard_of(device)], message.topic, message.payload, device)
+    except Exception as e:
+        logging.error(f"❌ [ERROR] Failed to dispatch incoming message: {e}", exc_info=True)
+
+def on_connect(client, userdata, flags, rc):
+    if rc == 0:
+        logging.info(f"✅ Dispatcher subscribed to {settings.SENSOR_MQTT_BROKER}:{settings.SENSOR_MQTT_PORT} [{settings.SENSOR_MQTT_TOPIC}]")
+        client.subscribe(settings.SENSOR_MQTT_TOPIC)
+        if settings.SENSOR_MQTT_BINARY_TOPIC:
+            client.subscribe(settings.SENSOR_MQTT_BINARY_TOPIC)
+    else:
+        logging.error(f"❌ Dispatcher subscription failed with code {rc}. Retrying...")
+
+dispatcher.on_connect = on_connect
+dispatcher.on_message = on_message
+
+def run():
+    """Start WORKER_PROCESSES analysis_core workers and restart any worker that exits."""
+    logging.info(f"🚀 Starting {WORKER_PROCESSES} worker processes ({WORKER_SHARDING} sharding)...")
+    if WORKER_SHARDING == "device":
+        inboxes.extend(context.Queue(maxsize=settings.BATCH_QUEUE_SIZE) for _ in range(WORKER_PROCESSES))
+    for index in range(WORKER_PROCESSES):
+        start_worker(index)
+
+    signal.signal(signal.SIGTERM, raise_interrupt)
+    try:
+        if WORKER_SHARDING == "device":
+            if settings.METRICS_ENABLE:
+                metrics.run(settings.METRICS_PORT + WORKER_PROCESSES)  # The port after the workers'
+            # Reconnects are handled by the network loop
+            dispatcher.connect_async(settings.SENSOR_MQTT_BROKER, settings.SENSOR_MQTT_PORT, 60)
+            dispatcher.loop_start()
+
+        while True:
+            time.sleep(1)
+            for index, process in list(workers.items()):
+                if not process.is_alive():
+                    logging.error(f"❌ Worker {index + 1} exited with code {process.exitcode}. Restarting...")
+                    start_worker(index)
+    except KeyboardInterrupt:
+        stop()
+
+def stop():
+    """Stop the dispatcher and let every worker flush and exit."""
+    logging.info("👋 [EXITING] Stopping worker processes...")
+    dispatcher.loop_stop()
+    dispatcher.disconnect()
+    metrics.stop()
+    for process in workers.values():
+        if process.is_alive():
+            process.terminate()  # SIGTERM: the worker flushes its pipeline and DB buffer
+    for process in workers.values():
+        process.join(timeout=settings.DB_BUFFER_BLOCK_TIMEOUT + 10)
+        if process.is_alive():
+            logging.warning(f"⚠️ {process.name} did not stop in time. Killing it.")
+            process.kill()
+    logging.info("✅ [EXITED] All workers stopped.")
+
+if __name__ == "__main__":
+    run()
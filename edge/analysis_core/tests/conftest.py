@@ -0,0 +1,70 @@
+import os
+import sys
+import types
+import joblib
+import numpy as np
+import pytest
+
+# The analysis_core modules are flat and import each other by name
+CORE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CORE_DIR)
+
+# Set before settings.py reads .env: tests that need the spool give the database their own
+os.environ.setdefault("SPOOL_ENABLE", "False")
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+else:
+    # dbmodel connects on import: point it at an in-memory server
+    import pymongo
+    pymongo.MongoClient = mongomock.MongoClient
+
+@pytest.fixture(scope="session")
+def load_model():
+    """Load a shipped model from models/ by file name (each file is read once per test run)."""
+    loaded = {}
+    def load(file_name):
+        if file_name not in loaded:
+            loaded[file_name] = joblib.load(os.path.join(CORE_DIR, "models", file_name))
+        return loaded[file_name]
+    return load
+
+@pytest.fixture
+def raw_windows(load_model):
+    """A batch of (windows, samples, features) float32 windows in the raw sensor range the scaler was fitted on."""
+    scaler = load_model("Scaler.joblib")
+    rng = np.random.default_rng(0)
+    return (rng.normal(0, 1, (8, 25, len(scaler.mean_))) * scaler.scale_ + scaler.mean_).astype(np.float32)
+
+@pytest.fixture
+def database():
+    """
+    dbmodel.db, the Database the pipeline modules share, on an empty in-memory server (needs mongomock).
+    Its buffer is flushed and the server emptied again after the test.
+    """
+    if mongomock is None:
+        pytest.skip("mongomock is not installed")
+    from dbmodel import db
+    db.client.drop_database("edge")
+    db.ensure_indexes()
+    yield db
+    db.close()
+    db.client.drop_database("edge")
+
+class Publisher:
+    """Stands in for the cloud MQTT client: keeps what is published, or fails every publish with `rc`."""
+
+    def __init__(self, rc=0):
+        self.rc = rc
+        self.messages = []
+
+    def publish(self, topic, payload):
+        if self.rc == 0:
+            self.messages.append(payload)
+        return types.SimpleNamespace(rc=self.rc)
+
+@pytest.fixture
+def publisher():
+    return Publisher()
@@ -0,0 +1,69 @@
+import datetime
+import numpy as np
+import settings
+import buckets
+
+DATE = datetime.datetime(2026, 10, 17, 10, 0, 0)
+
+def document(index, **fields):
+    """A packed window document as the pipeline stores it (outlier.feed_batch sets `validation` and `processed`)."""
+    samples = np.full((25, 23), index, dtype="<f4")
+    return dict({"device": "sensor01", "date": DATE + datetime.timedelta(milliseconds=index), "windowSize": 25,
+                 "data": samples.tobytes(), "shape": [25, 23], "label": 3}, **fields)
+
+VALID = {"validation": "checked", "processed": False}
+FAILED = {}  # Failed outlier validation: stored, but never synced
+UNCHECKED = {"validation": "unchecked"}
+PUBLISHED = {"validation": "checked", "processed": True}
+
+def bucket(documents, processed=0):
+    (device, start, _, _), windows = next(iter(buckets.group(documents).items()))
+    return dict(buckets.new_bucket(device, start, windows, processed), _id="bucket")
+
+def yielded(bucket_document, start=0):
+    return [document["_id"][1] for document in buckets.window_documents(bucket_document, start)]
+
+def test_windows_that_failed_validation_are_not_published():
+    stored = bucket([document(0, **VALID), document(1, **FAILED), document(2, **UNCHECKED), document(3, **VALID)])
+    assert yielded(stored) == [0, 3]
+    assert not stored["processed"]
+
+def test_bucket_without_windows_to_publish_is_processed():
+    stored = bucket([document(0, **FAILED), document(1, **UNCHECKED)])
+    assert yielded(stored) == []
+    assert stored["processed"]
+
+    operations, counts = buckets.updates([document(0, **FAILED), document(1, **UNCHECKED)])
+    update = operations[0]._doc
+    assert counts == [2]
+    assert "$set" not in update and update["$setOnInsert"]["processed"] is True
+
+def test_published_windows_are_not_published_again():
+    # Migrated documents: a published window after an unpublished one
+    windows = [document(0, **PUBLISHED), document(1, **VALID), document(2, **PUBLISHED), document(3, **FAILED)]
+    stored = bucket(windows, processed=1)
+    assert yielded(stored, stored["processedCount"]) == [1]
+
+def test_bulk_insert_appends_windows_to_their_bucket(database, monkeypatch):
+    monkeypatch.setattr(settings, "DB_BUCKET_MAX_WINDOWS", 3)
+    monkeypatch.setattr(database, "bucketed", True)
+    monkeypatch.setattr(database, "collection", database.db[settings.DB_BUCKET_COLLECTION])
+
+    assert database.bulk_insert([document(0, **VALID), document(1, **FAILED)]) == 0
+    # A second batch for the same period: one more window fills the bucket, the next one starts a new bucket
+    assert database.bulk_insert([document(2, **VALID)]) == 0
+    assert database.bulk_insert([document(3, **UNCHECKED), dict(document(4), data=None)]) == 1
+
+    first, second = database.collection.find().sort("count", -1)
+    assert (first["count"], second["count"]) == (3, 1)
+    assert first["date"] == second["date"] == buckets.bucket_start(DATE)
+    assert (first["minDate"], first["maxDate"]) == (DATE, DATE + datetime.timedelta(milliseconds=2))
+    samples, windows = buckets.unpack(first)
+    assert [window["publish"] for window in windows] == [True, False, True]
+    assert np.array_equal(samples[:, 0, 0], [0, 1, 2])
+    assert not first["processed"] and second["processed"]
+
+    # Publishing the first bucket's windows closes it
+    database.mark_processed([window["_id"] for window in buckets.window_documents(first)])
+    first = database.collection.find_one({"_id": first["_id"]})
+    assert first["processed"] and first["processedCount"] == 3
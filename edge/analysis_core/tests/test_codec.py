@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+import codec
+from window import Window
+
+META = {"device": "sensor01", "date": "2026-10-17T10:00:00+00:00", "windowSize": 25, "label": 3, "latency": 1.5}
+
+def test_binary_window_round_trip(raw_windows):
+    payload = codec.encode_window(META, raw_windows[0])
+    assert codec.is_binary_window(payload)
+
+    message = codec.decode_window(payload)
+    samples = message.pop("data")
+    assert message == META
+    assert samples.dtype == np.float32 and not samples.flags.writeable
+    assert np.array_equal(samples, raw_windows[0])
+    # The pipeline decodes binary and JSON payloads into the same window
+    json_window = Window.from_message(dict(META, data=codec.to_document_data(raw_windows[0])))
+    assert np.array_equal(Window.from_message(dict(message, data=samples)).samples, json_window.samples)
+
+def test_decode_window_rejects_other_payloads(raw_windows):
+    payload = codec.encode_window(META, raw_windows[0])
+    assert not codec.is_binary_window(b'{"device": "sensor01"}')
+    with pytest.raises(ValueError):
+        codec.decode_window(b"XXX" + payload[3:])
+    with pytest.raises(ValueError):
+        codec.decode_window(payload[:3] + bytes([codec.WINDOW_VERSION + 1]) + payload[4:])
+
+@pytest.mark.parametrize("compression", sorted(codec.COMPRESSORS))
+@pytest.mark.parametrize("dtype, atol", [("float32", 0), ("float16", 1e-2)])
+def test_training_payload_round_trip(raw_windows, compression, dtype, atol):
+    windows = raw_windows[:, :, :7] / np.abs(raw_windows).max()  # Reduced windows are small values
+    labels = np.arange(len(windows)) % 12
+    payload = codec.encode_training("edge01", windows, labels, dtype=dtype, compression=compression)
+
+    decoded = codec.decode_training(payload)
+    assert decoded["edge_id"] == "edge01" and decoded["count"] == len(windows)
+    assert np.allclose(decoded["data"], windows, rtol=0, atol=atol)
+    assert np.array_equal(decoded["label"], labels)
@@ -0,0 +1,103 @@
+import time
+import datetime
+import pytest
+import settings
+import spool
+import dbmodel
+
+UTC = datetime.timezone.utc
+
+@pytest.mark.parametrize("value, expected", [
+    ("2026-10-17T10:00:00.250000+00:00", datetime.datetime(2026, 10, 17, 10, 0, 0, 250000)),
+    ("2026-10-17T12:00:00+02:00", datetime.datetime(2026, 10, 17, 10, 0, 0)),
+    ("2026-10-17 05:30:00-04:30", datetime.datetime(2026, 10, 17, 10, 0, 0)),
+])
+def test_dates_with_an_offset_are_stored_as_utc(value, expected):
+    date = dbmodel.to_datetime(value)
+    assert date == expected and date.tzinfo is None
+
+def test_dates_without_an_offset_are_read_in_the_sensor_timezone(monkeypatch):
+    assert dbmodel.to_datetime("2026-10-17 10:00:00") == datetime.datetime(2026, 10, 17, 10, 0, 0)
+
+    zone = dbmodel.sensor_timezone("Europe/Brussels")
+    if zone is UTC:
+        pytest.skip("no time zone database")
+    monkeypatch.setattr(dbmodel, "SENSOR_TIMEZONE", zone)
+    # CEST (UTC+2) in summer, CET (UTC+1) in winter
+    assert dbmodel.to_datetime("2026-07-01 12:00:00") == datetime.datetime(2026, 7, 1, 10, 0, 0)
+    assert dbmodel.to_datetime("2026-12-01 12:00:00.5") == datetime.datetime(2026, 12, 1, 11, 0, 0, 500000)
+
+def test_unknown_timezone_falls_back_to_utc():
+    assert dbmodel.sensor_timezone("Nowhere/Atlantis") is UTC
+    assert dbmodel.sensor_timezone("utc") is UTC
+
+def test_values_that_are_not_iso_dates_are_kept():
+    date = datetime.datetime(2026, 10, 17, 10, 0, 0)
+    assert dbmodel.to_datetime(date) is date
+    assert dbmodel.to_datetime("yesterday") == "yesterday"
+    assert dbmodel.to_datetime(None) is None
+
+def test_migrate_dates_converts_local_string_dates(database, monkeypatch):
+    monkeypatch.setattr(dbmodel, "SENSOR_TIMEZONE", datetime.timezone(datetime.timedelta(hours=2)))
+    database.collection.insert_many([{"date": "2026-10-17 12:00:00"}, {"date": "not a date"}])
+    assert database.migrate_dates() == 1
+    assert sorted(map(str, database.collection.distinct("date"))) == ["2026-10-17 10:00:00", "not a date"]
+
+def windows(count, first=0):
+    return [{"device": "sensor01", "date": f"2026-10-17T10:00:{index:02d}+00:00", "index": index}
+            for index in range(first, first + count)]
+
+def stored_indexes(database):
+    return sorted(document["index"] for document in database.collection.find())
+
+def test_write_buffer_flushes_full_batches_and_the_rest_on_close(database, monkeypatch):
+    monkeypatch.setattr(settings, "DB_BUFFER_SIZE", 4)
+    monkeypatch.setattr(settings, "DB_BUFFER_MAX_AGE_MS", 60000)
+    flushed_batches = database.stats["flushed_batches"]
+
+    # A full batch goes out without waiting for DB_BUFFER_MAX_AGE_MS
+    assert database.write(windows(4))
+    deadline = time.monotonic() + 5
+    while database.collection.count_documents({}) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stored_indexes(database) == [0, 1, 2, 3]
+
+    assert database.write(windows(3, first=4))
+    database.close()
+    assert stored_indexes(database) == list(range(7))
+    assert database.stats["flushed_batches"] - flushed_batches == 2
+    assert database.collection.find_one({"index": 0})["date"] == datetime.datetime(2026, 10, 17, 10, 0, 0)
+
+def test_spooled_documents_are_replayed_once_mongodb_is_back(database, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "SPOOL_REPLAY_BATCH", 2)
+    monkeypatch.setattr(settings, "SPOOL_REPLAY_RATE", 0)
+    monkeypatch.setattr(database, "spool", spool.Spool(directory=str(tmp_path)))
+    monkeypatch.setattr(database, "available", False)
+
+    # MongoDB is down: the batch goes to disk
+    database.flush_batch(windows(5))
+    assert database.collection.count_documents({}) == 0
+    assert len(database.spool) == 1
+
+    database.available = True
+    database.replay()
+    assert stored_indexes(database) == list(range(5))
+    assert len(database.spool) == 0 and database.spool.stats["replayed_docs"] == 5
+    database.spool.close()
+
+def test_replay_resumes_after_the_last_replayed_batch(database, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "SPOOL_REPLAY_BATCH", 2)
+    monkeypatch.setattr(settings, "SPOOL_REPLAY_RATE", 0)
+    segments = spool.Spool(directory=str(tmp_path))
+    segments.append(windows(5))
+    name = segments.next_segment()
+    _, offsets = segments.read(name)
+    segments.mark_replayed(name, offsets[1], 2)  # An earlier run stored the first batch, then stopped
+    segments.close()
+
+    # The next start picks up the segment where the replay stopped
+    monkeypatch.setattr(database, "spool", spool.Spool(directory=str(tmp_path)))
+    database.replay()
+    assert stored_indexes(database) == [2, 3, 4]
+    assert len(database.spool) == 0
+    database.spool.close()
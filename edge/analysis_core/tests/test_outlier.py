@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import settings
+import registry
+import iforest
+import outlier
+
+MODEL_FILE = f"{settings.OUTLIER_MODEL}.joblib"
+
+@pytest.fixture
+def forest(load_model):
+    return load_model(MODEL_FILE)
+
+def scaled_windows(n_features, batch_size=64, seed=1):
+    """Scaled-looking windows with a varying share of corrupted samples, so both decisions occur."""
+    rng = np.random.default_rng(seed)
+    windows = rng.normal(0, 1, (batch_size, settings.SLIDING_WINDOW_SIZE, n_features)).astype(np.float32)
+    windows[rng.random(windows.shape[:2]) < rng.random((batch_size, 1))] *= 25
+    return windows
+
+def validate_with(model, windows):
+    """outlier.validate_batch with `model` as the outlier model."""
+    model_set = registry.ModelSet()
+    model_set.models["outlier"] = model
+    with registry.pinned(model_set):
+        return outlier.validate_batch(windows)
+
+def test_scores_and_predictions_match_sklearn(forest):
+    compiled = iforest.compile_forest(forest)
+    samples = scaled_windows(compiled.n_features).reshape(-1, compiled.n_features)
+    # Values right on the split thresholds must take the same branch
+    rng = np.random.default_rng(2)
+    samples[::7] = compiled.thresholds[rng.integers(0, len(compiled.thresholds), samples[::7].shape)]
+
+    assert np.array_equal(compiled.score_samples(samples), forest.score_samples(samples))
+    assert np.array_equal(compiled.decision_function(samples), forest.decision_function(samples))
+    assert np.array_equal(compiled.predict(samples), forest.predict(samples))
+
+def test_average_path_length_matches_the_formula():
+    n = np.array([0, 1, 2, 3, 256])
+    expected = [0.0, 0.0, 1.0, 2.0 * (np.log(2.0) + np.euler_gamma) - 4.0 / 3.0,
+                2.0 * (np.log(255.0) + np.euler_gamma) - 2.0 * 255.0 / 256.0]
+    assert np.array_equal(iforest.average_path_length(n), expected)
+
+@pytest.mark.parametrize("early_exit", [False, True])
+def test_validate_batch_matches_sklearn(forest, monkeypatch, early_exit):
+    monkeypatch.setattr(outlier, "OUTLIER_EARLY_EXIT", early_exit)
+    compiled = iforest.compile_forest(forest)
+    windows = scaled_windows(compiled.n_features)
+
+    expected = validate_with(forest, windows)
+    assert 0 < expected.sum() < len(windows)
+    assert np.array_equal(validate_with(compiled, windows), expected)
@@ -0,0 +1,62 @@
+import json
+import datetime
+import numpy as np
+from bson import ObjectId
+import settings
+import codec
+import pubsub
+
+START = datetime.datetime(2026, 10, 17, 10, 0, 0)
+
+def store(database, *feature_counts, first=0):
+    """Insert one unread window per entry (25 samples of that many features), in _id order. Returns their ids."""
+    documents = []
+    for index, n_features in enumerate(feature_counts, first):
+        samples = np.full((25, n_features), index, dtype=np.float32)
+        documents.append({"_id": ObjectId.from_datetime(START + datetime.timedelta(seconds=index)), "device": "sensor01",
+                          "date": START, "windowSize": 25, "data": codec.to_document_data(samples),
+                          "label": 3, "validation": "checked", "processed": False})
+    database.collection.insert_many(documents)
+    return [document["_id"] for document in documents]
+
+def published_records(publisher):
+    return [record for message in publisher.messages for record in json.loads(message)["data"]]
+
+def watermark(database):
+    return database.load_watermark(f"{settings.CLIENT_ID}/{database.collection_name}")
+
+def processed(database):
+    return {document["_id"]: document["processed"] for document in database.collection.find()}
+
+def test_watermark_sync_leaves_failed_windows_unprocessed(database, publisher):
+    # The middle window has 22 features, so the 23-feature reduction model fails on it
+    good, failed, last = store(database, 23, 22, 23)
+
+    pubsub.sync_watermark(publisher)
+
+    assert len(published_records(publisher)) == 2
+    assert processed(database) == {good: True, failed: False, last: True}
+    assert watermark(database) == last
+
+def test_watermark_sync_resumes_after_a_failed_publish(database, publisher, monkeypatch):
+    monkeypatch.setattr(settings, "CLOUD_SYNC_BATCH_SIZE", 2)
+    ids = store(database, 23, 23, 23, 23)
+    publish = publisher.publish
+    def publish_once(topic, payload):
+        info = publish(topic, payload)
+        publisher.rc = 1  # The broker goes away after the first message
+        return info
+
+    monkeypatch.setattr(publisher, "publish", publish_once)
+    pubsub.sync_watermark(publisher)
+    assert watermark(database) == ids[1]
+    assert processed(database) == dict(zip(ids, [True, True, False, False]))
+
+    # The next sync starts after the watermark and publishes every window once
+    monkeypatch.setattr(publisher, "publish", publish)
+    publisher.rc = 0
+    new_ids = store(database, 23, first=len(ids))
+    pubsub.sync_watermark(publisher)
+    assert len(published_records(publisher)) == 5
+    assert watermark(database) == new_ids[-1]
+    assert all(processed(database).values())
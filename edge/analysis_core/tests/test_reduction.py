@@ -0,0 +1,26 @@
+import copy
+import numpy as np
+import pytest
+import reduction
+
+# float32 GEMM against the float64 scikit-learn result (same tolerance as benchmarks/reduction.py)
+RTOL = 1e-4
+ATOL = 1e-4
+
+def two_step(scaler, pca, windows):
+    """The reference path: scikit-learn scaler, then scikit-learn PCA."""
+    samples = windows.reshape(-1, windows.shape[-1])
+    return pca.transform(scaler.transform(samples)).reshape(*windows.shape[:-1], -1)
+
+@pytest.mark.parametrize("file_name", ["PCA.joblib", "PCA_7.joblib"])
+@pytest.mark.parametrize("whiten", [False, True])
+def test_fused_transform_matches_scaler_then_pca(load_model, raw_windows, file_name, whiten):
+    scaler = load_model("Scaler.joblib")
+    pca = copy.deepcopy(load_model(file_name))
+    pca.whiten = whiten
+
+    fused = reduction.FusedReduction(scaler, pca).transform(raw_windows)
+    expected = two_step(scaler, pca, raw_windows)
+
+    assert fused.shape == expected.shape == raw_windows.shape[:-1] + (pca.n_components_,)
+    assert np.allclose(fused, expected, rtol=RTOL, atol=ATOL)
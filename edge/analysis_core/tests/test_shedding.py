@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+import pytest
+import shedding
+
+def window(device, index=0):
+    return SimpleNamespace(device=device, index=index, skip_inference=False)
+
+def drain(buffers):
+    windows = []
+    while True:
+        item = buffers.get()
+        if item is None:
+            return windows
+        windows.append(item)
+
+@pytest.mark.parametrize("policy", ["drop_oldest", "keep_every_k", "skip_inference"])
+def test_more_devices_than_total_size_with_one_window_each(policy):
+    buffers = shedding.DeviceBuffers(policy, device_size=4, total_size=3)
+    for index in range(10):
+        buffers.put(window(f"sensor{index}", index))
+
+    limit = 2 * buffers.total_size if policy == "skip_inference" else buffers.total_size
+    assert len(buffers) <= limit
+    windows = drain(buffers)  # Must not serve devices whose queue was emptied by shedding
+    assert len(windows) <= limit
+    assert len(buffers) == 0 and not buffers.queues and not buffers.ready
+
+def test_keep_every_k_thins_a_device_backlog():
+    buffers = shedding.DeviceBuffers("keep_every_k", device_size=4, total_size=100)
+    for index in range(5):
+        buffers.put(window("sensor", index))
+    assert [item.index for item in drain(buffers)] == [0, 2, 4]
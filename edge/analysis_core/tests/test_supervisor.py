@@ -0,0 +1,30 @@
+import queue
+import pytest
+import shedding
+import supervisor
+
+def message(device, index):
+    return "sensor/data", b'{"device": "%s", "index": %d}' % (device, index)
+
+def fill(inbox, policy, monkeypatch, messages):
+    monkeypatch.setattr(shedding, "SHED_POLICY", policy)
+    monkeypatch.setattr(supervisor, "overflows", {})
+    for topic, payload in messages:
+        supervisor.dispatch(inbox, topic, payload, supervisor.device_of(topic, payload))
+    queued = []
+    while not inbox.empty():
+        queued.append(inbox.get_nowait()[1])
+    return queued
+
+@pytest.mark.parametrize("policy", ["drop_oldest", "skip_inference"])
+def test_full_inbox_drops_the_oldest_message(monkeypatch, policy):
+    inbox = queue.Queue(maxsize=2)
+    queued = fill(inbox, policy, monkeypatch, [message(b"s1", i) for i in range(5)])
+    assert queued == [message(b"s1", 3)[1], message(b"s1", 4)[1]]
+
+def test_keep_every_k_lets_every_kth_overflowing_message_in(monkeypatch):
+    monkeypatch.setattr(shedding, "SHED_KEEP_EVERY", 3)
+    inbox = queue.Queue(maxsize=2)
+    # Messages 2..7 overflow: only the 3rd and 6th of them (4 and 7) replace the oldest queued message
+    queued = fill(inbox, "keep_every_k", monkeypatch, [message(b"s1", i) for i in range(8)])
+    assert queued == [message(b"s1", 4)[1], message(b"s1", 7)[1]]
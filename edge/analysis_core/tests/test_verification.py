@@ -0,0 +1,41 @@
+import inference
+import outlier
+import pipeline
+import verification
+from window import Window
+
+def windows(raw_windows, label=3, device="sensor01"):
+    return [Window(samples, {"device": device, "label": label}) for samples in raw_windows]
+
+def test_sensor_labels_are_normalized_without_inference(raw_windows, monkeypatch):
+    monkeypatch.setattr(inference, "INFERENCE_ENABLE", False)
+    monkeypatch.setattr(outlier, "OUTLIER_ENABLE", False)
+
+    documents = pipeline.analyze_batch(windows(raw_windows))
+    assert {document["label"] for document in documents} == {3 - verification.SENSOR_LABEL_OFFSET}
+    assert {document["labelSource"] for document in documents} == {"sensor"}
+
+def test_normalize_applies_the_offset_once(raw_windows):
+    batch = windows(raw_windows[:1])
+    verification.normalize(batch)
+    verification.normalize(batch)
+    assert batch[0].message["label"] == 3 - verification.SENSOR_LABEL_OFFSET
+
+def test_all_policy_verifies_every_window(raw_windows, monkeypatch):
+    monkeypatch.setattr(verification, "VERIFY_POLICY", "all")
+    monkeypatch.setattr(verification, "devices", {})
+    batch = windows(raw_windows)
+    verification.normalize(batch)
+    for _ in range(verification.VERIFY_WARMUP + 1):
+        verification.record(batch[0], batch[0].message["label"])
+    assert verification.select(batch) == batch
+
+def test_random_policy_trusts_a_warmed_up_device(raw_windows, monkeypatch):
+    monkeypatch.setattr(verification, "VERIFY_POLICY", "random")
+    monkeypatch.setattr(verification, "devices", {})
+    batch = windows(raw_windows)
+    verification.normalize(batch)
+    for _ in range(verification.VERIFY_WARMUP):
+        verification.record(batch[0], batch[0].message["label"])
+    verification.device_state("sensor01").rate = 0.0
+    assert verification.select(batch) == []
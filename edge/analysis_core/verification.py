@@ -0,0 +1,138 @@
+import random
+import logging
+import threading
+import settings
+import metrics
+
+# Configure Logging
+logging.basicConfig(
+    level=settings.LOG_LEVEL,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Load Settings
+VERIFY_POLICY = settings.VERIFY_POLICY
+VERIFY_RATE = min(max(settings.VERIFY_RATE, 0.0), 1.0)
+VERIFY_MAX_RATE = min(max(settings.VERIFY_MAX_RATE, VERIFY_RATE), 1.0)
+VERIFY_MIN_AGREEMENT = settings.VERIFY_MIN_AGREEMENT
+VERIFY_MIN_CONFIDENCE = settings.VERIFY_MIN_CONFIDENCE
+VERIFY_WARMUP = max(0, settings.VERIFY_WARMUP)
+SENSOR_LABEL_OFFSET = settings.SENSOR_LABEL_OFFSET
+
+# Weight of one verified window in the moving agreement rate (~ average over VERIFY_AGREEMENT_WINDOW windows)
+AGREEMENT_WEIGHT = 2 / (max(1, settings.VERIFY_AGREEMENT_WINDOW) + 1)
+RATE_DECAY = 0.9  # Sampling of a device that agrees again falls back by 10% per verified window
+
+class DeviceState:
+    """Verification state of one sensor."""
+    __slots__ = ("rate", "agreement", "verified", "agreed", "flagged")
+
+    def __init__(self):
+        self.rate = VERIFY_RATE  # Share of the device's windows that are re-inferred
+        self.agreement = 1.0  # Moving agreement rate of the verified windows
+        self.verified = 0
+        self.agreed = 0
+        self.flagged = False  # Agreement is below VERIFY_MIN_AGREEMENT
+
+devices = {}
+_lock = threading.Lock()
+_random = random.Random()
+
+def device_state(device):
+    state = devices.get(device)
+    if state is None:
+        with _lock:
+            state = devices.setdefault(device, DeviceState())
+    return state
+
+def normalize(windows):
+    """
+    Convert the labels sent by the sensors to the edge model's classes, once per window and before
+    the verify/trust split, so a stored label means the same on every path (trusted, verified, or
+    verified but rejected by the outlier check). Labels that are not numbers are left as they are.
+    """
+    for window in windows:
+        message = window.message
+        label = message.get("label")
+        if "labelSource" in message or isinstance(label, bool) or not isinstance(label, (int, float)):
+            continue
+        message["label"] = int(label) - SENSOR_LABEL_OFFSET
+        message["labelSource"] = "sensor"
+
+def sensor_label(window):
+    """The sensor's label in the edge model's classes (see `normalize`). None if the message has none."""
+    if window.message.get("labelSource") != "sensor":
+        return None
+    return window.message["label"]
+
+def needs_verification(window):
+    """Decide whether the edge model re-infers this window or trusts the sensor's label."""
+    if VERIFY_POLICY == "all" or sensor_label(window) is None:
+        return True
+    state = device_state(window.device)
+    if state.verified < VERIFY_WARMUP:
+        return True  # New devices are verified until their agreement rate means something
+    if VERIFY_POLICY == "confidence":
+        confidence = window.message.get("confidence")
+        if not isinstance(confidence, (int, float)) or confidence < VERIFY_MIN_CONFIDENCE:
+            return True
+    return _random.random() < state.rate
+
+def select(windows):
+    """
+    Split a batch of normalized windows (see `normalize`) into the windows to verify with the edge
+    model and the trusted ones, which keep the sensor's label. Returns the windows to verify.
+    """
+    verify = []
+    for window in windows:
+        if needs_verification(window):
+            verify.append(window)
+        else:
+            metrics.TRUSTED_WINDOWS.labels(metrics.device_label(window.device)).inc()
+    return verify
+
+def record(window, edge_label):
+    """
+    Compare the edge model's label with the sensor's and adapt the device's sampling:
+    doubled on every verified window while its agreement is below VERIFY_MIN_AGREEMENT,
+    then lowered back towards VERIFY_RATE once it agrees again.
+    """
+    label = sensor_label(window)
+    device = window.device
+    device_label = metrics.device_label(device)
+    if label is None:
+        metrics.VERIFIED_WINDOWS.labels(device_label, "unlabelled").inc()
+        return
+
+    agreed = label == edge_label
+    metrics.VERIFIED_WINDOWS.labels(device_label, "agree" if agreed else "disagree").inc()
+    state = device_state(device)
+    with _lock:
+        state.verified += 1
+        state.agreed += agreed
+        state.agreement += AGREEMENT_WEIGHT * (agreed - state.agreement)
+        if state.verified < VERIFY_WARMUP:
+            return
+        was_flagged = state.flagged
+        state.flagged = state.agreement < VERIFY_MIN_AGREEMENT
+        if state.flagged:
+            state.rate = min(VERIFY_MAX_RATE, max(state.rate * 2, 0.01))
+        else:
+            state.rate = max(VERIFY_RATE, state.rate * RATE_DECAY)
+        agreement, rate = state.agreement, state.rate
+
+    metrics.VERIFY_AGREEMENT.labels(device_label).set(agreement)
+    metrics.VERIFY_SAMPLING.labels(device_label).set(rate)
+    if state.flagged and not was_flagged:
+        logging.warning(f"⚠️ Sensor '{device}' agrees with the edge model on {agreement:.0%} of its labels. Verifying more of its windows.")
+    elif was_flagged and not state.flagged:
+        logging.info(f"✅ Sensor '{device}' agrees with the edge model again ({agreement:.0%}). Sampling falls back to {VERIFY_RATE:.0%}.")
+
+def run():
+    """Log the verification policy."""
+    if VERIFY_POLICY == "all":
+        logging.info("🔍 Label verification: every window is re-inferred on the edge.")
+    else:
+        logging.info(f"🔍 Label verification: {VERIFY_POLICY} sampling of {VERIFY_RATE:.0%} of the sensor labels "
+                     f"(up to {VERIFY_MAX_RATE:.0%} below {VERIFY_MIN_AGREEMENT:.0%} agreement, first {VERIFY_WARMUP} windows per device).")
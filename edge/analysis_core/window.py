@@ -0,0 +1,64 @@
+from collections import defaultdict
+import numpy as np
+import codec
+
+class Window:
+    """
+    A sensor window decoded once per message.
+    Holds the contiguous float32 (window, features) samples next to the message
+    metadata, and caches the arrays derived from them by the analysis stages.
+    """
+    __slots__ = ("samples", "message", "scaled", "reduced", "skip_inference")
+
+    def __init__(self, samples, message):
+        self.samples = samples  # (window, features) float32 array, None if the message has no usable window
+        self.message = message  # Message fields (device, date, windowSize, label, latency, ...) and stage results
+        self.scaled = None  # Cached output of the scaler
+        self.reduced = None  # Cached output of the reduction stage
+        self.skip_inference = False  # Set when the window was shed from inference under overload
+
+    @classmethod
+    def from_message(cls, data):
+        """Build a window from a decoded MQTT message or a stored document."""
+        samples = data.get("data")
+        if isinstance(samples, np.ndarray):
+            # Binary payloads are already decoded into an array
+            return cls(np.ascontiguousarray(samples, dtype=np.float32), data)
+        if not isinstance(samples, dict) or not samples:
+            return cls(None, data)
+
+        # {"<sample>": {"<feature>": value}} -> (window, features)
+        try:
+            features = list(next(iter(samples.values())))
+            rows = [[row[feature] for feature in features] for row in samples.values()]
+            return cls(np.array(rows, dtype=np.float32), data)
+        except (KeyError, TypeError, ValueError):
+            return cls(None, data)
+
+    @property
+    def device(self):
+        return self.message.get("device", "Unknown_Sensor")
+
+    def to_document(self, packed=False):
+        """
+        Return the message as a MongoDB document, with the samples in the nested dict layout,
+        or with `packed` as float32 bytes plus their shape (for the bucket layout).
+        """
+        if packed and self.samples is not None:
+            self.message["data"] = np.ascontiguousarray(self.samples, dtype="<f4").tobytes()
+            self.message["shape"] = list(self.samples.shape)
+        elif isinstance(self.message.get("data"), np.ndarray):
+            self.message["data"] = codec.to_document_data(self.samples)
+        return self.message
+
+def group_by_shape(windows):
+    """Group windows with a usable sample array by shape, so each group can be stacked."""
+    groups = defaultdict(list)
+    for window in windows:
+        if window.samples is not None:
+            groups[window.samples.shape].append(window)
+    return list(groups.values())
+
+def stack(windows, attribute="samples"):
+    """Stack one array attribute of same-shaped windows into a (batch, window, features) array."""
+    return np.stack([getattr(window, attribute) for window in windows])
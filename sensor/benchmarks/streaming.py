@@ -0,0 +1,108 @@
+"""
+Streaming inference benchmark for the sensor.
+
+Feeds a subject's samples one at a time through the ring buffer and the TFLite
+model, like the sensor does with `Stride` set, and reports for every stride,
+thread count and delegate: the time per window (copy into the input tensor and
+inference, p50/p99), the CPU time per window and the CPU share the sensor needs
+to keep up with `Rate`. The windows are checked against plain slices of the
+samples first. A tumbling-window row with the previous list + np.array input is
+included for comparison.
+
+Usage: python benchmarks/streaming.py [--subject subject1] [--window 100] [--strides 100,50,25]
+                                      [--threads 1,2] [--delegates xnnpack,none] [--samples 3000]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+SENSOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SENSOR_DIR)
+os.chdir(SENSOR_DIR)  # Model and data paths are relative to the sensor folder
+
+import joblib
+import inference
+import loadgen
+
+def int_list(value):
+    return [int(item) for item in value.split(",")]
+
+def check_windows(model, samples, window, stride, count=5):
+    """The ring buffer must hand the model the same windows as slicing the samples."""
+    ring = inference.SlidingWindow(window, stride)
+    checked = 0
+    for index, sample in enumerate(samples):
+        if ring.push(sample):
+            ring.copy_to(model.input_buffer())
+            first = index + 1 - window
+            if not np.array_equal(model.input_buffer(), samples[first:index + 1].astype(np.float32)):
+                raise AssertionError(f"Window ending at sample {index} differs from the samples (stride {stride})")
+            checked += 1
+            if checked == count:
+                return
+
+def measure(model, samples, window, stride, streaming=True):
+    """Run every window of the stream. Returns (per-window seconds, CPU seconds)."""
+    durations = []
+    ring = inference.SlidingWindow(window, stride)
+    list_of_data = []
+    start_cpu = time.process_time()
+    for sample in samples:
+        if streaming:
+            if ring.push(sample):
+                start = time.perf_counter()
+                ring.copy_to(model.input_buffer())
+                model.run()
+                durations.append(time.perf_counter() - start)
+        else:
+            # Previous tumbling input: a list of samples turned into a new array per window
+            list_of_data.append(sample)
+            if len(list_of_data) == window:
+                start = time.perf_counter()
+                model.run(np.array(list_of_data).reshape(1, window, -1))
+                durations.append(time.perf_counter() - start)
+                list_of_data = []
+    return durations, time.process_time() - start_cpu
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-window latency and CPU use of streaming inference per stride.")
+    parser.add_argument("--subject", default=inference.subject, help="subject in data/ (packed, per-sample files or .log)")
+    parser.add_argument("--window", type=int, default=100, help="samples per window")
+    parser.add_argument("--strides", type=int_list, default=[100, 50, 25], help="comma-separated strides")
+    parser.add_argument("--threads", type=int_list, default=[1], help="comma-separated interpreter thread counts")
+    parser.add_argument("--delegates", default="xnnpack,none", help="comma-separated delegates (xnnpack, none)")
+    parser.add_argument("--samples", type=int, default=3000, help="samples streamed per configuration")
+    parser.add_argument("--rate", type=float, default=inference.sampling_rate, help="sampling rate in Hz, for the CPU share")
+    args = parser.parse_args()
+
+    inference.check_model()
+    samples = loadgen.load_subject(args.subject, joblib.load(inference.scaler_file))
+    samples = np.asarray(samples, dtype=np.float64)
+    samples = np.resize(samples, (max(args.samples, args.window), samples.shape[1]))  # Repeats a short recording
+
+    print(f"{'delegate':<10}{'threads':>8}{'stride':>8}{'labels/s':>10}{'windows':>9}"
+          f"{'p50 ms':>9}{'p99 ms':>9}{'CPU ms/win':>12}{'CPU at rate':>13}")
+    for delegate in args.delegates.split(","):
+        for threads in args.threads:
+            inference.delegate, inference.threads = delegate, threads
+            model = inference.Model(args.window)
+            model.run()  # Warm up (the delegate prepares its kernels on the first run)
+
+            rows = [(f"{stride}", stride, True) for stride in args.strides]
+            rows.append(("list", args.window, False))
+            for label, stride, streaming in rows:
+                if streaming:
+                    check_windows(model, samples, args.window, stride)
+                durations, cpu = measure(model, samples, args.window, stride, streaming)
+                durations = np.array(durations) * 1000
+                labels_per_s = args.rate / stride
+                cpu_per_window = cpu / len(durations)
+                print(f"{delegate:<10}{threads:>8}{label:>8}{labels_per_s:>10.2f}{len(durations):>9}"
+                      f"{np.percentile(durations, 50):>9.3f}{np.percentile(durations, 99):>9.3f}"
+                      f"{cpu_per_window * 1000:>12.3f}{cpu_per_window * labels_per_s:>13.2%}")
+    print(f"✅ Streaming windows match the sample slices (window {args.window}, strides {args.strides}).")
+
+if __name__ == "__main__":
+    main()
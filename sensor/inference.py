@@ -1,11 +1,13 @@
 import numpy as np
-import tflite_runtime.interpreter as tflite
 import os
+import re
 import time
 import pandas as pd
 import joblib
 import json
-from datetime import datetime
+import struct
+from collections import deque
+from datetime import datetime, timezone
 import paho.mqtt.client as mqtt
 
 # Load environment variables safely
@@ -13,7 +15,7 @@ def get_env_variable(var_name, default_value, convert_func=str):
     """Fetch environment variable and convert to correct type."""
     value = os.getenv(var_name, default_value)
     try:
-        return convert_func(value.strip('"'))
+        return convert_func(str(value).strip('"'))
     except ValueError:
         print(f"⚠️ Warning: Invalid value for {var_name}. Using default: {default_value}")
         return default_value
@@ -26,58 +28,340 @@ mqtt_topic = get_env_variable("Topic", "sensor/data")
 window_size = get_env_variable("WindowSize", 25, int)
 sampling_rate = get_env_variable("Rate", 50, int)
 work_time = get_env_variable("Time", 60, int) * 60  # Convert minutes to seconds
+encoding = get_env_variable("Encoding", "json").lower()  # Options: json, binary
+mode = get_env_variable("Mode", "single").lower()  # Options: single (this device), loadgen (many virtual sensors, see loadgen.py)
+packed = get_env_variable("Packed", "auto").lower()  # Options: auto (use the subject file written by pack.py if present), off
+qos = get_env_variable("QoS", "0", int)  # MQTT QoS of the published windows (0, 1 or 2)
+in_flight = get_env_variable("InFlight", "20", int)  # QoS 1/2 windows that may wait for the broker's ack at once
+stride = get_env_variable("Stride", "0", int)  # 0: tumbling windows; N: streaming, an overlapping window every N samples
+threads = get_env_variable("Threads", "1", int)  # TFLite interpreter threads
+delegate = get_env_variable("Delegate", "xnnpack").lower()  # Options: xnnpack (TFLite's default CPU delegate), none (built-in kernels only)
 
 # Define paths
 data_path = os.path.join("data", subject)
 scaler_file = "model/Scaler.joblib"
 model_file = "model/model.tflite"
 
-# Ensure data path exists
-if not os.path.exists(data_path):
-    print(f"⚠️ Warning: Data path '{data_path}' does not exist. Creating it now.")
-    os.makedirs(data_path, exist_ok=True)
-
-# Ensure model exists
-if not os.path.exists(model_file):
-    raise FileNotFoundError(f"❌ Error: Model file '{model_file}' not found!")
-
-# List sensor data files
-list_of_sensor_data_file = os.listdir(data_path) if os.path.exists(data_path) else []
-if not list_of_sensor_data_file:
-    print(f"⚠️ Warning: No sensor data files found in '{data_path}'.")
-
-# Start measuring execution time
-print("📡 IoT device activated.", 
-      f"\n✅ Device Name: {sensor_name}",
-      f"\n📊 Sampling Data: {subject}",
-      f"\n🔗 MQTT Broker: {mqtt_broker}",
-      f"\n📡 Topic: {mqtt_topic}",
-      f"\n🔄 Inference Window Size: {window_size}",
-      f"\n⏳ Sampling Rate: {sampling_rate} Hz",
-      f"\n🕒 Execution Time: {work_time / 60} mins")
-
-start_work = time.time()
-
-def load_to_json(data, class_label_array, n_fields, latency, sliding_window=25):
-    """Convert processed data into JSON format for MQTT."""
+LATENCY_SAMPLES = 10000  # Latest windows kept for the latency percentiles of the final report
+
+def sample_order(name):
+    """Sort key that puts numbered sample files in numeric order (2.npy before 10.npy)."""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+def list_sensor_data(data_path):
+    """List the sample files of a subject in recording order, creating its data folder if it does not exist."""
+    if not os.path.exists(data_path):
+        print(f"⚠️ Warning: Data path '{data_path}' does not exist. Creating it now.")
+        os.makedirs(data_path, exist_ok=True)
+    files = sorted(os.listdir(data_path), key=sample_order)
+    if not files:
+        print(f"⚠️ Warning: No sensor data files found in '{data_path}'.")
+    return files
+
+def packed_path(subject, scaled=True):
+    """Where pack.py stores a subject: pre-scaled, or raw for scaling at runtime."""
+    return os.path.join("data", f"{subject}.npy" if scaled else f"{subject}.raw.npy")
+
+def load_packed(subject):
+    """
+    Memory-map a subject packed by pack.py as a read-only (samples, 23) float32 array.
+    Returns (samples, is_scaled), or (None, False) if the subject is not packed.
+    """
+    for scaled in (True, False):
+        path = packed_path(subject, scaled)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r"), scaled
+    return None, False
+
+def window_view(samples, window, hop):
+    """
+    (windows, 1, window, 23) view on the packed samples, one window every `hop` samples.
+    Nothing is copied or read until a window is used.
+    """
+    count = (len(samples) - window) // hop + 1 if len(samples) >= window else 0
+    row_stride, value_stride = samples.strides
+    return np.lib.stride_tricks.as_strided(
+        samples, shape=(count, 1, window, samples.shape[1]),
+        strides=(hop * row_stride, 0, row_stride, value_stride), writeable=False,
+    )
+
+def check_model():
+    # Ensure model exists
+    if not os.path.exists(model_file):
+        raise FileNotFoundError(f"❌ Error: Model file '{model_file}' not found!")
+
+class Model:
+    """
+    The on-device TFLite model, with its input resized to (1, window, 23) when `window` differs
+    from the model's. Tensor indices are looked up once, and windows can be written straight
+    into the interpreter's input tensor (set_input, input_buffer) instead of being passed to run().
+    """
+
+    def __init__(self, window=None):
+        import tflite_runtime.interpreter as tflite  # Not needed to pack data
+        # XNNPACK is applied by TFLite's default op resolver; "none" keeps the built-in kernels only
+        resolver = (tflite.OpResolverType.AUTO if delegate == "xnnpack"
+                    else tflite.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES)
+        self.interpreter = tflite.Interpreter(model_path=model_file, num_threads=threads,
+                                              experimental_op_resolver_type=resolver)
+        input_details = self.interpreter.get_input_details()[0]
+        if window is not None and input_details["shape"][1] != window:
+            self.interpreter.resize_tensor_input(input_details["index"], [1, window, input_details["shape"][2]])
+        self.interpreter.allocate_tensors()
+        self.input_index = input_details["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.input_tensor = self.interpreter.tensor(self.input_index)  # Returns a view on the input buffer
+
+    def input_buffer(self):
+        """
+        (window, 23) float32 view on the interpreter's input tensor. The interpreter refuses
+        to run while such a view is alive, so write into it and let it go before run().
+        """
+        return self.input_tensor()[0]
+
+    def set_input(self, window, scaler_model=None):
+        """Copy one (window, 23) window into the input tensor, scaling raw samples on the way."""
+        buffer = self.input_buffer()
+        if scaler_model is None:
+            buffer[...] = window
+        else:
+            # The scaler's own arithmetic, without a temporary window
+            np.subtract(window, scaler_model.mean_, out=buffer)
+            buffer /= scaler_model.scale_
+
+    def run(self, input_data=None):
+        """
+        Run the model on one (1, window, 23) window, or on the window already written into
+        input_buffer() if `input_data` is None. Returns (output, latency in ms).
+        """
+        # Measure inference latency
+        start_latency = time.time()
+
+        # Run inference
+        if input_data is not None:
+            self.input_tensor()[...] = input_data  # Converted to float32 in place
+        self.interpreter.invoke()
+        output_data = self.interpreter.get_tensor(self.output_index)
+
+        # Stop latency measurement
+        return output_data, (time.time() - start_latency) * 1000  # Convert to ms
+
+class SlidingWindow:
+    """
+    Preallocated ring buffer of the last `size` samples for streaming inference.
+    push() stores one sample and returns True every `stride` samples once the buffer is full;
+    copy_to() then writes the window, oldest sample first, into e.g. Model.input_buffer().
+    """
+
+    def __init__(self, size, stride, n_fields=23):
+        self.size = size
+        self.stride = stride
+        self.buffer = np.zeros((size, n_fields), dtype=np.float32)
+        self.position = 0  # Slot of the next sample, which holds the oldest one once the buffer is full
+        self.count = 0
+
+    def push(self, sample):
+        self.buffer[self.position] = np.reshape(sample, -1)
+        self.position = (self.position + 1) % self.size
+        self.count += 1
+        return self.count >= self.size and (self.count - self.size) % self.stride == 0
+
+    def copy_to(self, out):
+        oldest = self.size - self.position
+        out[:oldest] = self.buffer[self.position:]
+        out[oldest:] = self.buffer[:self.position]
+
+def class_probabilities(output_data):
+    """
+    Class probabilities of one window. A model resized to a longer window returns
+    one row per block of its original window; their probabilities are averaged.
+    """
+    return output_data.reshape(-1, output_data.shape[-1]).mean(axis=0)
+
+def predicted_label(output_data):
+    """Activity label (1-based) from the model output."""
+    return int(class_probabilities(output_data).argmax() + 1)
+
+def predicted_confidence(output_data):
+    """Probability of the predicted label. The edge re-checks less confident labels first."""
+    return float(class_probabilities(output_data).max())
+
+def window_json(data, n_fields, sliding_window=25):
+    """The "data" field of a JSON message: {sample: {feature: value}}."""
     x_json = pd.DataFrame(data.reshape(n_fields, sliding_window)).to_json(force_ascii=False)
-    x_json = json.loads(x_json)
+    return json.loads(x_json)
+
+def label_fields(class_label_array):
+    """Predicted label and its confidence, or nothing for windows that were not classified (class_label_array=None)."""
+    if class_label_array is None:
+        return {}
+    return {
+        "label": predicted_label(class_label_array),  # Get predicted label
+        "confidence": predicted_confidence(class_label_array),
+    }
+
+def timestamp():
+    """Current time as an ISO date with its UTC offset, so the edge stores it as UTC whatever its time zone."""
+    return datetime.now(timezone.utc).isoformat()
+
+def load_to_json(data, class_label_array, n_fields, latency, sliding_window=25, device=None):
+    """Convert processed data into JSON format for MQTT."""
+    x_json = window_json(data, n_fields, sliding_window)
     
     return {
-        "device": sensor_name,
-        "date": str(datetime.now()),
+        "device": device or sensor_name,
+        "date": timestamp(),
         "windowSize": sliding_window,
         "data": x_json,
-        "label": int(class_label_array.argmax() + 1),  # Get predicted label
+        **label_fields(class_label_array),
         "latency": float(latency)
     }
 
+# Binary window payload (decoded on the edge by analysis_core/codec.py)
+# [ magic "ITW" | version (u8) | header length (u16 LE) | JSON header | little-endian float32 samples ]
+WINDOW_PREFIX = struct.Struct("<3sBH")
+
+def load_to_binary(data, class_label_array, n_fields, latency, sliding_window=25, device=None):
+    """Convert processed data into a compact binary payload for MQTT."""
+    # Same sample layout the edge decodes from the JSON payload
+    samples = np.ascontiguousarray(data.reshape(n_fields, sliding_window).T, dtype="<f4")
+    header = json.dumps({
+        "device": device or sensor_name,
+        "date": timestamp(),
+        "windowSize": sliding_window,
+        **label_fields(class_label_array),
+        "latency": float(latency),
+        "dtype": "<f4",
+        "shape": list(samples.shape)
+    }, separators=(",", ":")).encode()
+    header += b" " * (-(WINDOW_PREFIX.size + len(header)) % 4)  # Align samples to 4 bytes
+    return WINDOW_PREFIX.pack(b"ITW", 1, len(header)) + header + samples.tobytes()
+
+class FixedRatePublisher:
+    """
+    Publishes one window every `period` seconds. Windows are due on a monotonic timetable
+    (due times advance by the period), so inference and publishing do not slow the rate down.
+    The MQTT network loop runs in the background and services QoS acks and keepalives.
+    """
+
+    def __init__(self, client, period):
+        self.client = client
+        self.period = period
+        self.next_due = None
+        self.published = 0
+        self.overruns = 0  # Windows that started after their due time
+        self.skipped = 0  # Window slots given up to get back on schedule
+        self.failed = 0
+        self.last_info = None
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # (latency, inference latency) in ms
+        self.start = None
+        self.start_cpu = None
+
+    def wait(self):
+        """Sleep until the next window is due and return its due time."""
+        now = time.monotonic()
+        if self.next_due is None:
+            self.next_due = now
+            # CPU use is reported from the first window on, without loading the models
+            self.start, self.start_cpu = now, time.process_time()
+        elif now < self.next_due:
+            time.sleep(self.next_due - now)
+        else:
+            self.overruns += 1
+            behind = now - self.next_due
+            if behind >= self.period:
+                # More than a whole period late: give up the missed slots instead of bursting to catch up
+                missed = int(behind // self.period)
+                self.skipped += missed
+                self.next_due += missed * self.period
+                print(f"⚠️ {sensor_name} is {behind * 1000:.0f} ms behind schedule, skipping {missed} window(s).")
+        due = self.next_due
+        self.next_due += self.period
+        return due
+
+    def publish_window(self, model, input_data=None):
+        """
+        Wait for the window's due time, run inference on it and publish it.
+        Without `input_data`, the window already written into the model's input buffer is used.
+        """
+        due = self.wait()
+
+        # Run inference
+        output_data, inference_latency = model.run(input_data)
+        if input_data is None:
+            input_data = model.input_tensor()
+
+        # Latency from the due time: includes waiting behind a late window, not only the model
+        latency = (time.monotonic() - due) * 1000
+        self.latencies.append((latency, inference_latency))
+
+        # Create the message
+        if encoding == "binary":
+            payload = load_to_binary(input_data, output_data, 23, latency, window_size)
+            print(f"📡 {sensor_name} published binary window on {mqtt_topic} -> "
+                  f"Window: {window_size}, Size: {len(payload)} bytes, "
+                  f"Label: {predicted_label(output_data)}, Latency: {latency:.2f} ms (inference {inference_latency:.2f} ms)")
+        else:
+            msg = load_to_json(input_data, output_data, 23, latency, window_size)
+            payload = json.dumps(msg)
+            print(f"📡 {sensor_name} published message on {mqtt_topic} -> "
+                  f"Window: {msg['windowSize']}, Date: {msg['date']}, "
+                  f"Label: {msg['label']}, Latency: {msg['latency']:.2f} ms (inference {inference_latency:.2f} ms)")
+
+        # Hand the message to the network loop (it is sent in the background)
+        info = self.client.publish(mqtt_topic, payload, qos=qos)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self.failed += 1
+            print(f"⚠️ {sensor_name} could not publish the window: {mqtt.error_string(info.rc)}")
+        else:
+            self.published += 1
+            self.last_info = info
+
+    def close(self):
+        """Wait for the last window to be acked, stop the network loop and report the schedule."""
+        if qos > 0 and self.last_info is not None:
+            try:
+                self.last_info.wait_for_publish(timeout=5)
+            except (ValueError, RuntimeError):
+                pass
+        self.client.disconnect()
+        self.client.loop_stop()
+        print(f"📊 {sensor_name} published {self.published} window(s) at {1 / self.period:.2f} windows/s: "
+              f"{self.overruns} overrun(s), {self.skipped} window(s) skipped, {self.failed} failed publish(es).")
+        if self.latencies:
+            latency, inference_latency = np.percentile(np.array(self.latencies), [50, 99], axis=0).T
+            cpu = (time.process_time() - self.start_cpu) / max(time.monotonic() - self.start, 1e-9)
+            print(f"⏱️ Window {window_size}, stride {stride or window_size}: latency p50 {latency[0]:.2f} ms, p99 {latency[1]:.2f} ms "
+                  f"(inference p50 {inference_latency[0]:.2f} ms, p99 {inference_latency[1]:.2f} ms), CPU {cpu:.1%}")
+
 def run_model_on_simulated_data():
     """Run the inference model on sensor data and publish results via MQTT."""
+    check_model()
+    samples, scaled = load_packed(subject) if packed != "off" else (None, False)
+    list_of_sensor_data_file = list_sensor_data(data_path) if samples is None else []
+
+    # Start measuring execution time
+    print("📡 IoT device activated.", 
+          f"\n✅ Device Name: {sensor_name}",
+          f"\n📊 Sampling Data: {subject}" + (f" (packed, {len(samples)} samples)" if samples is not None else ""),
+          f"\n🔗 MQTT Broker: {mqtt_broker}",
+          f"\n📡 Topic: {mqtt_topic} (QoS {qos}, {in_flight} in flight)",
+          f"\n📦 Encoding: {encoding}",
+          f"\n🔄 Inference Window Size: {window_size}" + (f" (streaming, stride {stride})" if stride else ""),
+          f"\n🧠 Interpreter: {threads} thread(s), delegate: {delegate}",
+          f"\n⏳ Sampling Rate: {sampling_rate} Hz",
+          f"\n🕒 Execution Time: {work_time / 60} mins")
+
+    start_work = time.time()
+    publisher = None
     try:
-        # Initialize MQTT client
+        # Initialize MQTT client, with the network loop in the background
         client = mqtt.Client(client_id=sensor_name, protocol=mqtt.MQTTv311)
+        client.max_inflight_messages_set(in_flight)
         client.connect(mqtt_broker)
+        client.loop_start()
+        # Streaming: one window every `stride` samples instead of every `window_size`
+        publisher = FixedRatePublisher(client, (stride or window_size) / sampling_rate)
 
         # Load scaler model
         try:
@@ -85,13 +369,43 @@ def run_model_on_simulated_data():
         except FileNotFoundError:
             raise FileNotFoundError(f"❌ Error: Scaler file '{scaler_file}' not found!")
 
-        # Load TFLite model
-        interpreter = tflite.Interpreter(model_path=model_file)
-        interpreter.allocate_tensors()
+        # Load TFLite model, sized for the window
+        model = Model(window_size)
+
+        if samples is not None:
+            # Packed subject: windows are views on the memory-mapped file. The per-file loop
+            # below skips one sample after every window, so tumbling windows start window_size + 1 apart.
+            windows = window_view(samples, window_size, stride or window_size + 1)
+            if not len(windows):
+                raise ValueError(f"❌ Error: Packed data of '{subject}' is shorter than one window!")
+            while True:
+                for window in windows:
+                    # Watchdog: Check execution time
+                    if time.time() - start_work > work_time:
+                        print(f"🔴 {sensor_name} is done. Runtime was {work_time / 60} minutes.")
+                        return
+                    # Copied into the input tensor; raw packs are scaled on the way
+                    model.set_input(window[0], None if scaled else scaler_model)
+                    publisher.publish_window(model)
 
-        # Get input/output tensors
-        input_details = interpreter.get_input_details()
-        output_details = interpreter.get_output_details()
+        if stride:
+            # Streaming: every sample goes into the ring buffer, which fills the input tensor every `stride` samples
+            ring = SlidingWindow(window_size, stride)
+            while True:
+                for path in list_of_sensor_data_file:
+                    # Watchdog: Check execution time
+                    if time.time() - start_work > work_time:
+                        print(f"🔴 {sensor_name} is done. Runtime was {work_time / 60} minutes.")
+                        return
+
+                    file_path = os.path.join(data_path, path)
+                    if not os.path.exists(file_path):
+                        print(f"⚠️ Warning: Missing data file '{file_path}', skipping.")
+                        continue
+                    data_stream = scaler_model.transform(np.load(file_path, allow_pickle=True))
+                    if ring.push(data_stream):
+                        ring.copy_to(model.input_buffer())
+                        publisher.publish_window(model)
 
         list_of_data = []
 
@@ -105,33 +419,11 @@ def run_model_on_simulated_data():
                 if len(list_of_data) == window_size:
                     # Prepare input data for model
                     input_data = np.array(list_of_data).reshape(1, window_size, 23)
-
-                    # Measure inference latency
-                    start_latency = time.time()
-
-                    # Run inference
-                    interpreter.set_tensor(input_details[0]['index'], input_data.astype('float32'))
-                    interpreter.invoke()
-                    output_data = interpreter.get_tensor(output_details[0]['index'])
-
-                    # Stop latency measurement
-                    inference_latency = (time.time() - start_latency) * 1000  # Convert to ms
-
-                    # Create JSON message
-                    msg = load_to_json(input_data, output_data, 23, inference_latency, window_size)
-                    print(f"📡 {sensor_name} published message on {mqtt_topic} -> "
-                          f"Window: {msg['windowSize']}, Date: {msg['date']}, "
-                          f"Label: {msg['label']}, Latency: {msg['latency']:.2f} ms")
-
-                    # Publish to MQTT
-                    client.publish(mqtt_topic, json.dumps(msg))
+                    publisher.publish_window(model, input_data)
 
                     # Reset data list
                     list_of_data = []
 
-                    # Sleep (based on sampling rate)
-                    time.sleep(window_size / sampling_rate)
-
                 else:
                     # Read and process data
                     file_path = os.path.join(data_path, path)
@@ -144,8 +436,15 @@ def run_model_on_simulated_data():
 
     except Exception as e:
         print(f"❌ Error in execution: {e}")
+    finally:
+        if publisher is not None:
+            publisher.close()
 
 # Run the simulation
 if __name__ == "__main__":
-    run_model_on_simulated_data()
+    if mode == "loadgen":
+        import loadgen
+        loadgen.run()
+    else:
+        run_model_on_simulated_data()
 
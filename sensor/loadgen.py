@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import heapq
+import random
+import signal
+import threading
+import numpy as np
+import joblib
+import paho.mqtt.client as mqtt
+import inference
+from inference import get_env_variable
+
+# Load-generator parameters (list values are assigned to the virtual sensors round-robin)
+n_sensors = get_env_variable("Sensors", "10", int)
+name_prefix = get_env_variable("NamePrefix", "vsensor")
+subjects = get_env_variable("Subjects", inference.subject).split(",")
+window_sizes = [int(value) for value in get_env_variable("WindowSizes", str(inference.window_size)).split(",")]
+sampling_rates = [float(value) for value in get_env_variable("Rates", str(inference.sampling_rate)).split(",")]
+run_inference = get_env_variable("Inference", "false").lower() == "true"  # Run the on-device TFLite model per window
+qos = get_env_variable("QoS", "1", int)  # Ack latency is measured from PUBACK, so it needs QoS 1 or 2
+n_connections = get_env_variable("Connections", str(n_sensors), int)  # MQTT connections the sensors are spread over
+queue_size = get_env_variable("QueueSize", "1000", int)  # Messages a connection may queue before publishes are dropped
+report_interval = get_env_variable("Report", "10", int)  # Seconds between progress reports
+output_file = get_env_variable("Output", "")  # Optional JSON summary
+
+N_FIELDS = 23
+LATENCY_SAMPLES = 100000  # Ack latencies kept for the final percentiles
+
+stop_event = threading.Event()
+
+def load_subject(subject, scaler_model):
+    """
+    Load a subject's samples once and scale them. Uses the file written by pack.py if there is one,
+    else the sensor's per-sample `.npy` files or mHealth `.log` recordings (23 features and the activity label per line).
+    """
+    samples, scaled = inference.load_packed(subject) if inference.packed != "off" else (None, False)
+    if samples is not None:
+        return samples if scaled else scaler_model.transform(samples)
+
+    data_path = os.path.join("data", subject)
+    rows = []
+    for path in inference.list_sensor_data(data_path):
+        file_path = os.path.join(data_path, path)
+        if path.endswith(".log"):
+            with open(file_path) as f:
+                # Skip lines that are cut short in the recordings
+                lines = [line.split() for line in f]
+            rows.append(np.array([values[:N_FIELDS] for values in lines if len(values) == N_FIELDS + 1], dtype=np.float64))
+        else:
+            rows.append(np.load(file_path, allow_pickle=True).reshape(-1, N_FIELDS))
+    if not rows:
+        raise FileNotFoundError(f"❌ Error: No sensor data for subject '{subject}' in '{data_path}'!")
+    return scaler_model.transform(np.concatenate(rows))
+
+class Stats:
+    """Publish counters and ack latencies, shared by the scheduler and the MQTT network threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {"published": 0, "acked": 0, "late": 0, "errors": 0}
+        self.interval = dict(self.totals)
+        self.interval_latencies = []
+        self.latencies = []  # Reservoir sample of all ack latencies
+        self.latency_count = 0
+
+    def add(self, key, count=1):
+        with self.lock:
+            self.totals[key] += count
+            self.interval[key] += count
+
+    def ack(self, latency):
+        with self.lock:
+            self.totals["acked"] += 1
+            self.interval["acked"] += 1
+            self.interval_latencies.append(latency)
+            self.latency_count += 1
+            if len(self.latencies) < LATENCY_SAMPLES:
+                self.latencies.append(latency)
+            else:
+                slot = random.randrange(self.latency_count)
+                if slot < LATENCY_SAMPLES:
+                    self.latencies[slot] = latency
+
+    def take_interval(self):
+        with self.lock:
+            interval, latencies = self.interval, self.interval_latencies
+            self.interval = {key: 0 for key in self.totals}
+            self.interval_latencies = []
+        return interval, latencies
+
+class Connection:
+    """One MQTT client carrying the messages of one or more virtual sensors."""
+
+    def __init__(self, client_id, stats):
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.sent = {}  # mid -> publish time, until the broker acks
+        self.early = {}  # mid -> ack time, for acks that arrive before publish() returns
+        self.connected = threading.Event()
+        self.client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv311)
+        self.client.max_queued_messages_set(queue_size)
+        self.client.on_connect = self.on_connect
+        self.client.on_publish = self.on_publish
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self.connected.set()
+        else:
+            print(f"❌ {client._client_id.decode()} connection failed with code {rc}. Retrying...")
+
+    def on_publish(self, client, userdata, mid):
+        now = time.monotonic()
+        with self.lock:
+            sent = self.sent.pop(mid, None)
+            if sent is None:
+                self.early[mid] = now
+                return
+        self.stats.ack(now - sent)
+
+    def publish(self, topic, payload):
+        sent = time.monotonic()
+        info = self.client.publish(topic, payload, qos=qos)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self.stats.add("errors")
+            return
+        self.stats.add("published")
+        with self.lock:
+            acked = self.early.pop(info.mid, None)
+            if acked is None:
+                self.sent[info.mid] = sent
+                return
+        self.stats.ack(acked - sent)
+
+    def in_flight(self):
+        with self.lock:
+            return len(self.sent)
+
+class VirtualSensor:
+    """A simulated device: publishes one window every window_size / rate seconds."""
+
+    def __init__(self, name, subject, samples, window, rate, connection, offset):
+        self.name = name
+        self.subject = subject
+        self.window = window
+        self.rate = rate
+        self.period = window / rate
+        self.connection = connection
+        self.windows = samples[:len(samples) // window * window].reshape(-1, 1, window, N_FIELDS)
+        self.position = offset % len(self.windows)
+        self.json_data = {}  # Window index -> serialized "data" field, built once per window
+
+    def payload(self, interpreters, due):
+        """Build the next message exactly like the sensor's load_to_json / load_to_binary."""
+        index = self.position
+        self.position = (self.position + 1) % len(self.windows)
+        input_data = self.windows[index]
+
+        output_data = None  # Without on-device inference the windows are sent unlabelled
+        if run_inference:
+            output_data, _ = interpreters[self.window].run(input_data)
+        latency = (time.monotonic() - due) * 1000  # Like the sensor: from the due time, including scheduling delay
+
+        if inference.encoding == "binary":
+            return inference.load_to_binary(input_data, output_data, N_FIELDS, latency, self.window, self.name)
+
+        # Same bytes as json.dumps(load_to_json(...)), without re-serializing the samples every time
+        data = self.json_data.get(index)
+        if data is None:
+            data = self.json_data[index] = json.dumps(inference.window_json(input_data, N_FIELDS, self.window))
+        labels = "".join(f'"{field}": {json.dumps(value)}, ' for field, value in inference.label_fields(output_data).items())
+        return (
+            f'{{"device": {json.dumps(self.name)}, "date": {json.dumps(inference.timestamp())}, '
+            f'"windowSize": {self.window}, "data": {data}, {labels}'
+            f'"latency": {json.dumps(float(latency))}}}'
+        )
+
+def load_interpreters(sizes):
+    """One TFLite model per window size, with the input resized to (1, window, 23)."""
+    inference.check_model()
+    return {size: inference.Model(size) for size in sizes}
+
+def percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q) * 1000) if latencies else float("nan")
+
+def report(stats, connections, elapsed, target_rate):
+    interval, latencies = stats.take_interval()
+    in_flight = sum(connection.in_flight() for connection in connections)
+    print(f"📊 {n_sensors} sensors | target {target_rate:.1f} msg/s | published {interval['published'] / elapsed:.1f} msg/s "
+          f"| acked {interval['acked'] / elapsed:.1f} msg/s | drops {interval['late'] + interval['errors']} "
+          f"(late {interval['late']}, rejected {interval['errors']}) | ack p50 {percentile_ms(latencies, 50):.1f} ms "
+          f"p99 {percentile_ms(latencies, 99):.1f} ms | in flight {in_flight}")
+
+def reporter(stats, connections, target_rate):
+    last = time.monotonic()
+    while not stop_event.wait(report_interval):
+        now = time.monotonic()
+        report(stats, connections, now - last, target_rate)
+        last = now
+
+def schedule(sensors, interpreters, duration):
+    """
+    Publish every sensor's windows on a fixed timetable (due times advance by the period,
+    so they do not drift). A window more than one period late is dropped and counted.
+    """
+    start = time.monotonic()
+    # Stagger the first windows, so the sensors do not all publish at once
+    queue = [(start + sensor.period * index / len(sensors), index) for index, sensor in enumerate(sensors)]
+    heapq.heapify(queue)
+    while queue and not stop_event.is_set():
+        due, index = queue[0]
+        now = time.monotonic()
+        if duration and now - start >= duration:
+            break
+        if due > now:
+            stop_event.wait(due - now)
+            continue
+
+        sensor = sensors[index]
+        heapq.heapreplace(queue, (due + sensor.period, index))
+        if now - due > sensor.period:
+            sensor.position = (sensor.position + 1) % len(sensor.windows)
+            sensor.connection.stats.add("late")
+            continue
+        sensor.connection.publish(inference.mqtt_topic, sensor.payload(interpreters, due))
+
+def run():
+    """Run `Sensors` virtual sensors from this process and report the achieved publish rate, drops and ack latency."""
+    scaler_model = joblib.load(inference.scaler_file)
+    samples = {subject: load_subject(subject, scaler_model) for subject in set(subjects)}
+    interpreters = load_interpreters(set(window_sizes)) if run_inference else {}
+
+    stats = Stats()
+    connections = [
+        Connection(f"{name_prefix}{index + 1:03d}" if n_connections == n_sensors else f"{name_prefix}-conn{index + 1:03d}", stats)
+        for index in range(max(1, min(n_connections, n_sensors)))
+    ]
+    sensors = []
+    for index in range(n_sensors):
+        subject = subjects[index % len(subjects)]
+        sensors.append(VirtualSensor(
+            f"{name_prefix}{index + 1:03d}", subject, samples[subject], window_sizes[index % len(window_sizes)],
+            sampling_rates[index % len(sampling_rates)], connections[index % len(connections)], offset=index * 7,
+        ))
+    target_rate = sum(1 / sensor.period for sensor in sensors)
+
+    print("📡 Load generator activated.",
+          f"\n✅ Virtual Sensors: {n_sensors} over {len(connections)} MQTT connection(s)",
+          f"\n📊 Sampling Data: {', '.join(subjects)}",
+          f"\n🔗 MQTT Broker: {inference.mqtt_broker}",
+          f"\n📡 Topic: {inference.mqtt_topic} (QoS {qos})",
+          f"\n📦 Encoding: {inference.encoding}",
+          f"\n🔄 Inference Window Sizes: {', '.join(map(str, window_sizes))}",
+          f"\n⏳ Sampling Rates: {', '.join(map(str, sampling_rates))} Hz",
+          f"\n🧠 On-device Inference: {'on' if run_inference else 'off'}",
+          f"\n🎯 Target Rate: {target_rate:.1f} msg/s",
+          f"\n🕒 Execution Time: {inference.work_time / 60} mins")
+
+    for connection in connections:
+        connection.client.connect_async(inference.mqtt_broker)
+        connection.client.loop_start()
+    for connection in connections:
+        if not connection.connected.wait(30):
+            print(f"⚠️ Warning: {connection.client._client_id.decode()} is not connected yet. Its messages are queued.")
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    threading.Thread(target=reporter, args=(stats, connections, target_rate), daemon=True).start()
+    start = time.monotonic()
+    try:
+        schedule(sensors, interpreters, inference.work_time)
+    except KeyboardInterrupt:
+        pass
+    stop_event.set()
+    elapsed = time.monotonic() - start
+
+    # Give the acks of the last messages a moment to arrive
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and any(connection.in_flight() for connection in connections):
+        time.sleep(0.1)
+    for connection in connections:
+        connection.client.disconnect()
+        connection.client.loop_stop()
+
+    totals = dict(stats.totals)
+    summary = {
+        "sensors": n_sensors,
+        "connections": len(connections),
+        "qos": qos,
+        "encoding": inference.encoding,
+        "inference": run_inference,
+        "duration_s": elapsed,
+        "target_rate": target_rate,
+        "publish_rate": totals["published"] / elapsed,
+        "ack_rate": totals["acked"] / elapsed,
+        **totals,
+        "unacked": totals["published"] - totals["acked"],
+        "ack_p50_ms": percentile_ms(stats.latencies, 50),
+        "ack_p99_ms": percentile_ms(stats.latencies, 99),
+    }
+    print(f"🔴 Load generator done after {elapsed:.0f} s: published {summary['publish_rate']:.1f} of {target_rate:.1f} msg/s, "
+          f"{totals['late']} late and {totals['errors']} rejected window(s), {summary['unacked']} unacked, "
+          f"ack p50 {summary['ack_p50_ms']:.1f} ms, p99 {summary['ack_p99_ms']:.1f} ms.")
+    if output_file:
+        with open(output_file, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"📄 Summary written to {output_file}")
+    return summary
+
+if __name__ == "__main__":
+    run()
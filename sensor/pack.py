@@ -0,0 +1,54 @@
+"""
+Pack the per-sample files of sensor/data/<subject>/ into one contiguous float32
+array per subject (data/<subject>.npy), which the sensor memory-maps instead of
+loading and scaling one small pickle per sample.
+
+By default the samples are stored already scaled with model/Scaler.joblib.
+With --raw they are stored unscaled (data/<subject>.raw.npy) and the sensor
+scales each window at runtime, so a new scaler does not need a re-pack.
+
+Usage: python pack.py [subject ...] [--raw]
+"""
+import os
+import time
+import argparse
+import joblib
+import numpy as np
+from inference import list_sensor_data, packed_path, scaler_file
+
+N_FIELDS = 23
+
+def pack_subject(subject, scaler_model=None):
+    """Read a subject's sample files in recording order and write them as one (samples, 23) float32 .npy."""
+    data_path = os.path.join("data", subject)
+    rows = [np.load(os.path.join(data_path, path), allow_pickle=True).reshape(-1, N_FIELDS) for path in list_sensor_data(data_path)]
+    if not rows:
+        return None
+    samples = np.concatenate(rows)
+    if scaler_model is not None:
+        # Same float64 scaling as the per-sample path, rounded to float32 once
+        samples = scaler_model.transform(samples)
+
+    path = packed_path(subject, scaled=scaler_model is not None)
+    np.save(path, np.ascontiguousarray(samples, dtype=np.float32))
+    return path, len(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack sensor/data/<subject>/ sample files into one float32 .npy per subject.")
+    parser.add_argument("subjects", nargs="*", help="subjects to pack (default: every folder in data/)")
+    parser.add_argument("--raw", action="store_true", help="store unscaled samples; the sensor scales each window at runtime")
+    args = parser.parse_args()
+
+    subjects = args.subjects or sorted(name for name in os.listdir("data") if os.path.isdir(os.path.join("data", name)))
+    scaler_model = None if args.raw else joblib.load(scaler_file)
+    for subject in subjects:
+        start = time.time()
+        packed = pack_subject(subject, scaler_model)
+        if packed is None:
+            print(f"⚠️ Warning: No sample files for '{subject}', skipping.")
+            continue
+        path, count = packed
+        print(f"📦 Packed {subject}: {count} samples -> {path} ({os.path.getsize(path) / 1e6:.1f} MB, {time.time() - start:.1f} s)")
+
+if __name__ == "__main__":
+    main()